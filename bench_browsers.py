@@ -0,0 +1,48 @@
+"""Measures how long it takes to build browsers with get_new_uf_browser(), as a
+per-user session pool would. The marker scan (finding each plugin's overrides,
+extensions and property extensions) is now worked out once per class, and it's
+compared here against the old way, which ran inspect.getmembers on every
+plugin and browser instance (swapped back in for the comparison)."""
+
+from lib.browser import get_new_uf_browser
+from lib.browser import plugins
+import inspect
+import time
+import sys
+
+def _old_init(self):
+    self._old_instance_functions = dict(
+        inspect.getmembers(self, predicate=inspect.ismethod)
+    )
+
+def _old_get_instance_functions(self):
+    return self._old_instance_functions
+
+def _old_load_list(self, marker):
+    f = self._old_instance_functions
+    r = {}
+    for i in f:
+        if hasattr(f[i], marker) and getattr(f[i], marker):
+            r[i] = f[i]
+    return r
+
+def bench(n):
+    start = time.process_time()
+    pool = [get_new_uf_browser() for i in range(n)]
+    return time.process_time() - start
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    new_time = bench(n)
+    
+    manipulator = plugins._AttributeManipulator
+    manipulator.__init__, manipulator._load_list = _old_init, _old_load_list
+    manipulator._instance_functions = property(_old_get_instance_functions)
+    old_time = bench(n)
+    
+    print("building %d browsers:" % n)
+    print("    per-instance introspection: %6.2f s (%5.0f us each)" %
+          (old_time, old_time / n * 1e6))
+    print("    per-class cache:            %6.2f s (%5.0f us each)" %
+          (new_time, new_time / n * 1e6))
+    print("    improvement factor: %.2f" % (old_time / new_time))
@@ -0,0 +1,55 @@
+"""Measures how long it takes to add cookies to a request, and to find the
+GatorLink session cookie, in a long-lived browser's jar, which builds up
+cookies from many UF hosts. lib.browser.plugins.cookies.IndexedCookieJar only
+looks at the domains the request's host could match, where
+http.cookiejar.CookieJar checks every domain in the jar."""
+
+from lib.browser.plugins.cookies import IndexedCookieJar, find_cookie
+from http.cookiejar import CookieJar, Cookie
+import urllib.request as urlreq
+import time
+import sys
+
+def make_cookie(domain, path, name, value):
+    return Cookie(0, name, value, None, False, domain, True,
+                  domain.startswith("."), path, True, False,
+                  time.time() + 3600, False, None, None, {})
+
+def fill(jar, hosts):
+    for i in range(hosts):
+        host = "host%d.ufl.edu" % i
+        for name in ("JSESSIONID", "tracking", "prefs"):
+            jar.set_cookie(make_cookie(host, "/", name, str(i)))
+    jar.set_cookie(make_cookie(".ufl.edu", "/", "UF_GSM", "x"))
+    jar.set_cookie(make_cookie("login.ufl.edu", "/idp", "JSESSIONID", "y"))
+
+def header(jar, url):
+    request = urlreq.Request(url)
+    jar.add_cookie_header(request)
+    return request.get_header("Cookie")
+
+def bench(function, args, n):
+    start = time.perf_counter()
+    for i in range(n):
+        function(*args)
+    return (time.perf_counter() - start) / n
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    url = "https://www.isis.ufl.edu/cgi-bin/nirvana?MDASTRAN=RSI-FSCHED"
+    session_cookie = ("login.ufl.edu", "/idp", "JSESSIONID")
+    for hosts in (10, 100, 1000):
+        plain, indexed = CookieJar(), IndexedCookieJar()
+        fill(plain, hosts)
+        fill(indexed, hosts)
+        assert header(plain, url) == header(indexed, url)
+        assert find_cookie(plain, *session_cookie).value == \
+               find_cookie(indexed, *session_cookie).value == "y"
+        print("%d hosts (%d cookies):" % (hosts, len(indexed)))
+        for label, function, args in (
+                ("Cookie header", header, (url,)),
+                ("session cookie", find_cookie, session_cookie)):
+            old_time = bench(function, (plain,) + args, n)
+            new_time = bench(function, (indexed,) + args, n)
+            print("    %s: %8.2f us -> %6.2f us (factor %.0f)" %
+                  (label, old_time * 1e6, new_time * 1e6, old_time / new_time))
@@ -0,0 +1,45 @@
+"""Compares how long lib.tasks.isis.table_to_list takes to read a schedule
+table. The old way split the table on its row tags with a regex, joined the
+rows back together, had lxml parse the result, and took each cell's text
+content twice; now iter_table_rows reads the table in one pass, without
+building any elements. ISIS-style markup is used (rows that aren't closed,
+links and entities in cells, colspans), since that's what it has to read."""
+
+from lib.tasks import isis
+import time
+import sys
+
+def schedule_table(rows):
+    header = ("<tr><th>Section</th><th>Type</th><th>Course</th>"
+              "<th>Credits</th><th>Days</th><th>Periods</th>"
+              "<th>Building</th><th>Room</th></tr>\n")
+    section = ("<tr>\n<td>%04d</td><td>X</td><td><a href='/soc/%d'>NOM2222"
+               "</a></td><td>4</td><td>M W F</td><td>2</td><td>KITE</td>"
+               "<td>C101</td>\n<tr>\n<td colspan=\"4\">&nbsp;</td><td>W</td>"
+               "<td>3</td><td>BUG</td><td>007</td>\n")
+    return header + "".join(section % (i, i) for i in range(rows // 2))
+
+def old_way(table):
+    return list(isis._table_to_iter_lxml(table, isis._process_header,
+                                         isis._process_cell))
+
+def new_way(table):
+    return isis.table_to_list(table)
+
+def bench(function, args, repeat=5):
+    start = time.process_time()
+    for i in range(repeat):
+        function(*args)
+    return (time.process_time() - start) / repeat
+
+if __name__ == "__main__":
+    sizes = [int(i) for i in sys.argv[1:]] or [100, 1000, 10000]
+    for rows in sizes:
+        table = schedule_table(rows)
+        assert old_way(table) == new_way(table)
+        old_time = bench(old_way, (table,))
+        new_time = bench(new_way, (table,))
+        print("%d row table (%.1f KB):" % (rows, len(table) / 2 ** 10))
+        print("    split and lxml:     %9.3f ms" % (old_time * 1000))
+        print("    one-pass reader:    %9.3f ms" % (new_time * 1000))
+        print("    improvement factor: %.1f" % (old_time / new_time))
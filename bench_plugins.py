@@ -0,0 +1,54 @@
+"""Measures the per-call overhead that plugin overrides add to a method like
+Browser.load_page, with 5, 20 and 50 plugins loaded. Each plugin's override
+does what a redirection plugin does with a page it isn't interested in: checks
+the url, and passes the call through. The chains Pluggable compiles now (out of
+functools.partial objects) are compared against the nested closures it used to
+wrap each override in."""
+
+from lib.browser.plugins import Pluggable, BaseBrowserPlugin
+from lib.browser.plugins.decorators import override
+import time
+import sys
+
+class _Target(Pluggable):
+    def load_page(self, url, parser=None, data=None, record_history=True):
+        return url
+
+class _PassthroughPlugin(BaseBrowserPlugin):
+    def _is_valid_url(self, url):
+        return False
+    
+    @override
+    def load_page(plugin, browser, base_function, url, *args, **kwargs):
+        if not plugin._is_valid_url(url):
+            return base_function(url, *args, **kwargs)
+
+def _wrap(target, base_function, overriding_function):
+    def new_function(*args, **kwargs):
+        return overriding_function(target, base_function, *args, **kwargs)
+    return new_function
+
+def nested_closures(target, plugins):
+    """How Pluggable.overrides used to apply each override."""
+    function = target.load_page
+    for plugin in plugins:
+        function = _wrap(target, function, plugin.overrides["load_page"])
+    return function
+
+def bench(function, n):
+    start = time.perf_counter()
+    for i in range(n):
+        function("http://www.registrar.ufl.edu/soc/201108/all/", parser=None)
+    return (time.perf_counter() - start) / n
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for count in (5, 20, 50):
+        plugins = [_PassthroughPlugin() for i in range(count)]
+        closures = nested_closures(_Target(), plugins)
+        compiled = _Target(*plugins).load_page
+        closure_time, compiled_time = bench(closures, n), bench(compiled, n)
+        print("%d plugins:" % count)
+        print("    nested closures: %6.2f us per call" % (closure_time * 1e6))
+        print("    compiled chain:  %6.2f us per call" % (compiled_time * 1e6))
+        print("    improvement factor: %.2f" % (closure_time / compiled_time))
@@ -0,0 +1,72 @@
+"""Compares how long the redirection plugins of a UF browser spend deciding
+whether a page needs redirecting. The old way had each plugin decode the page
+and run its own full-page regex on it; now one bounded scan of the raw page
+(lib.browser.plugins.redirect.SignatureDetector) checks every plugin's
+signature at once. Large registrar-style tables are used, since every page
+load goes through these checks."""
+
+from lib.browser import get_new_uf_browser, parsers
+from lib.browser.plugins import redirect
+import email.message
+import time
+import re
+import sys
+
+# the full-page patterns the plugins used to run on every page
+old_patterns = (
+    # LoginBrowserPlugin (matched)
+    (re.compile(r'.*\<title\>.*?GatorLink login.*?\</title\>.*?'
+                r'\<body\>.*?Enter your GatorLink username and '
+                r'password.*?\</body\>', re.IGNORECASE | re.DOTALL), "match"),
+    # LoginContinueRedirect (matched)
+    (re.compile(r'.*?\<body onload="document\.forms\[0].submit\(\)"\>.*?'
+                r'\<noscript\>.*?\<form action="(?P<post_url>.*?'
+                r'Shibboleth\.sso.*?SAML2.*?POST)" method="post"\>',
+                re.IGNORECASE | re.DOTALL), "match"),
+    # BrowserMetaRefreshHander (searched)
+    (re.compile(r"""\<meta( [^>]*)? http-equiv=["']refresh["']( [^>]*)?\>""",
+                re.IGNORECASE | re.DOTALL), "search"),
+)
+
+def registrar_page(rows):
+    row = ("<tr><td>MAC2311</td><td>1234</td><td>4</td><td>Calculus 1</td>"
+           "<td>M W F</td><td>3</td><td>LIT</td><td>101</td></tr>\n")
+    return ("<html><head><title>Schedule of Courses</title></head><body>"
+            "<div id='soc_content'><table>%s</table></div></body></html>" %
+            (row * rows)).encode()
+
+def old_way(source, headers, url):
+    found = []
+    for pattern, method in old_patterns:
+        text = parsers.passthrough_str(source, headers, url) # once per plugin
+        found.append(getattr(pattern, method)(text) is not None)
+    return found
+
+def new_way(source, headers, url, signatures):
+    context = redirect.PageContext(source, headers, url)
+    return [context.has_signature(s) for s in signatures]
+
+def bench(function, args, repeat=5):
+    start = time.process_time()
+    for i in range(repeat):
+        function(*args)
+    return (time.process_time() - start) / repeat
+
+if __name__ == "__main__":
+    get_new_uf_browser() # registers each plugin's signature
+    signatures = [br"<title>[^<]*GatorLink login",
+                  br'<body onload="document\.forms\[0\]\.submit\(\)">',
+                  br"""<meta[^>]+http-equiv=["']?refresh"""]
+    headers = email.message.Message()
+    headers["Content-Type"] = "text/html; charset=utf-8"
+    url = "http://www.registrar.ufl.edu/soc/201108/all/mathemat.htm"
+    sizes = [int(i) for i in sys.argv[1:]] or [1000, 10000, 50000]
+    for rows in sizes:
+        source = registrar_page(rows)
+        assert not any(new_way(source, headers, url, signatures))
+        old_time = bench(old_way, (source, headers, url))
+        new_time = bench(new_way, (source, headers, url, signatures))
+        print("%d row table (%.1f MB):" % (rows, len(source) / 2 ** 20))
+        print("    per-plugin regexes: %9.3f ms" % (old_time * 1000))
+        print("    combined detector:  %9.3f ms" % (new_time * 1000))
+        print("    improvement factor: %.0f" % (old_time / new_time))
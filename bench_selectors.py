@@ -0,0 +1,56 @@
+"""Compares string selectors (``element.cssselect("...")``) against the
+precompiled ones from lib.tasks.selector_registry, using the same per-row
+lookups CourseReader and Department do. Pass it the paths of saved registrar
+pages to run against recorded pages; without any, a large synthetic department
+table is generated."""
+
+from lib.tasks.selector_registry import SelectorRegistry
+import lxml.html
+import time
+import sys
+
+_selectors = SelectorRegistry()
+_selectors.css("rows", "tr")
+_selectors.css("cells", "td")
+_selectors.css("comment_headers", "th.soc_comment")
+
+def synthetic_page(rows=5000):
+    row = ("<tr><td>MAC2311</td><td>1234</td><td>4</td><td>Calculus 1</td>"
+           "<td>M W F</td><td>3</td><td>LIT</td><td>101</td></tr>")
+    return ("<html><body><div id='soc_content'><table>%s</table></div>"
+            "</body></html>" % (row * rows)).encode()
+
+def with_strings(tree):
+    count = 0
+    for row in tree.cssselect("tr"):
+        if row.cssselect("th.soc_comment"):
+            continue
+        count += len(row.cssselect("td"))
+    return count
+
+def with_compiled(tree):
+    count = 0
+    for row in _selectors.rows(tree):
+        if _selectors.comment_headers(row):
+            continue
+        count += len(_selectors.cells(row))
+    return count
+
+def bench(function, tree, repeat):
+    start = time.process_time()
+    for i in range(repeat):
+        result = function(tree)
+    return (time.process_time() - start) / repeat, result
+
+if __name__ == "__main__":
+    pages = [(path, open(path, "rb").read()) for path in sys.argv[1:]] or \
+            [("synthetic (5000 rows)", synthetic_page())]
+    for name, source in pages:
+        tree = lxml.html.document_fromstring(source)
+        string_time, string_count = bench(with_strings, tree, 5)
+        compiled_time, compiled_count = bench(with_compiled, tree, 5)
+        assert string_count == compiled_count
+        print("%s:" % name)
+        print("    string selectors:   %8.2f ms" % (string_time * 1000))
+        print("    compiled selectors: %8.2f ms" % (compiled_time * 1000))
+        print("    improvement factor: %.2f" % (string_time / compiled_time))
@@ -0,0 +1,79 @@
+"""Measures the memory taken by per-user browsers (as used to run ScheduleReader
+for many accounts), when every one is kept alive, against a
+lib.browser.sessions.SessionManager keeping only a few of them in memory and
+the rest on disk, and how long it takes the manager to bring a session back."""
+
+from lib.browser import get_new_uf_browser
+from lib.browser.sessions import SessionManager
+from http.cookiejar import Cookie
+import tracemalloc
+import tempfile
+import shutil
+import time
+import sys
+
+def session_cookies(i):
+    """Roughly what a logged in browser holds: the GatorLink session, and a
+    session for ISIS and the phonebook."""
+    expires = int(time.time()) + 3600
+    return [Cookie(0, name, "%040x" % i, None, False, domain, True,
+                   domain.startswith("."), path, True, True, expires, False,
+                   None, None, {"HttpOnly":None})
+            for domain, path, name in (("login.ufl.edu", "/idp", "JSESSIONID"),
+                                       (".ufl.edu", "/", "UF_GSM"),
+                                       ("www.isis.ufl.edu", "/",
+                                        "_shibsession_isis"),
+                                       ("phonebook.ufl.edu", "/",
+                                        "_shibsession_phonebook"))]
+
+def use(browser, i):
+    for cookie in session_cookies(i):
+        browser.cookie_jar.set_cookie(cookie)
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, memory, elapsed
+
+def all_live(accounts):
+    browsers = {}
+    for i in range(accounts):
+        browser = browsers["user%d" % i] = get_new_uf_browser()
+        browser.uf_set_autologin("user%d" % i, "password")
+        use(browser, i)
+    return browsers
+
+def managed(accounts, directory, max_live):
+    manager = SessionManager(directory, max_live=max_live)
+    for i in range(accounts):
+        manager.add_account("user%d" % i, "password")
+        with manager.session("user%d" % i) as browser:
+            use(browser, i)
+    return manager
+
+if __name__ == "__main__":
+    accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    max_live = 50
+    directory = tempfile.mkdtemp()
+    try:
+        live, live_memory, live_time = measure(lambda: all_live(accounts))
+        del live
+        manager, managed_memory, managed_time = measure(
+            lambda: managed(accounts, directory, max_live)
+        )
+        start = time.perf_counter()
+        for i in range(accounts):
+            manager.get("user%d" % i) # every one of them has to be revived
+        revive_time = (time.perf_counter() - start) / accounts
+        print("%d accounts:" % accounts)
+        print("    every browser live:      %7.1f MB (%.2f s to build)" %
+              (live_memory / 2 ** 20, live_time))
+        print("    %d live, rest on disk:   %7.1f MB (%.2f s to build)" %
+              (max_live, managed_memory / 2 ** 20, managed_time))
+        print("    reviving a session:      %7.2f ms" % (revive_time * 1000))
+    finally:
+        shutil.rmtree(directory)
@@ -1,4 +1,5 @@
 from . import parsers
+from . import transport
 from .plugins.decorators import plugin_attribute
 from .plugins import Pluggable
 
@@ -15,16 +16,30 @@ class Browser(Pluggable):
     inheritance-like system at runtime. It's like a highly structured form of
     monkey-patching."""
     
-    def __init__(self, *plugins, default_parser=parsers.passthrough_str):
+    def __init__(self, *plugins, default_parser=parsers.passthrough_str,
+                 fast_path=False, profile=False):
         """Creates a new :py:class:`Browser` object, loaded with the specified
         set of plugins, and using the specified default parser. Both these
         values can be changed after instantiation (however you cannot remove
-        plugins, only add them)."""
-        Pluggable.__init__(self)
+        plugins, only add them).
+        
+        If ``fast_path`` is ``True``, page loads skip :mod:`urllib`'s opener,
+        and go through a :class:`transport.FastTransport` instead, as long as
+        every handler the plugins have added is one it knows how to imitate
+        (see :meth:`handlers`). Otherwise the opener is used as normal.
+        
+        If ``profile`` is ``True``, the time spent in each plugin is recorded
+        in :attr:`profiler` (see :mod:`lib.browser.plugins.profiling`)."""
+        Pluggable.__init__(self, profile=profile)
         self.default_parser = default_parser
         self.__history = [] # (url, data)
         self.__history_offset = 0
         self.__opener = urlreq.build_opener()
+        self.__cookie_jars = []
+        self.__fast_path_compatible = True
+        self.__transport = transport.FastTransport(self.__opener.addheaders,
+                                                   self.__cookie_jars) \
+                           if fast_path else None
         self.load_plugins(*plugins)
     
     @plugin_attribute
@@ -36,8 +51,17 @@ class Browser(Pluggable):
             self.handlers.append(HTTPCookieProcessor(CookieJar))
         
         within the ``__init__`` function.
+        
+        A browser made with ``fast_path=True`` can only bypass the opener if
+        each handler is either a :class:`urllib.request.HTTPCookieProcessor`,
+        or has a true ``fast_path_compatible`` attribute, meaning it has no
+        effect beyond how the connection is made.
         """
         self.__opener.add_handler(handler)
+        if isinstance(handler, urlreq.HTTPCookieProcessor):
+            self.__cookie_jars.append(handler.cookiejar)
+        elif not getattr(handler, "fast_path_compatible", False):
+            self.__fast_path_compatible = False
     
     @plugin_attribute
     def addheaders(self, header):
@@ -122,7 +146,8 @@ class Browser(Pluggable):
         return self.load_page(url, *args, **kwargs)
     
     
-    def load_page(self, url, parser=None, data=None, record_history=True):
+    def load_page(self, url, parser=None, data=None, record_history=True,
+                  executor=None):
         """Requests, loads, and parses a webpage using the internal
         :mod:`urllib` based opener It is recommended, but not required, that
         beyond the first url argument, you use keyword arguments, as some poorly
@@ -156,6 +181,15 @@ class Browser(Pluggable):
             :class:`cookies.CookieBrowserPlugin` enabled). This is used
             internally for the :meth:`back`, :meth:`forward` and :meth:`refresh`
             functions.
+        ``executor``
+            A :class:`concurrent.futures.Executor`. If one is given, the page is
+            still loaded before we return, but the parser is handed off to the
+            executor, and a :class:`concurrent.futures.Future` of the parsed
+            page is given back instead. That way the next page can be fetched
+            while this one is being parsed. With a
+            :class:`concurrent.futures.ProcessPoolExecutor`, both the parser and
+            whatever it returns have to be picklable (module-level functions
+            are fine, but lxml trees can't come back from another process).
         """
         logger.info("Loading url: '%s'" % (url if url is not None else "None"))
         
@@ -170,7 +204,11 @@ class Browser(Pluggable):
         url = self._simplify_url(url)
         
         try:
-            raw_source = self.__opener.open(url, data)
+            if self.__transport is not None and \
+               self.__fast_path_compatible and self.__transport.can_open(url):
+                raw_source = self.__transport.open(url, data)
+            else:
+                raw_source = self.__opener.open(url, data)
         except Exception as err:
             raw_source = err
         source = raw_source.read()
@@ -189,6 +227,9 @@ class Browser(Pluggable):
             logger.debug("Page source (fast UTF-8 decode): %s" %
                          source.decode("UTF-8", errors="ignore"))
         
+        if executor is not None:
+            return self._parse_page_later(executor, parser, source,
+                                          raw_source.info(), url)
         return self._parse_page(parser, source, raw_source.info(), url)
     
     def expand_relative_url(self, url, relative_to=None):
@@ -232,6 +273,17 @@ class Browser(Pluggable):
         """Reloads the current web page, and returns it."""
         self._load_relative(0, *args, **kwargs)
     
+    def close(self):
+        """Closes any connections being kept open for later page loads (by the
+        keepalive plugin, or the fast path). The browser can still be used
+        afterwards; it just has to connect again."""
+        for handler in self.__opener.handlers:
+            close_all = getattr(handler, "close_all", None)
+            if close_all is not None:
+                close_all()
+        if self.__transport is not None:
+            self.__transport.close_all()
+    
     # utility function
     def _parse_page(self, parser, *args, **kwargs):
         """Takes a page and parses it with a given parser, or with the default
@@ -255,6 +307,14 @@ class Browser(Pluggable):
             return self.default_parser(source, headers, url)
         return parser(source, headers, url)
     
+    def _parse_page_later(self, executor, parser, source, headers, url):
+        """Like :meth:`_parse_page`, but runs the parser on a
+        :class:`concurrent.futures.Executor`, and gives back a
+        :class:`concurrent.futures.Future` of the result."""
+        if parser is None:
+            parser = self.default_parser
+        return executor.submit(parser, source, headers, url)
+    
     def __parse_page_resp(self, parser, response):
         return self.__parse_page_base(parser, response.read(), response.headers,
                                       response.geturl())
@@ -272,8 +332,10 @@ class Browser(Pluggable):
         #return urlpar.urlunparse(split_url) # stitch it all back together
         return url
 
-def get_new_uf_browser():
-    """Returns a new Browser object with the set of recommended plugins."""
+def get_new_uf_browser(cookie_jar=None):
+    """Returns a new Browser object with the set of recommended plugins. Pass a
+    ``cookie_jar`` (like a :class:`lib.browser.plugins.cookies.SQLiteCookieJar`)
+    to have the browser share its cookies, and so its GatorLink session."""
     from . import parsers
     from .plugins import cookies
     from .plugins import useragent
@@ -281,10 +343,12 @@ def get_new_uf_browser():
     from .plugins import keepalive
     from .plugins.uf import isis
     from .plugins.uf import login
-    return Browser(cookies.CookieBrowserPlugin(), useragent.UserAgentSpoofer(
+    return Browser(cookies.CookieBrowserPlugin(cookie_jar),
+                   useragent.UserAgentSpoofer(
                    useragent.firefox["iceweasel-linux-5.0"]),
                    redirect.BrowserMetaRefreshHander(),
                    keepalive.KeepAlivePlugin(),
                    isis.IsisBrowserTools(), login.LoginBrowserPlugin(),
                    login.LoginContinueRedirect(),
+                   redirect.RedirectChainCache(),
                    default_parser=parsers.lxml_html)
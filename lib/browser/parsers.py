@@ -12,7 +12,12 @@ functions. A parser function must take three arguments:
 """
 
 import logging
+import codecs
 import re
+try: # py3k
+    import urllib.parse as urlpar
+except ImportError: # py2
+    import urlparse as urlpar
 
 logger = logging.getLogger("browser.parser")
 
@@ -43,35 +48,57 @@ def _get_header_charset(headers):
         except AttributeError: # happens with file:// protocol
             return None
 
-_meta_content_type_re = re.compile(
-    r"""\<meta( [^>]*)? http-equiv=["']content-type["']( [^>]*)?\>""",
-    re.IGNORECASE | re.DOTALL
+# Only the start of the page is searched for an encoding declaration. HTML5
+# asks for it within the first 1024 bytes, but UF's pages can carry a lot of
+# junk in their <head>, so we're a bit more lenient.
+_sniff_length = 4096
+
+# ordered so that the UTF-32 BOMs are checked before the UTF-16 BOMs they start
+# with
+_boms = ((codecs.BOM_UTF8, "utf-8-sig"),
+         (codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"),
+         (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+# matches both <meta charset="..."> and the charset parameter in
+# <meta http-equiv="content-type" content="text/html; charset=...">
+_meta_charset_re = re.compile(
+    br"""<meta\s[^>]*?charset\s*=\s*["']?\s*([a-z0-9_:.\-]+)""",
+    re.IGNORECASE
 )
 
-_meta_inner_content_re = re.compile(r"""(?<=content=["']).+?(?=["'])""",
-                                    re.IGNORECASE | re.DOTALL)
+# host -> the last charset we found declared in a page from that host, for
+# pages that forget to declare one
+_host_charsets = {}
+_max_host_charsets = 256
 
-_meta_charset_re = re.compile(r"(?<=charset=)[a-z0-9-_]+",
-                              re.IGNORECASE | re.DOTALL)
+def _bom_charset(byte_source):
+    """Gives the charset a page's byte order mark implies, or ``None`` if it
+    doesn't start with one."""
+    for bom, charset in _boms:
+        if byte_source.startswith(bom):
+            return charset
+    return None
 
-def _find_charset(str_source):
-    # attempt to pull it from the html source
-    start_search_at = 0
-    while True:
-        tag = _meta_content_type_re.search(str_source, start_search_at)
-        if not tag:
-            break
-        start_search_at = tag.endpos
-        
-        tag = _meta_inner_content_re.search(tag.group(0))
-        if not tag: continue
-        
-        tag = _meta_charset_re.search(tag.group(0))
-        if not tag: continue
-        
-        return tag.group(0)
+def _meta_charset(byte_source):
+    """Looks for a ``<meta>`` charset declaration within the first few KB of a
+    page, without decoding it. Gives ``None`` if there isn't one."""
+    tag = _meta_charset_re.search(byte_source, 0, _sniff_length)
+    if tag:
+        return tag.group(1).decode("ascii")
     return None
 
+def _remember_host_charset(url, charset):
+    host = urlpar.urlsplit(url).netloc if url else None
+    if not host:
+        return
+    if len(_host_charsets) >= _max_host_charsets and \
+       host not in _host_charsets:
+        _host_charsets.clear() # crude, but keeps us from growing forever
+    _host_charsets[host] = charset
+
+def _get_host_charset(url):
+    return _host_charsets.get(urlpar.urlsplit(url).netloc) if url else None
+
 def _decode_with_charset(byte_source, charset):
     """Attempts to decode a byte string with a charset, falling back to UTF-8 if
     the codec can't be found, and ignoring bad characters if certain characters
@@ -83,7 +110,7 @@ def _decode_with_charset(byte_source, charset):
         return byte_source.decode(charset, errors="ignore")
     except LookupError: # we don't have the right codec! Fall back!
         logger.warning("Codec matching name '%s' could not be found. "
-                       "Falling back to UTF-8.")
+                       "Falling back to UTF-8." % charset)
         try:
             return byte_source.decode("UTF-8", errors="ignore")
         except LookupError:
@@ -96,30 +123,39 @@ def passthrough_str(byte_source, headers, url):
     a sequence of bytes.
     
     Encoding is automatically determined via http headers or (if that fails)
-    from the html source if it has a meta http-equiv tag to handle it (assuming
-    that tag can be decoded via a best-attempt UTF-8 decoding). If encoding
-    cannot be determined, we just try to decode it in UTF-8, ignoring unknown
-    characters.
+    from the start of the page source, via a byte order mark, or a ``<meta>``
+    tag declaring a charset. The source is searched as raw bytes, so the page
+    only ever gets decoded once. If the page doesn't declare an encoding, we
+    use the last one declared by a page from the same host, and failing that,
+    we just try to decode it in UTF-8, ignoring unknown characters.
     
     Unfortunately, this function does not yet have a system like
     :py:class:`BeautifulSoup.UnicodeDammit`, or :py:mod:`chardet`, which can
     actually build a statistical model of the page's possible encoding."""
     charset = _get_header_charset(headers)
     
-    str_source = None
     if charset is not None: # if in headers
         logger.debug("Found page encoding in http headers: %s" % charset)
-        str_source = _decode_with_charset(byte_source, charset)
     else: # find it in the html page
-        str_source = _decode_with_charset(byte_source, None)
-        charset = _find_charset(str_source)
+        charset = _bom_charset(byte_source)
         if charset is not None:
-            logger.debug("Found page encoding in page: %s" % charset)
-            str_source = _decode_with_charset(byte_source, charset)
+            # only says how this one page was saved, so it isn't remembered
+            logger.debug("Found page encoding in byte order mark: %s" %
+                         charset)
         else:
-            logger.warning("Page encoding could not be determined for %s. "
-                           "Falling back to UTF-8." % url)
-    return str_source
+            charset = _meta_charset(byte_source)
+            if charset is not None:
+                logger.debug("Found page encoding in page: %s" % charset)
+                _remember_host_charset(url, charset)
+        if charset is None:
+            charset = _get_host_charset(url)
+            if charset is not None:
+                logger.debug("Using the last page encoding seen from this "
+                             "host: %s" % charset)
+            else:
+                logger.warning("Page encoding could not be determined for %s. "
+                               "Falling back to UTF-8." % url)
+    return _decode_with_charset(byte_source, charset)
 
 
 def passthrough_str_with_encoding(encoding):
@@ -151,6 +187,101 @@ def lxml_html(source, headers, url):
     return lxml.html.document_fromstring(source, base_url=url)#,
                                          #encoding=_get_header_charset(headers))
 
+def lxml_html_subtree(element_id=None, tag=None, class_name=None,
+                      chunk_size=65536):
+    """Creates and returns a parser like :func:`lxml_html`, but which only
+    builds the part of the page under the first element matching all of the
+    given criteria: an ``element_id``, a ``tag`` name, and/or a ``class_name``
+    (one of the element's classes). The page is fed to an lxml parser with a
+    `target <http://lxml.de/parsing.html#the-target-parser-interface>`_, so
+    everything outside of that element is thrown away as it's seen rather than
+    being built into a tree, and parsing stops (with ``chunk_size`` bytes of
+    granularity) as soon as the element is closed. The parser returns the
+    matching :class:`lxml.html.HtmlElement` as the root of it's own tree. If
+    nothing matched (say, the page's layout changed, or an error page came
+    back instead), it raises a :class:`ValueError` saying what was missing.
+    For example::
+        
+        parser = lxml_html_subtree("soc_content")
+        tables = browser.load_page(url, parser=parser).cssselect("table")
+    
+    ..
+    """
+    if element_id is None and tag is None and class_name is None:
+        raise ValueError("at least one of element_id, tag or class_name must "
+                         "be given")
+    
+    def matches(element_tag, attrib):
+        if tag is not None and element_tag != tag:
+            return False
+        if element_id is not None and attrib.get("id") != element_id:
+            return False
+        if class_name is not None and \
+           class_name not in attrib.get("class", "").split():
+            return False
+        return True
+    criteria = " and ".join("%s %r" % criterion for criterion in
+                            (("id", element_id), ("tag", tag),
+                             ("class", class_name))
+                            if criterion[1] is not None)
+    
+    def f(source, headers, url):
+        import lxml.etree
+        import lxml.html
+        target = _SubtreeTarget(matches, lxml.html.html_parser.makeelement)
+        parser = lxml.etree.HTMLParser(target=target)
+        for start in range(0, len(source), chunk_size):
+            parser.feed(source[start:start + chunk_size])
+            if target.result is not None:
+                return target.result # no need to read the rest of the page
+        result = parser.close()
+        if result is None:
+            raise ValueError("no element with %s in %s" % (criteria, url))
+        return result
+    return f
+
+class _SubtreeTarget(object):
+    """An lxml parser target that builds the subtree of the first element for
+    which ``matches(tag, attrib)`` is true, and ignores everything else."""
+    
+    def __init__(self, matches, element_factory):
+        self._matches = matches
+        self._element_factory = element_factory
+        self._builder = None
+        self._depth = 0
+        self.result = None
+    
+    def start(self, tag, attrib):
+        if self.result is not None:
+            return
+        if self._builder is None:
+            if not self._matches(tag, attrib):
+                return
+            import lxml.etree
+            self._builder = lxml.etree.TreeBuilder(
+                element_factory=self._element_factory
+            )
+        self._depth += 1
+        self._builder.start(tag, attrib)
+    
+    def end(self, tag):
+        if self._builder is None or self.result is not None:
+            return
+        self._builder.end(tag)
+        self._depth -= 1
+        if not self._depth:
+            self.result = self._builder.close()
+    
+    def data(self, data):
+        if self._builder is not None and self.result is None:
+            self._builder.data(data)
+    
+    def comment(self, text):
+        pass
+    
+    def close(self):
+        return self.result
+
 def lxml_xml(source, headers, url):
     """Returns an :py:func:`lxml.etree.ElementTree` generated with
     `lxml's etree module <http://lxml.de/tutorial.html>`_."""
@@ -3,18 +3,28 @@ is probably good to have a basic understanding of how the
 :class:`lib.browser.Browser`'s plugin system works."""
 
 from .decorators import *
+from .profiling import PluginProfiler
+import urllib.parse as urlpar
+import collections
+import functools
+import threading
 import inspect
+import re
+
+# (class, marker) -> names of the class' methods carrying that marker
+_marked_names = {}
+
+# how many hosts each dispatcher keeps a chain of overrides built for
+_max_dispatch_hosts = 64
 
 class _AttributeManipulator(object):
     def __init__(self):
-        self.__instance_functions = dict(
-            inspect.getmembers(self, predicate=inspect.ismethod)
-        )
+        pass
     
     def _get_instance_functions(self):
-        """Returns the object's list of methods, useful for the
+        """Returns a dictionary of the object's methods, useful for the
         :meth:`_load_list` method."""
-        return self.__instance_functions
+        return self._load_list(None)
     
     _instance_functions = property(_get_instance_functions)
     
@@ -25,21 +35,48 @@ class _AttributeManipulator(object):
         
         ``marker``
             A string representing the marker to look for on each function. If
-            the value of this marker is `True`, the value is returned.
+            the value of this marker is `True`, the value is returned. If
+            ``None``, every method is returned.
         
+        Which methods have a marker is worked out once for each class, from
+        the functions in the class' ``__dict__`` (and those of its bases), and
+        cached, so only the bound methods have to be looked up for each new
+        instance. (Every browser and plugin calls this a few times as it's
+        made, so it adds up when making lots of browsers.)
         """
-        f = self._instance_functions
-        r = {}
-        for i in f:
-            if hasattr(f[i], marker) and getattr(f[i], marker):
-                r[i] = f[i]
-        return r
+        cls = type(self)
+        try:
+            names = _marked_names[cls, marker]
+        except KeyError:
+            names = _marked_names[cls, marker] = _find_marked_names(cls, marker)
+        return dict((name, getattr(self, name)) for name in names)
+
+def _find_marked_names(cls, marker):
+    """Gives a tuple of the names of the functions defined on ``cls`` (or
+    inherited by it) that have a true ``marker`` attribute (or all of them, if
+    ``marker`` is ``None``)."""
+    attributes = {}
+    for klass in reversed(cls.__mro__): # subclasses' attributes win
+        attributes.update(vars(klass))
+    return tuple(name for name, value in attributes.items()
+                 if inspect.isfunction(value) and
+                    (marker is None or getattr(value, marker, False)))
 
 class BaseBrowserPlugin(_AttributeManipulator):
     """A :class:`lib.browser.Browser` plugin is defined as a set of patches to
     be applied to a Browser object. This class defines a base for browser
     plugins."""
     
+    hosts = None
+    """If ``None``, the plugin's overrides apply to every url. Otherwise, a
+    sequence of the places its overrides apply to, each of which is either a
+    host name (``"login.ufl.edu"``), a domain starting with a dot, which also
+    matches its subdomains (``".ufl.edu"``), or a url prefix
+    (``"https://login.ufl.edu/idp/"``). A call to an overridden method whose
+    first argument is a url from anywhere else skips straight past the
+    plugin's override (see :meth:`Pluggable._compile_overrides`). It should be
+    set before the plugin is loaded."""
+    
     def __init__(self):
         """Sets up everything the plugin needs. Subclasses should be sure to
         call this."""
@@ -54,13 +91,21 @@ class Pluggable(_AttributeManipulator):
     """Takes in plugins, allowing one to configure an object on the fly, with a
     strutured monkey-patching like system"""
     
-    def __init__(self, *plugins):
+    def __init__(self, *plugins, profile=False):
         """Sets up everything the object needs, and adds plugins specified by
         the positional arguments (they can be added later too). Subclasses
-        should be sure to call this."""
+        should be sure to call this.
+        
+        If ``profile`` is ``True``, every override, extension and property
+        extension that plugins add is timed and counted, and the results can
+        be gotten from :attr:`profiler`. This adds a little to each call, so
+        it's off by default."""
         object.__setattr__(self, "_Pluggable__attr_extensions", {})
         _AttributeManipulator.__init__(self)
         self._plugins = []
+        self.__overrides = {} # name -> (base function, [overriding functions])
+        self.__uncompiled = set() # names with overrides not yet in effect
+        self.profiler = PluginProfiler() if profile else None
         self.__plugin_attributes = {}
         for i in self._load_list("is_plugin_attribute").values():
             self._register_plugin_attribute(i.plugin_attribute_name, i)
@@ -99,6 +144,7 @@ class Pluggable(_AttributeManipulator):
         self._plugins += plugins
         for i in plugins:
             self._load_plugin(i)
+        self._compile_overrides()
     
     def _load_plugin(self, plugin):
         """A utility method called by :meth:`load_plugins`, which should load
@@ -130,12 +176,107 @@ class Pluggable(_AttributeManipulator):
         ``overriding_function`` is the function that we should set to that name.
         It should take at least 2 arguments (in addition to ``self``, which
         would refer to the plugin instance), the browser instance and the
-        function object that is being overridden."""
-        base_function = getattr(self, name)
+        function object that is being overridden.
+        
+        Overrides only take effect once :meth:`_compile_overrides` is called,
+        which :meth:`load_plugins` does after loading every plugin it's
+        given."""
+        self.__overrides.setdefault(name, (getattr(self, name), []))[1] \
+            .append(overriding_function)
+        self.__uncompiled.add(name)
+    
+    def _compile_overrides(self):
+        """Puts every override registered since the last call into effect.
+        Rather than wrapping a method in one more closure for each override as
+        it's loaded, each overridden method's call chain is built once, out of
+        :func:`functools.partial` objects, so that a call goes straight from
+        one plugin's overriding function into the next, without any Python
+        level wrappers in between.
+        
+        If any plugin overriding a method has a
+        :attr:`BaseBrowserPlugin.hosts` restriction, the method is replaced
+        with a dispatcher, which looks at the host of the url it's called with
+        (as its first argument), and calls a chain of only the overrides that
+        apply to that host. A chain is built the first time each host is seen,
+        and the chains for the :data:`_max_dispatch_hosts` most recently used
+        hosts are kept. Calls without an absolute url go through every
+        override."""
+        for name in self.__uncompiled:
+            base_function, overriding_functions = self.__overrides[name]
+            if all(_plugin_hosts(f) is None for f in overriding_functions):
+                setattr(self, name, self.__build_chain(
+                    base_function, overriding_functions, None
+                ))
+            else:
+                setattr(self, name, self.__build_dispatcher(
+                    base_function, list(overriding_functions)
+                ))
+        self.__uncompiled.clear()
+    
+    def __build_dispatcher(self, base_function, overriding_functions):
+        # host -> chain of overrides, least recently used first
+        chains = collections.OrderedDict()
+        lock = threading.Lock()
+        def dispatcher(*args, **kwargs):
+            host = _url_host(args[0] if args else kwargs.get("url"))
+            with lock:
+                chain = chains.get(host)
+                if chain is not None:
+                    chains.move_to_end(host)
+            if chain is None:
+                chain = self.__build_chain(base_function,
+                                           overriding_functions, host)
+                with lock:
+                    chains[host] = chain
+                    if len(chains) > _max_dispatch_hosts:
+                        chains.popitem(last=False)
+            return chain(*args, **kwargs)
+        dispatcher.__doc__ = overriding_functions[-1].__doc__
+        return dispatcher
+    
+    def __build_chain(self, base_function, overriding_functions, host):
+        function = base_function
+        if self.profiler is not None:
+            function = self.profiler.wrap(self, function)
+        for overriding_function in overriding_functions:
+            hosts = _plugin_hosts(overriding_function)
+            if hosts is None or host is None:
+                function = self.__wrap_override(function, overriding_function)
+                continue
+            applies, prefixes = _match_hosts(hosts, host)
+            if applies:
+                function = self.__wrap_override(function, overriding_function)
+            elif prefixes:
+                function = self.__wrap_prefixed_override(
+                    function, overriding_function, prefixes
+                )
+        return function
+    
+    def __wrap_override(self, base_function, overriding_function):
+        # unwrapping the bound method saves a little more on each call
+        new_function = functools.partial(
+            overriding_function.__func__, overriding_function.__self__, self,
+            base_function
+        ) if hasattr(overriding_function, "__func__") else \
+            functools.partial(overriding_function, self, base_function)
+        new_function.__doc__ = overriding_function.__doc__
+        if self.profiler is not None:
+            new_function = self.profiler.wrap(
+                _plugin_of(overriding_function), new_function
+            )
+        return new_function
+    
+    def __wrap_prefixed_override(self, base_function, overriding_function,
+                                 prefixes):
+        wrapped_function = self.__wrap_override(base_function,
+                                                overriding_function)
         def new_function(*args, **kwargs):
-            return overriding_function(self, base_function, *args, **kwargs)
+            url = args[0] if args else kwargs.get("url")
+            if _lower_url_host(url).startswith(prefixes):
+                return wrapped_function(*args, **kwargs)
+            return base_function(*args, **kwargs)
         new_function.__doc__ = overriding_function.__doc__
-        setattr(self, name, new_function)
+        return new_function
     
     @plugin_attribute
     def extensions(self, name, extending_function):
@@ -152,6 +293,9 @@ class Pluggable(_AttributeManipulator):
         def new_function(*args, **kwargs):
             return extending_function(self, *args, **kwargs)
         new_function.__doc__ = extending_function.__doc__
+        if self.profiler is not None:
+            new_function = self.profiler.wrap(_plugin_of(extending_function),
+                                              new_function)
         setattr(self, name, new_function)
     
     @plugin_attribute
@@ -164,4 +308,60 @@ class Pluggable(_AttributeManipulator):
             raise ValueError(("We already have a property defined as %s either "
                               "by this class, or by an already loaded plugin.")
                               % name)
-        self.__attr_extensions[name] = value(self)
+        prop = value(self)
+        if self.profiler is not None:
+            prop = self.profiler.wrap_property(_plugin_of(value), prop)
+        self.__attr_extensions[name] = prop
+
+def _plugin_of(function):
+    """Gives the plugin a (bound) function came from."""
+    return getattr(function, "__self__", function)
+
+def _plugin_hosts(overriding_function):
+    """Gives the :attr:`BaseBrowserPlugin.hosts` of the plugin an override
+    belongs to."""
+    return getattr(getattr(overriding_function, "__self__", None), "hosts",
+                   None)
+
+# scheme://[userinfo@]host, where the host can be an [IPv6] address
+_url_host_re = re.compile(r"[a-zA-Z][a-zA-Z0-9+.\-]*://(?:[^@/?#]*@)?"
+                          r"(\[[^\]/?#]*\]|[^:/?#]*)")
+
+def _url_host(url):
+    """Gives the lowercased host name of an absolute url, or ``None`` if it
+    isn't one. It's called on every dispatched call, so it's a single regex
+    match, rather than a trip through :func:`urllib.parse.urlsplit`."""
+    if not isinstance(url, str):
+        return None
+    m = _url_host_re.match(url)
+    if m is None:
+        return None
+    return m.group(1).strip("[]").lower()
+
+def _lower_url_host(url):
+    """Lowercases the scheme and host name of an absolute url (which are
+    case-insensitive), and drops any ``userinfo@``, leaving the rest of it
+    alone, so it can be compared with a url prefix from
+    :attr:`BaseBrowserPlugin.hosts`."""
+    m = _url_host_re.match(url)
+    if m is None:
+        return url
+    return url[:url.index(":")].lower() + "://" + m.group(1).lower() + \
+           url[m.end(1):]
+
+def _match_hosts(hosts, host):
+    """Gives a tuple of whether any of ``hosts`` covers all of ``host``, and a
+    tuple of url prefixes from ``hosts`` that cover part of it."""
+    prefixes = []
+    for entry in hosts:
+        if "://" in entry:
+            if urlpar.urlsplit(entry).hostname == host:
+                prefixes.append(_lower_url_host(entry))
+            continue
+        entry = entry.lower()
+        if entry.startswith("."):
+            if host.endswith(entry) or host == entry[1:]:
+                return True, ()
+        elif host == entry:
+            return True, ()
+    return False, tuple(prefixes)
@@ -2,15 +2,22 @@ from . import BaseBrowserPlugin
 from .decorators import *
 
 from urllib.request import HTTPCookieProcessor
-from http.cookiejar import CookieJar
+from http.cookiejar import CookieJar, Cookie, DefaultCookiePolicy, \
+                           eff_request_host
+import sqlite3
+import json
+import time
+import os
 
 class CookieBrowserPlugin(BaseBrowserPlugin):
     """Adds a handler to a :class:`lib.browser.Browser` for cookies. Recieving
     and sending cookies then happens in a automatic fashion."""
-    def __init__(self):
-        """Creates a new plugin with an empty jar."""
+    def __init__(self, jar=None):
+        """Creates a new plugin with an empty :class:`IndexedCookieJar`, or
+        with the given ``jar`` (such as a :class:`SQLiteCookieJar`, to share
+        cookies between processes)."""
         BaseBrowserPlugin.__init__(self)
-        self._jar = CookieJar()
+        self._jar = IndexedCookieJar() if jar is None else jar
         self.handlers.append(HTTPCookieProcessor(self._jar))
     
     @property_extension
@@ -20,3 +27,313 @@ class CookieBrowserPlugin(BaseBrowserPlugin):
         def getter():
             return plugin._jar
         return property(getter)
+
+def _domain_keys(host):
+    """Gives every domain a cookie could be stored under and still be sent to
+    ``host``: the host itself, and each of its parent domains, with and
+    without a leading dot. The most specific come first."""
+    host = host.lstrip(".")
+    keys = []
+    while host:
+        keys.append(host)
+        keys.append("." + host)
+        host = host.partition(".")[2]
+    return keys
+
+def find_cookie(jar, host, path, name):
+    """Gives the unexpired cookie named ``name``, with the path ``path``, that
+    ``jar`` would send to ``host``, preferring the most specific domain. If
+    there isn't one, gives ``None``. An :class:`IndexedCookieJar` answers this
+    with a few lookups; any other :class:`http.cookiejar.CookieJar` has each
+    of its cookies checked."""
+    if isinstance(jar, IndexedCookieJar):
+        return jar.find_cookie(host, path, name)
+    keys = _domain_keys(host)
+    found = None
+    for cookie in jar:
+        if cookie.path == path and cookie.name == name and \
+           cookie.domain in keys and not cookie.is_expired() and \
+           (found is None or
+            keys.index(cookie.domain) < keys.index(found.domain)):
+            found = cookie
+    return found
+
+class IndexedCookieJar(CookieJar):
+    """A :class:`http.cookiejar.CookieJar` that doesn't get slower to use as
+    it fills up with cookies from other hosts.
+    
+    A jar already files its cookies by domain, then path, then name, but
+    :class:`http.cookiejar.CookieJar` still asks its policy about every
+    domain it has whenever it adds cookies to a request. This one only looks
+    at the domains a request's host could match (itself and its parent
+    domains, so a handful of lookups), and gives the same cookies as long as
+    the policy matches domains the way
+    :class:`http.cookiejar.DefaultCookiePolicy` does. With any other policy,
+    every domain is checked, as normal.
+    
+    The jar also remembers when its next cookie expires, so the sweep for
+    expired cookies that follows each request is skipped until then, instead
+    of going through the whole jar every time."""
+    
+    def __init__(self, policy=None):
+        CookieJar.__init__(self, policy)
+        self._next_expiry = float("inf")
+    
+    def _cookies_for_request(self, request):
+        if type(self._policy).domain_return_ok is not \
+           DefaultCookiePolicy.domain_return_ok:
+            return CookieJar._cookies_for_request(self, request)
+        req_host, erhn = eff_request_host(request)
+        keys = _domain_keys(req_host)
+        if erhn != req_host:
+            keys.extend(_domain_keys(erhn))
+        keys.append("") # a cookie without a domain goes everywhere
+        cookies = []
+        for domain in dict.fromkeys(keys): # without duplicates, in order
+            if domain in self._cookies:
+                cookies.extend(self._cookies_for_domain(domain, request))
+        return cookies
+    
+    def find_cookie(self, host, path, name):
+        """See :func:`find_cookie`."""
+        with self._cookies_lock:
+            for domain in _domain_keys(host):
+                try:
+                    cookie = self._cookies[domain][path][name]
+                except KeyError:
+                    continue
+                if not cookie.is_expired():
+                    return cookie
+            return None
+    
+    def __iter__(self):
+        # a copy, so other threads can change the jar while it's gone through
+        with self._cookies_lock:
+            return iter(list(CookieJar.__iter__(self)))
+    
+    def set_cookie(self, cookie):
+        with self._cookies_lock:
+            CookieJar.set_cookie(self, cookie)
+            if cookie.expires is not None and \
+               cookie.expires < self._next_expiry:
+                self._next_expiry = cookie.expires
+    
+    def clear_expired_cookies(self):
+        with self._cookies_lock:
+            if time.time() < self._next_expiry:
+                return # nothing has expired yet
+            CookieJar.clear_expired_cookies(self)
+            self._next_expiry = min((cookie.expires for cookie in
+                                     CookieJar.__iter__(self)
+                                     if cookie.expires is not None),
+                                    default=float("inf"))
+
+# the Cookie constructor's arguments, in order, which are also the columns of
+# the cookies table (with _rest standing in for rest)
+_cookie_fields = ("version", "name", "value", "port", "port_specified",
+                  "domain", "domain_specified", "domain_initial_dot", "path",
+                  "path_specified", "secure", "expires", "discard", "comment",
+                  "comment_url", "_rest", "rfc2109")
+
+def _cookie_to_row(cookie):
+    """Gives a tuple of ``cookie``'s fields (see ``_cookie_fields``), all of
+    them strings, numbers or ``None``."""
+    return tuple(json.dumps(cookie._rest) if field == "_rest" else
+                 getattr(cookie, field) for field in _cookie_fields)
+
+def _row_to_cookie(row):
+    """Turns what :func:`_cookie_to_row` gives back into a
+    :class:`http.cookiejar.Cookie`."""
+    values = dict(zip(_cookie_fields, row))
+    values["rest"] = json.loads(values.pop("_rest"))
+    for flag in ("port_specified", "domain_specified", "domain_initial_dot",
+                 "path_specified", "secure", "discard", "rfc2109"):
+        values[flag] = bool(values[flag])
+    return Cookie(**values)
+
+class SQLiteCookieJar(IndexedCookieJar):
+    """An :class:`IndexedCookieJar` kept in an SQLite database, so that
+    any number of browsers, in any number of processes, can share one set of
+    cookies. Log in to GatorLink in one worker process, and the rest can use
+    that session, rather than each going through their own Shibboleth login.
+    
+    Every change to the jar is written straight through to the database, in a
+    transaction (so all the cookies from one response are saved at once), and
+    SQLite's own file locking keeps writers from different processes out of
+    each other's way. Nothing is read when the jar is made. The cookies are
+    loaded the first time they're needed, and reloaded whenever another
+    connection has changed the database since, which is cheap to check for
+    (it's one ``PRAGMA data_version`` query).
+    
+    Unlike :class:`http.cookiejar.FileCookieJar`, session cookies (ones that
+    would be discarded when a browser is closed) are stored too, since UF's
+    login sessions are made out of them. Call :meth:`clear_session_cookies`
+    to get rid of them.
+    
+    *Keyword arguments:*
+    
+    ``path``
+        The database file. It's made if it doesn't exist.
+    ``policy``
+        A :class:`http.cookiejar.CookiePolicy`, like for
+        :class:`http.cookiejar.CookieJar`.
+    ``timeout``
+        How many seconds to wait for another process to finish writing before
+        giving up.
+    """
+    
+    def __init__(self, path, policy=None, timeout=30):
+        IndexedCookieJar.__init__(self, policy)
+        self.path = path
+        self._timeout = timeout
+        self._db = None
+        self._db_pid = None # the process the connection was made in
+        self._data_version = None # None until the cookies are first loaded
+        self._batch_depth = 0
+    
+    def _connection(self):
+        # connections can't be carried across a fork, so each process opens
+        # its own
+        if self._db is None or self._db_pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self._timeout,
+                                 isolation_level=None, # we manage transactions
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL") # readers don't block writers
+            db.execute("CREATE TABLE IF NOT EXISTS cookies (%s, "
+                       "PRIMARY KEY (domain, path, name))" %
+                       ", ".join(_cookie_fields))
+            self._db, self._db_pid = db, os.getpid()
+            self._data_version = None
+        return self._db
+    
+    def _refresh(self):
+        """Loads the cookies from the database if they haven't been loaded, or
+        if someone else has changed them since."""
+        db = self._connection()
+        data_version = db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        cookies = {}
+        next_expiry = float("inf")
+        for row in db.execute("SELECT %s FROM cookies" %
+                              ", ".join(_cookie_fields)):
+            cookie = _row_to_cookie(row)
+            cookies.setdefault(cookie.domain, {}) \
+                   .setdefault(cookie.path, {})[cookie.name] = cookie
+            if cookie.expires is not None and cookie.expires < next_expiry:
+                next_expiry = cookie.expires
+        self._cookies = cookies
+        # rather than sweeping straight away, which is a write, and would make
+        # every other process reload (and sweep) in turn
+        self._next_expiry = next_expiry
+        self._data_version = data_version
+    
+    def _write(self, statement, parameters=()):
+        db = self._connection()
+        if self._batch_depth:
+            db.execute(statement, parameters)
+        else:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(statement, parameters)
+            except:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+    
+    def _begin_batch(self):
+        if not self._batch_depth:
+            # take the write lock before reading, so nobody can sneak a change
+            # in between our refresh and our writes
+            self._connection().execute("BEGIN IMMEDIATE")
+        self._batch_depth += 1
+    
+    def _end_batch(self, commit=True):
+        self._batch_depth -= 1
+        if not self._batch_depth:
+            self._db.execute("COMMIT" if commit else "ROLLBACK")
+    
+    # CookieJar's methods, kept in sync with the database
+    
+    def add_cookie_header(self, request):
+        with self._cookies_lock:
+            self._refresh()
+            IndexedCookieJar.add_cookie_header(self, request)
+    
+    def extract_cookies(self, response, request):
+        headers = response.info()
+        if not headers.get_all("Set-Cookie") and \
+           not headers.get_all("Set-Cookie2"):
+            return # nothing to save, so don't hold up the other processes
+        with self._cookies_lock:
+            self._begin_batch()
+            try:
+                self._refresh()
+                IndexedCookieJar.extract_cookies(self, response, request)
+            except:
+                self._end_batch(commit=False)
+                self._data_version = None # our copy might not match anymore
+                raise
+            self._end_batch()
+    
+    def set_cookie(self, cookie):
+        with self._cookies_lock:
+            self._refresh()
+            self._write("INSERT OR REPLACE INTO cookies VALUES (%s)" %
+                        ", ".join("?" * len(_cookie_fields)),
+                        _cookie_to_row(cookie))
+            IndexedCookieJar.set_cookie(self, cookie)
+    
+    def clear(self, domain=None, path=None, name=None):
+        with self._cookies_lock:
+            self._refresh()
+            IndexedCookieJar.clear(self, domain, path, name) # raises KeyError
+            if name is not None:
+                self._write("DELETE FROM cookies WHERE domain = ? AND "
+                            "path = ? AND name = ?", (domain, path, name))
+            elif path is not None:
+                self._write("DELETE FROM cookies WHERE domain = ? AND "
+                            "path = ?", (domain, path))
+            elif domain is not None:
+                self._write("DELETE FROM cookies WHERE domain = ?", (domain,))
+            else:
+                self._write("DELETE FROM cookies")
+    
+    def clear_session_cookies(self):
+        with self._cookies_lock:
+            self._refresh()
+            self._write("DELETE FROM cookies WHERE discard")
+            IndexedCookieJar.clear_session_cookies(self)
+    
+    def clear_expired_cookies(self):
+        with self._cookies_lock:
+            self._refresh()
+            if time.time() < self._next_expiry:
+                return # nothing has expired yet, so there's nothing to write
+            self._write("DELETE FROM cookies WHERE expires IS NOT NULL AND "
+                        "expires <= ?", (time.time(),))
+            IndexedCookieJar.clear_expired_cookies(self)
+    
+    def find_cookie(self, host, path, name):
+        with self._cookies_lock:
+            self._refresh()
+            return IndexedCookieJar.find_cookie(self, host, path, name)
+    
+    def __iter__(self):
+        with self._cookies_lock:
+            self._refresh()
+            cookies = list(IndexedCookieJar.__iter__(self))
+        return iter(cookies)
+    
+    def __len__(self):
+        with self._cookies_lock:
+            self._refresh()
+            return IndexedCookieJar.__len__(self)
+    
+    def close(self):
+        """Closes the database connection. The jar can still be used, and will
+        reconnect if it is."""
+        with self._cookies_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
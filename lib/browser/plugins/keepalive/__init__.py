@@ -1,12 +1,168 @@
 from .. import BaseBrowserPlugin
 from ..decorators import *
 from . import handler
+from . import resolver
+from . import multiplex
+
+import urllib.request as urlreq
+import urllib.parse as urlpar
 
 class KeepAlivePlugin(BaseBrowserPlugin):
     """Adds a :mod:`urllib` handler to make :mod:`urllib` and
     :class:`lib.browser.Browser` utilize HTTP's ``Keep-Alive`` header, making
     muliple page loads from the same server *significantly* faster."""
     
-    def __init__(self):
+    def __init__(self, dns_cache=None, pipelining=False, pipeline_depth=8,
+                 multiplex_connections=None):
+        """``dns_cache`` is the :class:`resolver.DNSCache` to look up hostnames
+        with. By default, one cache is shared by every plugin in the process.
+        
+        If ``pipelining`` is ``True``, :meth:`load_pages` sends batches of up
+        to ``pipeline_depth`` requests to the same host back to back, using
+        HTTP/1.1 pipelining. It's off by default, as some servers handle it
+        poorly.
+        
+        If ``multiplex_connections`` is a number, :meth:`load_pages` instead
+        fetches it's batches concurrently with a
+        :class:`multiplex.MultiplexHandler`, using up to that many sockets
+        driven from a single thread. This is the better choice for large
+        crawls across many pages."""
         BaseBrowserPlugin.__init__(self)
-        self.handlers.append(handler.HTTPHandler())
+        self._pipelining = pipelining
+        self._pipeline_depth = pipeline_depth
+        self._http_handler = handler.HTTPHandler(dns_cache)
+        self.handlers.append(self._http_handler)
+        self._https_handler = None
+        if hasattr(handler, "HTTPSHandler"):
+            self._https_handler = handler.HTTPSHandler(dns_cache)
+            self.handlers.append(self._https_handler)
+        self._multiplex_handler = None
+        if multiplex_connections is not None:
+            self._multiplex_handler = multiplex.MultiplexHandler(
+                dns_cache, max_connections=multiplex_connections
+            )
+            self.handlers.append(self._multiplex_handler)
+    
+    @extension
+    def prewarm(plugin, browser, hosts, timeout=None):
+        """Resolves and connects to each of the given hosts in parallel ahead of
+        time, so that the first page load from each of them doesn't have to pay
+        for the DNS lookup, TCP connect, and TLS handshake. ``hosts`` may be
+        urls like ``"https://login.ufl.edu/"``, or bare ``"host:port"`` strings,
+        which are treated as ``http``. Returns a list of the hosts that ended up
+        connected; hosts that couldn't be reached are skipped silently."""
+        by_handler = {}
+        for host in hosts:
+            if "://" in host:
+                split_url = urlpar.urlsplit(host)
+                scheme, host = split_url.scheme, split_url.netloc
+            else:
+                scheme = "http"
+            handler = plugin._https_handler if scheme == "https" \
+                                            else plugin._http_handler
+            if handler is not None:
+                by_handler.setdefault(handler, []).append(host)
+        
+        connected = []
+        for handler in by_handler:
+            connected += handler.prewarm(by_handler[handler], timeout)
+        return connected
+    
+    @extension
+    def load_pages(plugin, browser, urls, parser=None, executor=None):
+        """Loads and parses a batch of pages, giving back a list of the results
+        in the same order as ``urls``. With multiplexing enabled (see
+        :meth:`__init__`), the pages are all fetched at once over many
+        non-blocking connections. With pipelining enabled, the pages are grouped
+        by host, and each group is pipelined over a single connection. Either
+        way, we fall back to serial requests if the server misbehaves.
+        
+        Batched pages are fetched straight through the opener, so they are
+        not recorded in the browser's history, and plugins overriding
+        :meth:`lib.browser.Browser.load_page` (such as the redirection plugins)
+        don't see them. This makes them best suited to plain pages, like the
+        registrar's department listings. With neither, this just calls
+        ``browser.load_page`` for each url.
+        
+        If an ``executor`` is given, it's used like in
+        :meth:`lib.browser.Browser.load_page`: each page is handed off to be
+        parsed as soon as it has arrived, and the list holds
+        :class:`concurrent.futures.Future` objects instead."""
+        urls = [url if "://" in url else browser.expand_relative_url(url)
+                for url in urls]
+        if plugin._multiplex_handler is not None:
+            return plugin._load_multiplexed(browser, urls, parser, executor)
+        if not plugin._pipelining:
+            return [browser.load_page(url, parser=parser, executor=executor)
+                    for url in urls]
+        
+        # group the urls by the handler and host they'll go through
+        groups = {}
+        for index, url in enumerate(urls):
+            split_url = urlpar.urlsplit(url)
+            handler = plugin._https_handler if split_url.scheme == "https" \
+                      else plugin._http_handler
+            if split_url.scheme not in ("http", "https") or handler is None:
+                handler = None
+            groups.setdefault((handler, split_url.netloc), []).append(index)
+        
+        results = [None] * len(urls)
+        for (handler, host), indexes in groups.items():
+            if handler is None:
+                for i in indexes:
+                    results[i] = browser.load_page(urls[i], parser=parser,
+                                                   executor=executor)
+                continue
+            responses = handler.pipeline(
+                [urlreq.Request(urls[i]) for i in indexes],
+                plugin._pipeline_depth
+            )
+            for i, response in zip(indexes, responses):
+                results[i] = plugin._parse_response(browser, parser, executor,
+                                                    response)
+        return results
+    
+    def _parse_response(self, browser, parser, executor, response):
+        if executor is not None:
+            return browser._parse_page_later(executor, parser, response.read(),
+                                             response.info(), response.geturl())
+        return browser._parse_page(parser, response.read(), response.info(),
+                                   response.geturl())
+    
+    def _load_multiplexed(self, browser, urls, parser, executor):
+        results = [None] * len(urls)
+        batch = [] # indexes of the urls the multiplexer can handle
+        for index, url in enumerate(urls):
+            if urlpar.urlsplit(url).scheme in ("http", "https"):
+                batch.append(index)
+            else:
+                results[index] = browser.load_page(url, parser=parser,
+                                                   executor=executor)
+        responses = self._multiplex_handler.fetch(
+            [urlreq.Request(urls[i]) for i in batch]
+        )
+        for i, response in zip(batch, responses):
+            results[i] = self._parse_response(browser, parser, executor,
+                                              response)
+        return results
+    
+    @extension
+    def connection_stats(plugin, browser):
+        """Returns a dictionary mapping ``"scheme://host"`` strings to
+        :class:`handler.HostStats` objects, counting how often connections to
+        each host were opened, reused, and dropped. These are handy for tuning,
+        and for spotting hosts that send ``Connection: close``."""
+        result = {}
+        for scheme, http_handler in (("http", plugin._http_handler),
+                                     ("https", plugin._https_handler)):
+            if http_handler is None:
+                continue
+            for host, stats in http_handler.stats().items():
+                result["%s://%s" % (scheme, host)] = stats
+        if plugin._multiplex_handler is not None:
+            # the multiplexer's hosts already carry their scheme
+            for host, stats in plugin._multiplex_handler.stats().items():
+                if host in result:
+                    stats = handler.HostStats.combine(result[host], stats)
+                result[host] = stats
+        return result
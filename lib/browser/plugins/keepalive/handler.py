@@ -21,6 +21,13 @@ use the handler methods:
   close_connection(host)
   close_all()
   open_connections()
+  prewarm(hosts)
+  stats()             -  per-host HostStats reuse counters
+  reset_stats()
+  pipeline(requests)  -  send a batch of GETs to one host back to back
+
+HTTPSHandler does the same for https:// urls. Both look up addresses
+through resolver.DNSCache, so reconnects skip the DNS lookup too.
 
 >>> keepalive_handler.close_all()
 
@@ -53,18 +60,115 @@ EXTRA ATTRIBUTES AND METHODS
 
 """
 
-import urllib.request, urllib.error, urllib.parse
+import urllib.request, urllib.error, urllib.parse, urllib.response
 import http.client
 import socket
+import threading
+import time
+import io
+import logging
+
+from . import resolver as _resolver
+
+logger = logging.getLogger("browser.plugins.keepalive.handler")
 
 #STRING_VERSION = '.'.join(map(str, VERSION))
-DEBUG = 0
 HANDLE_ERRORS = 1
 
-class HTTPHandler(urllib.request.HTTPHandler):
+class HostStats(object):
+    """Counters for the connections a handler has made to a single host.
+    
+    ``opened``
+        New connections made, including ones made by ``prewarm``.
+    ``reused``
+        Requests sent down an already-open connection.
+    ``failed_reuse``
+        Pooled connections that turned out to be dead when we tried to reuse
+        them (the HTTP/0.9 fallback), forcing a reconnect.
+    ``closed_by_server``
+        Responses that told us the connection wouldn't be kept open, such as
+        with a ``Connection: close`` header. A host where this is close to
+        :attr:`requests` is defeating the pool.
+    ``requests``
+        Responses received from the host.
+    ``bytes_read``
+        Bytes of response bodies read from the host.
+    """
+    
+    fields = ("opened", "reused", "failed_reuse", "closed_by_server",
+              "requests", "bytes_read")
+    
     def __init__(self):
-        urllib.request.HTTPHandler.__init__(self)
+        for field in self.fields:
+            setattr(self, field, 0)
+    
+    requests_per_connection = property(
+        lambda self: self.requests / self.opened if self.opened else 0.0,
+        doc="""The mean number of requests each opened connection served.""")
+    
+    @classmethod
+    def combine(cls, *stats):
+        """Returns a new :class:`HostStats` with the sums of each of the given
+        ones' counters."""
+        result = cls()
+        for field in cls.fields:
+            setattr(result, field, sum(getattr(i, field) for i in stats))
+        return result
+    
+    def as_dict(self):
+        """Returns the counters (and :attr:`requests_per_connection`) as a
+        dictionary."""
+        d = dict((field, getattr(self, field)) for field in self.fields)
+        d["requests_per_connection"] = self.requests_per_connection
+        return d
+    
+    def __repr__(self):
+        return "<HostStats %s>" % " ".join(
+            "%s=%s" % (field, getattr(self, field)) for field in self.fields
+        )
+
+class KeepAliveHandler(object):
+    """The connection pooling shared by :class:`HTTPHandler` and
+    :class:`HTTPSHandler`. It isn't a handler on it's own."""
+    
+    # urllib's stock handlers have a handler_order of 500, and build_opener
+    # always installs them. We have to come first, or they'll open (and close)
+    # every connection before we ever see the request.
+    handler_order = 450
+    
+    # only changes how connections are made, so a Browser's fast path (which
+    # pools it's own connections) can stand in for us
+    fast_path_compatible = True
+    
+    def __init__(self, resolver=None):
         self._connections = {}
+        self._resolver = resolver if resolver is not None else \
+                         _resolver.default_cache
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._no_pipelining = set() # hosts that mangled a pipelined batch
+        # connections with a request in flight, so two threads never talk
+        # over each other on one connection
+        self._busy = set()
+        self._busy_lock = threading.Lock()
+    
+    def stats(self):
+        """return a dict of host -> HostStats, covering every host we've
+        connected to since the handler was made (or reset_stats was called)"""
+        with self._stats_lock:
+            return dict(self._stats)
+    
+    def reset_stats(self):
+        """forget all counters"""
+        with self._stats_lock:
+            self._stats = {}
+    
+    def _record(self, host, field, amount=1):
+        with self._stats_lock:
+            stats = self._stats.get(host)
+            if stats is None:
+                stats = self._stats[host] = HostStats()
+            setattr(stats, field, getattr(stats, field) + amount)
     
     def close_connection(self, host):
         """close connection to <host>
@@ -87,81 +191,378 @@ class HTTPHandler(urllib.request.HTTPHandler):
             if close: self._connections[host].close()
             del self._connections[host]
     
+    def _checkout(self, host):
+        """take the pooled connection to <host> for a request, or return None
+        if there isn't one, or another thread is in the middle of using it"""
+        with self._busy_lock:
+            h = self._connections.get(host)
+            if h is None or h in self._busy:
+                return None
+            self._busy.add(h)
+            return h
+    
+    def _checkout_new(self, host):
+        """make a connection to <host> for a request. it goes in the pool if
+        the pool has no (working) connection to <host>, and otherwise it's a
+        spare, for a thread that found the pooled one busy"""
+        h = self._new_connection(host)
+        with self._busy_lock:
+            pooled = self._connections.get(host)
+            if pooled is None or pooled not in self._busy:
+                self._connections[host] = h
+            self._busy.add(h)
+        return h
+    
+    def _release(self, host, h, reuse=True):
+        """called once a response has been read, to let the next request use
+        its connection. a spare is pooled if the pool has since lost its
+        connection to <host>, and closed otherwise (as is any connection the
+        server is closing, if <reuse> is false)"""
+        with self._busy_lock:
+            self._busy.discard(h)
+            if self._connections.get(host) is h:
+                return
+            if reuse and host not in self._connections and \
+               h.sock is not None:
+                self._connections[host] = h
+                return
+        h.close()
+    
+    def _new_connection(self, host):
+        """Builds a new (unconnected) connection object to <host>, which looks
+        up addresses through our DNS cache."""
+        h = self._connection_factory(host)
+        h._create_connection = self._resolver.create_connection
+        return h
+    
+    def prewarm(self, hosts, timeout=None):
+        """resolve and connect to each of <hosts> in parallel, and put the
+        connections in the pool, so the first real request to each of them
+        skips the DNS lookup, TCP connect and (for https) TLS handshake.
+        hosts we already have a connection to are skipped. failures are not
+        raised, as this is only ever an optimization. returns the list of hosts
+        that are connected afterwards. a connection that isn't made within
+        <timeout> seconds (of the whole call) is closed when it is, rather than
+        pooled, so it doesn't show up after we've said it wasn't there."""
+        deadline = None if timeout is None else time.time() + timeout
+        finished = [] # not empty once we've given our answer
+        
+        def warm(host):
+            h = self._new_connection(host)
+            try:
+                h.connect()
+            except (socket.error, http.client.HTTPException) as err:
+                logger.debug("failed to prewarm %s: %s" % (host, err))
+                h.close()
+                return
+            with self._busy_lock:
+                late = bool(finished)
+                if not late:
+                    self._connections.setdefault(host, h)
+            if late:
+                logger.debug("prewarmed %s too late, closing it" % host)
+                h.close()
+            else:
+                logger.debug("prewarmed connection to %s" % host)
+                self._record(host, "opened")
+        
+        threads = [threading.Thread(target=warm, args=(host,))
+                   for host in set(hosts) if host not in self._connections]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join(None if deadline is None else
+                   max(0, deadline - time.time()))
+        with self._busy_lock:
+            finished.append(True)
+            return [host for host in hosts if host in self._connections]
+    
     def _start_connection(self, h, req):
+        # urllib's processors (cookies, the opener's addheaders, Host, etc.)
+        # put their headers in unredirected_hdrs, so merge them like urllib's
+        # own do_open does
+        headers = dict(req.unredirected_hdrs)
+        headers.update(req.headers)
         try:
-            if req.has_data():
-                data = req.get_data()
-                h.putrequest('POST', req.get_selector())
-                if 'Content-type' not in req.headers:
+            # the get_*() accessors are gone from newer Requests, but the
+            # attributes have been there since 3.2
+            data = req.data
+            if data is not None:
+                h.putrequest('POST', req.selector, skip_host='Host' in headers)
+                if 'Content-type' not in headers:
                     h.putheader('Content-type',
                                 'application/x-www-form-urlencoded')
-                if 'Content-length' not in req.headers:
+                if 'Content-length' not in headers:
                     h.putheader('Content-length', '%d' % len(data))
             else:
-                h.putrequest('GET', req.get_selector())
+                h.putrequest('GET', req.selector, skip_host='Host' in headers)
         except socket.error as err:
             raise urllib.error.URLError(err)
         
-        for args in self.parent.addheaders:
-            h.putheader(*args)
-        for k, v in list(req.headers.items()):
+        for k, v in headers.items():
             h.putheader(k, v)
         h.endheaders()
-        if req.has_data():
+        if data is not None:
             h.send(data)
     
-    def do_open(self, http_class, req):
-        host = req.get_host()
+    def do_open(self, req):
+        host = req.host
         if not host:
             raise urllib.error.URLError('no host given')
         
         try:
             need_new_connection = 1
-            h = self._connections.get(host)
+            h = self._checkout(host)
             if not h is None:
                 try:
                     self._start_connection(h, req)
                 except socket.error as e:
                     r = None
                 else:
+                    # (a server that dropped the connection shows up here too)
                     try: r = h.getresponse()
-                    except http.client.ResponseNotReady as e: r = None
+                    except (socket.error, http.client.HTTPException) as e:
+                        r = None
                 
                 if r is None or r.version == 9:
                     # httplib falls back to assuming HTTP 0.9 if it gets a
                     # bad header back.  This is most likely to happen if
                     # the socket has been closed by the server since we
                     # last used the connection.
-                    if DEBUG: print("failed to re-use connection to %s" % host)
+                    logger.debug("failed to re-use connection to %s" % host)
+                    self._record(host, "failed_reuse")
                     h.close()
+                    with self._busy_lock:
+                        self._busy.discard(h)
+                        if self._connections.get(host) is h:
+                            del self._connections[host]
                 else:
-                    if DEBUG: print("re-using connection to %s" % host)
+                    logger.debug("re-using connection to %s" % host)
+                    self._record(host, "reused")
                     need_new_connection = 0
             if need_new_connection:
-                if DEBUG: print("creating new connection to %s" % host)
-                h = http_class(host)
-                self._connections[host] = h
-                self._start_connection(h, req)
-                r = h.getresponse()
+                logger.debug("creating new connection to %s" % host)
+                h = self._checkout_new(host)
+                self._record(host, "opened")
+                try:
+                    self._start_connection(h, req)
+                    r = h.getresponse()
+                except:
+                    self._release(host, h)
+                    raise
         except socket.error as err:
             raise urllib.error.URLError(err)
         
+        self._record(host, "requests")
         # if not a persistent connection, don't try to reuse it
-        if r.will_close: self._remove_connection(host)
+        if r.will_close:
+            self._record(host, "closed_by_server")
+            with self._busy_lock:
+                if self._connections.get(host) is h:
+                    del self._connections[host]
         
-        if DEBUG:
-            print("STATUS: %s, %s" % (r.status, r.reason))
+        logger.debug("STATUS: %s, %s" % (r.status, r.reason))
         r._handler = self
         r._host = host
         r._url = req.get_full_url()
+        r._connection = h
+        if r.isclosed(): # there was no body to read
+            r._release_connection()
         
         if r.status == 200 or not HANDLE_ERRORS:
             return r
         else:
             return self.parent.error('http', req, r, r.status, r.reason, r.msg)
     
+    def pipeline(self, reqs, depth=8):
+        """send the GET requests in <reqs> (urllib Request objects, all for
+        the same host) over one connection, writing up to <depth> of them
+        back to back before reading the responses in order. this saves a
+        round trip per request on high-latency links, without opening more
+        sockets.
+        
+        if the server misbehaves (drops the connection, or answers in a way we
+        can't parse), the rest of the batch is fetched serially, and the host
+        won't be pipelined to again by this handler. a failure on a pooled
+        connection is first retried once on a new one, as the server may just
+        have closed it while it sat in the pool. responses read before the
+        failure are kept either way. returns a list of response objects in
+        the same order as <reqs>. like Browser.load_page, an HTTPError is
+        given back in place of the response, not raised."""
+        reqs = list(reqs)
+        if not reqs:
+            return []
+        host = reqs[0].host
+        for req in reqs:
+            if req.host != host or req.data is not None:
+                raise ValueError("only GET requests to a single host can be "
+                                 "pipelined")
+        reqs = [self._preprocess_request(req) for req in reqs]
+        
+        results = []
+        retried = fresh = False
+        while len(results) < len(reqs) and host not in self._no_pipelining:
+            batch = reqs[len(results):len(results) + depth]
+            responses = []
+            h = None
+            reused = False
+            try:
+                h, reused = self._pipeline_connection(host, fresh)
+                closing = self._pipeline_batch(host, h, batch, responses)
+            except (socket.error, http.client.HTTPException) as err:
+                logger.debug("pipelining to %s failed: %s" % (host, err))
+                if h is not None:
+                    self._discard(host, h)
+                fresh = reused and not retried
+                if fresh:
+                    self._record(host, "failed_reuse")
+                    retried = True # try again on a new connection
+                else:
+                    self._no_pipelining.add(host)
+            else:
+                fresh = False
+                if closing:
+                    self._discard(host, h)
+                else:
+                    self._release(host, h)
+            for req, r in zip(batch, responses):
+                results.append(self._postprocess_response(req, r))
+            if len(responses) < len(batch) and not fresh:
+                break # the server closed the connection; go serial
+        
+        for req in reqs[len(results):]:
+            try:
+                results.append(self.parent.open(req))
+            except urllib.error.HTTPError as err:
+                results.append(err)
+        return results
+    
+    def _preprocess_request(self, req):
+        """runs the opener's request processors (cookies, headers) over <req>,
+        like OpenerDirector.open does before it calls a handler"""
+        meth_name = req.type + "_request"
+        for processor in self.parent.process_request.get(req.type, []):
+            req = getattr(processor, meth_name)(req)
+        return req
+    
+    def _postprocess_response(self, req, response):
+        meth_name = req.type + "_response"
+        try:
+            for processor in self.parent.process_response.get(req.type, []):
+                response = getattr(processor, meth_name)(req, response)
+        except urllib.error.HTTPError as err:
+            return err
+        return response
+    
+    def _format_request(self, req):
+        """builds the raw bytes of <req>, for when we write to the socket
+        ourselves rather than through http.client"""
+        headers = dict(req.unredirected_hdrs)
+        headers.update(req.headers)
+        data = req.data
+        lines = ["%s %s HTTP/1.1" % ("GET" if data is None else "POST",
+                                     req.selector)]
+        if "Host" not in headers:
+            lines.append("Host: %s" % req.host)
+        if "Accept-encoding" not in headers:
+            lines.append("Accept-Encoding: identity")
+        if data is not None:
+            if "Content-type" not in headers:
+                lines.append("Content-type: application/x-www-form-urlencoded")
+            if "Content-length" not in headers:
+                lines.append("Content-length: %d" % len(data))
+        lines += ["%s: %s" % (k, v) for k, v in headers.items()]
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        return head if data is None else head + data
+    
+    def _pipeline_connection(self, host, fresh=False):
+        """checks out a connection to <host> to pipeline over, the same way
+        do_open does, and returns it, and whether it was already open. a new
+        one is made if <fresh> is true, or the pooled one is busy. it has to
+        be given back with _release or _discard."""
+        h = None if fresh else self._checkout(host)
+        if h is not None and h.sock is not None:
+            self._record(host, "reused")
+            return h, True
+        if h is None:
+            h = self._checkout_new(host)
+        try:
+            h.connect()
+        except:
+            self._discard(host, h)
+            raise
+        self._record(host, "opened")
+        return h, False
+    
+    def _discard(self, host, h):
+        """closes <h>, a checked out connection to <host> that's no good
+        anymore, taking it out of the pool if it's there"""
+        with self._busy_lock:
+            self._busy.discard(h)
+            if self._connections.get(host) is h:
+                del self._connections[host]
+        h.close()
+    
+    def _pipeline_batch(self, host, h, reqs, responses):
+        """writes every request in <reqs> down <h>, and then reads the
+        responses onto the end of <responses>, so the ones read before any
+        failure aren't lost. fewer responses than requests are read if the
+        server closes the connection part way through. returns whether it
+        did (so <h> can't be used again)."""
+        h.sock.sendall(b"".join(self._format_request(req) for req in reqs))
+        
+        sock = _PipelinedSocket(h.sock)
+        try:
+            return self._read_pipelined(host, sock, reqs, responses)
+        finally:
+            sock.close()
+    
+    def _read_pipelined(self, host, sock, reqs, responses):
+        for req in reqs:
+            r = HTTPResponse(sock, method="GET")
+            r.begin()
+            if r.version == 9:
+                raise http.client.BadStatusLine("HTTP/0.9 response to a "
+                                                "pipelined request")
+            body = r.read()
+            self._record(host, "requests")
+            self._record(host, "bytes_read", len(body))
+            logger.debug("PIPELINED STATUS: %s, %s" % (r.status, r.reason))
+            response = urllib.response.addinfourl(
+                io.BytesIO(body), r.msg, req.get_full_url(), r.status
+            )
+            response.msg = r.reason # HTTPErrorProcessor wants this
+            responses.append(response)
+            if r.will_close:
+                self._record(host, "closed_by_server")
+                return True
+        return False
+    
+
+class HTTPHandler(KeepAliveHandler, urllib.request.HTTPHandler):
+    def __init__(self, resolver=None):
+        urllib.request.HTTPHandler.__init__(self)
+        KeepAliveHandler.__init__(self, resolver)
+    
+    def _connection_factory(self, host):
+        return HTTPConnection(host)
+    
     def http_open(self, req):
-        return self.do_open(HTTPConnection, req)
+        return self.do_open(req)
+
+if hasattr(urllib.request, "HTTPSHandler"): # python built without ssl
+    class HTTPSHandler(KeepAliveHandler, urllib.request.HTTPSHandler):
+        def __init__(self, resolver=None, context=None):
+            urllib.request.HTTPSHandler.__init__(self, context=context)
+            KeepAliveHandler.__init__(self, resolver)
+            self._ssl_context = context
+        
+        def _connection_factory(self, host):
+            return HTTPSConnection(host, context=self._ssl_context)
+        
+        def https_open(self, req):
+            return self.do_open(req)
 
 class HTTPResponse(http.client.HTTPResponse):
 
@@ -180,8 +581,15 @@ class HTTPResponse(http.client.HTTPResponse):
 
     # the read method wraps the original to accomodate buffering,
     # although read() never adds to the buffer.
-    # Both readline and readlines have been stolen with almost no
-    # modification from socket.py
+    
+    # the buffer is a preallocated bytearray that the socket reads straight
+    # into (between _rbufend and the end of it), and that is consumed by
+    # moving _rbufpos forward rather than by slicing it down, so a partial
+    # read never copies the unread remainder of the buffer. It's only
+    # reallocated when it runs out of room. readinto() fills a
+    # caller's own preallocated buffer without any intermediate bytes objects,
+    # and _read1_view() hands out memoryviews of ours, for callers that know
+    # not to hold onto them.
     
 
     def __init__(self, sock, debuglevel=0, strict=0, method=None):
@@ -190,54 +598,168 @@ class HTTPResponse(http.client.HTTPResponse):
         else: # 2.2 doesn't
             http.client.HTTPResponse.__init__(self, sock, debuglevel)
         self.fileno = sock.fileno
-        self._rbuf = b""
+        self._rbuf = bytearray()
+        self._rbufpos = 0    # offset of the first unread byte in _rbuf
+        self._rbufend = 0    # offset just past the last unread byte
         self._rbufsize = 8096
         self._handler = None # inserted by the handler later
         self._host = None    # (same)
         self._url = None     # (same)
+        self._connection = None # (same)
 
     _raw_read = http.client.HTTPResponse.read
+    # python 3.2's HTTPResponse has no readinto of it's own
+    _raw_readinto = getattr(http.client.HTTPResponse, "readinto", None)
 
     def close_connection(self):
         self.close()
         self._handler._remove_connection(self._host, close=1)
+    
+    def _close_conn(self):
+        # http.client calls this once the body has all been read (or the
+        # response is closed), so the connection is free for the next request
+        http.client.HTTPResponse._close_conn(self)
+        self._release_connection()
+    
+    def _release_connection(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._handler._release(self._host, connection,
+                                   reuse=not self.will_close)
         
     def info(self):
         return self.msg
 
     def geturl(self):
         return self._url
+    
+    def _buffered(self):
+        """Returns the number of bytes sitting unread in the buffer."""
+        return self._rbufend - self._rbufpos
+    
+    def _consume_buffer(self, amt):
+        """Takes up to ``amt`` bytes off the front of the buffer, returning them
+        as a :class:`memoryview` of the buffer. The view is only good until the
+        buffer is next filled."""
+        start = self._rbufpos
+        end = min(start + amt, self._rbufend)
+        self._rbufpos = end
+        view = memoryview(self._rbuf)[start:end]
+        if end == self._rbufend: # drained, so start over on the next fill
+            self._rbufpos = self._rbufend = 0
+        return view
+    
+    def _fill_buffer(self, amt):
+        """Reads up to ``amt`` more bytes from the socket onto the end of the
+        buffer, returning the number of bytes read."""
+        end = self._rbufend
+        if end + amt > len(self._rbuf):
+            # out of room, so move what's unread to the front of a bigger
+            # buffer. It's a new bytearray, as views handed out by
+            # _read1_view() may still be pinning the old one (which can't be
+            # resized while they do).
+            unread = end - self._rbufpos
+            rbuf = bytearray(max(unread + amt, 2 * unread, self._rbufsize))
+            rbuf[:unread] = memoryview(self._rbuf)[self._rbufpos:end]
+            self._rbuf = rbuf
+            self._rbufpos, end = 0, unread
+        with memoryview(self._rbuf) as view:
+            n = self._raw_readinto_view(view[end:end + amt])
+        self._rbufend = end + n
+        return n
+    
+    def _raw_readinto_view(self, view):
+        """Reads directly from the socket into a writable buffer."""
+        if self._raw_readinto is not None:
+            n = self._raw_readinto(view)
+        else:
+            data = self._raw_read(len(view))
+            n = len(data)
+            view[:n] = data
+        self._count_bytes(n)
+        return n
+    
+    def _counted_read(self, amt=None):
+        data = self._raw_read(amt)
+        self._count_bytes(len(data))
+        return data
+    
+    def _count_bytes(self, n):
+        if self._handler is not None and n:
+            self._handler._record(self._host, "bytes_read", n)
 
     def read(self, amt=None):
         # the _rbuf test is only in this first if for speed.  It's not
         # logically necessary
-        if self._rbuf and not amt is None:
-            L = len(self._rbuf)
-            if amt > L:
-                amt -= L
-            else:
-                s = self._rbuf[:amt]
-                self._rbuf = self._rbuf[amt:]
-                return s
-
-        s = self._rbuf + self._raw_read(amt)
-        self._rbuf = ''
-        return s
+        if not self._buffered():
+            return self._counted_read(amt)
+        
+        if amt is not None and amt <= self._buffered():
+            return bytes(self._consume_buffer(amt))
+        
+        if amt is None and self.length is None:
+            # unknown length, there's no way to preallocate, so just join
+            return bytes(self._consume_buffer(self._buffered())) + \
+                   self._counted_read()
+        
+        # we know exactly how big the result is going to be, so build it in
+        # one preallocated buffer
+        if amt is None:
+            amt = self._buffered() + self.length
+        else:
+            amt = min(amt, self._buffered() + (self.length
+                                               if self.length is not None
+                                               else amt))
+        result = bytearray(amt)
+        n = self.readinto(result)
+        del result[n:]
+        return bytes(result)
+    
+    def readinto(self, b):
+        """Reads bytes into a preallocated, writable buffer ``b``, such as a
+        :class:`bytearray` or :class:`memoryview`, first from the internal
+        buffer, and then directly from the socket. Returns the number of bytes
+        read, which is only less than ``len(b)`` at the end of the response."""
+        view = memoryview(b)
+        total = 0
+        if self._buffered():
+            chunk = self._consume_buffer(len(view))
+            total = len(chunk)
+            view[:total] = chunk
+        while total < len(view):
+            n = self._raw_readinto_view(view[total:])
+            if not n:
+                break
+            total += n
+        return total
+    
+    def read1(self, n=-1):
+        """Returns at most ``n`` bytes, making at most one read from the
+        socket. If anything is left in the internal buffer, we give that
+        instead of reading."""
+        return bytes(self._read1_view(n))
+    
+    def _read1_view(self, n=-1):
+        """Like read1(), but returns a :class:`memoryview` of the internal
+        buffer rather than a copy. The view is only valid until the next read,
+        so copy it (``bytes(view)``) if you need to hold onto it."""
+        if n is None or n < 0:
+            n = self._rbufsize
+        if not self._buffered():
+            self._fill_buffer(n)
+        return self._consume_buffer(n)
 
     def readline(self, limit=-1):
-        data = ""
-        i = self._rbuf.find(b'\n')
-        while i < 0 and not (0 < limit <= len(self._rbuf)):
-            new = self._raw_read(self._rbufsize)
-            if not new: break
-            i = new.find(b'\n')
-            if i >= 0: i = i + len(self._rbuf)
-            self._rbuf = self._rbuf + new
-        if i < 0: i = len(self._rbuf)
-        else: i = i+1
-        if 0 <= limit < len(self._rbuf): i = limit
-        data, self._rbuf = self._rbuf[:i], self._rbuf[i:]
-        return data
+        i = self._rbuf.find(b'\n', self._rbufpos, self._rbufend)
+        while i < 0 and not (0 < limit <= self._buffered()):
+            searched = self._buffered() # the fill might move what's unread
+            if not self._fill_buffer(self._rbufsize): break
+            i = self._rbuf.find(b'\n', self._rbufpos + searched,
+                                self._rbufend)
+        if i < 0: i = self._buffered()
+        else: i = i + 1 - self._rbufpos
+        if 0 <= limit < self._buffered(): i = min(i, limit)
+        return bytes(self._consume_buffer(i))
 
     def readlines(self, sizehint = 0):
         total = 0
@@ -252,9 +774,43 @@ class HTTPResponse(http.client.HTTPResponse):
         return list
 
 
+class _PipelinedSocket(object):
+    """Lets several HTTPResponses read one after another from the same socket.
+    Every response shares one buffered file, so that bytes the first response
+    buffers past it's own end are still there for the next one, and closing a
+    finished response doesn't close the file out from under the rest."""
+    
+    def __init__(self, sock):
+        self._sock = sock
+        self._file = _UnclosableFile(sock.makefile("rb"))
+    
+    def fileno(self):
+        return self._sock.fileno()
+    
+    def makefile(self, mode, *args, **kwargs):
+        return self._file
+    
+    def close(self):
+        """Closes the shared file (but not the socket itself)."""
+        self._file._fp.close()
+
+class _UnclosableFile(object):
+    def __init__(self, fp):
+        self._fp = fp
+    
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+    
+    def close(self):
+        pass
+
 class HTTPConnection(http.client.HTTPConnection):
     # use the modified response class
     response_class = HTTPResponse
+
+if hasattr(http.client, "HTTPSConnection"):
+    class HTTPSConnection(http.client.HTTPSConnection):
+        response_class = HTTPResponse
     
 #########################################################################
 #####   TEST FUNCTIONS
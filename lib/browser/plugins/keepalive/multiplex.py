@@ -0,0 +1,520 @@
+"""An event-driven transport for fetching a large number of pages at once.
+
+:class:`MultiplexHandler` drives many non-blocking HTTP/1.1 connections from a
+single thread with :mod:`selectors`, rather than using a thread (and a blocking
+socket) per request. It's meant for crawl-like workloads, where nearly all the
+time is spent waiting on the network. It shares the pooling interface of the
+handlers in :mod:`lib.browser.plugins.keepalive.handler` (DNS cache, per-host
+:class:`~lib.browser.plugins.keepalive.handler.HostStats`), but it never
+answers ordinary ``urlopen`` calls; work is given to it in batches with
+:meth:`MultiplexHandler.fetch`.
+
+>>> import urllib.request
+>>> from lib.browser.plugins.keepalive.multiplex import MultiplexHandler
+>>> multiplex_handler = MultiplexHandler(max_connections=200)
+>>> opener = urllib.request.build_opener(multiplex_handler)
+>>> responses = multiplex_handler.fetch(
+...     [urllib.request.Request(url) for url in urls]
+... )
+
+..
+"""
+
+from . import handler as _handler
+
+import urllib.request, urllib.error, urllib.parse, urllib.response
+import http.client
+import collections
+import selectors
+import socket
+import errno
+import time
+import io
+import logging
+
+try:
+    import ssl
+except ImportError: # python built without ssl
+    ssl = None
+
+logger = logging.getLogger("browser.plugins.keepalive.multiplex")
+
+_default_ports = {"http":80, "https":443}
+
+# connection states
+_CONNECTING, _HANDSHAKING, _SENDING, _RECEIVING = range(4)
+
+class _ResponseParser(object):
+    """Incrementally parses an HTTP/1.x response from the bytes fed to it."""
+    
+    def __init__(self, method):
+        self._method = method
+        self._buf = bytearray()
+        self._pos = 0
+        self._body_state = None # None, "length", "chunk-size", "chunk-data",
+                                # "chunk-crlf", "trailer", or "close"
+        self._left = 0
+        self.status = None
+        self.reason = None
+        self.headers = None
+        self.will_close = False
+        self.body = bytearray()
+        self.done = False
+        self.received_any = False
+    
+    def feed(self, data):
+        """Adds more bytes from the socket. Returns ``True`` once the whole
+        response has been read."""
+        if data:
+            self.received_any = True
+        self._buf += data
+        while not self.done:
+            if self.headers is None:
+                if not self._parse_head():
+                    break
+            elif not self._parse_body():
+                break
+        if self._pos: # throw away what we've used up
+            del self._buf[:self._pos]
+            self._pos = 0
+        return self.done
+    
+    def eof(self):
+        """Tells the parser the server closed the connection. Returns ``True``
+        if that completed the response, otherwise raises
+        :class:`http.client.IncompleteRead`."""
+        if self._body_state == "close":
+            self.done = True
+            return True
+        if not self.done:
+            raise http.client.IncompleteRead(bytes(self.body))
+        return True
+    
+    def _parse_head(self):
+        end = self._buf.find(b"\r\n\r\n", self._pos)
+        if end < 0:
+            return False
+        line_end = self._buf.find(b"\r\n", self._pos)
+        status_line = bytes(self._buf[self._pos:line_end]).decode("latin-1")
+        try:
+            version, status, reason = (status_line.split(None, 2) + [""])[:3]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(status_line)
+        if not version.startswith("HTTP/1."):
+            raise http.client.BadStatusLine(status_line)
+        headers = http.client.parse_headers(
+            io.BytesIO(bytes(self._buf[line_end + 2:end + 4]))
+        )
+        self._pos = end + 4
+        if 100 <= status < 200 and status != 101:
+            return True # an interim response (100 Continue); skip it
+        
+        self.status, self.reason, self.headers = status, reason.strip(), headers
+        connection = (headers.get("connection") or "").lower()
+        self.will_close = "close" in connection or \
+                          (version == "HTTP/1.0" and "keep-alive" not in
+                                                     connection)
+        
+        if self._method == "HEAD" or status in (204, 304):
+            self.done = True
+        elif "chunked" in (headers.get("transfer-encoding") or "").lower():
+            self._body_state = "chunk-size"
+        elif headers.get("content-length") is not None:
+            self._left = int(headers.get("content-length"))
+            self._body_state = "length"
+            self.done = not self._left
+        else:
+            self._body_state = "close"
+            self.will_close = True
+        return True
+    
+    def _parse_body(self):
+        buf, state = self._buf, self._body_state
+        if state in ("length", "chunk-data", "close"):
+            available = len(buf) - self._pos
+            if not available:
+                return False
+            take = available if state == "close" else min(available,
+                                                           self._left)
+            self.body += buf[self._pos:self._pos + take]
+            self._pos += take
+            if state == "close":
+                return False
+            self._left -= take
+            if not self._left:
+                if state == "length":
+                    self.done = True
+                else:
+                    self._body_state = "chunk-crlf"
+            return True
+        if state == "chunk-crlf":
+            if len(buf) - self._pos < 2:
+                return False
+            self._pos += 2
+            self._body_state = "chunk-size"
+            return True
+        # chunk-size or trailer: both are line-based
+        line_end = buf.find(b"\r\n", self._pos)
+        if line_end < 0:
+            return False
+        line = bytes(buf[self._pos:line_end])
+        self._pos = line_end + 2
+        if state == "trailer":
+            if not line:
+                self.done = True
+            return True
+        try:
+            self._left = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise http.client.IncompleteRead(bytes(self.body))
+        self._body_state = "chunk-data" if self._left else "trailer"
+        return True
+
+class _Exchange(object):
+    """A request, and the state of getting it's response."""
+    
+    def __init__(self, req, data):
+        self.req = req
+        self.data = data # the request, serialized
+        split_host = urllib.parse.urlsplit("//" + req.host)
+        self.key = (req.type, split_host.hostname,
+                    split_host.port or _default_ports[req.type])
+        self.response = None
+        self.retried = False
+
+class _Connection(object):
+    def __init__(self, key, sock, addresses):
+        self.key = key
+        self.sock = sock
+        self.addresses = addresses # addrinfos left to try if connect fails
+        self.state = _CONNECTING
+        self.exchange = None
+        self.parser = None
+        self.outbuf = None
+        self.reused = False
+        self.registered = False # whether sock is in the event loop's selector
+        self.last_activity = time.time()
+
+class MultiplexHandler(_handler.KeepAliveHandler, urllib.request.BaseHandler):
+    """A handler that fetches batches of requests concurrently from a single
+    thread. It doesn't define ``http_open`` or ``https_open``, so ordinary
+    page loads never go through it.
+    
+    *Keyword arguments:*
+    
+    ``resolver``
+        The :class:`lib.browser.plugins.keepalive.resolver.DNSCache` to use.
+    ``max_connections``
+        The most sockets we'll have open at once, across all hosts.
+    ``max_per_host``
+        The most sockets we'll have open to any one host at once.
+    ``timeout``
+        Seconds a connection may go without any activity before we give up on
+        it (and retry it's request serially).
+    ``context``
+        The :class:`ssl.SSLContext` to use for ``https`` connections.
+    """
+    
+    def __init__(self, resolver=None, max_connections=500, max_per_host=8,
+                 timeout=30, context=None):
+        _handler.KeepAliveHandler.__init__(self, resolver)
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        if context is None and ssl is not None:
+            context = ssl.create_default_context()
+        self._ssl_context = context
+        self._idle = {} # (scheme, host, port) -> [_Connection, ...]
+    
+    def http_request(self, req):
+        # a no-op, but OpenerDirector.add_handler ignores (and never sets the
+        # parent of) handlers without any protocol methods, and we need the
+        # parent's processors in fetch
+        return req
+    
+    https_request = http_request
+    
+    def close_all(self):
+        """close all idle connections"""
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.sock.close()
+        self._idle = {}
+    
+    def open_connections(self):
+        return ["%s:%d" % key[1:] for key in self._idle if self._idle[key]]
+    
+    def fetch(self, reqs):
+        """Fetches every :class:`urllib.request.Request` in ``reqs`` at once,
+        giving back a list of responses in the same order. Requests go through
+        the opener's processors (cookies, headers) just like they would with
+        ``urlopen``. As with :meth:`lib.browser.Browser.load_page`, an
+        :class:`urllib.error.HTTPError` is given back in place of the
+        response, rather than being raised. Any request that fails on the
+        multiplexed connections is retried serially through the opener."""
+        reqs = [self._preprocess_request(req) for req in reqs]
+        exchanges = []
+        for req in reqs:
+            if req.type not in _default_ports:
+                raise ValueError("can't multiplex %s:// urls" % req.type)
+            exchanges.append(_Exchange(req, self._format_request(req)))
+        
+        _EventLoop(self, exchanges).run()
+        
+        results = []
+        for exchange in exchanges:
+            if exchange.response is not None:
+                results.append(self._postprocess_response(exchange.req,
+                                                          exchange.response))
+                continue
+            logger.debug("multiplexed request to %s failed, retrying "
+                         "serially" % exchange.req.get_full_url())
+            try:
+                results.append(self.parent.open(exchange.req))
+            except urllib.error.HTTPError as err:
+                results.append(err)
+        return results
+    
+    def _stats_host(self, key):
+        scheme, host, port = key
+        if port == _default_ports[scheme]:
+            return "%s://%s" % (scheme, host)
+        return "%s://%s:%d" % key
+
+class _EventLoop(object):
+    """Runs one :meth:`MultiplexHandler.fetch` batch to completion."""
+    
+    def __init__(self, handler, exchanges):
+        self.handler = handler
+        self.pending = collections.deque(exchanges)
+        self.selector = selectors.DefaultSelector()
+        self.active = set()
+        self.per_host = collections.Counter()
+    
+    def run(self):
+        try:
+            while self.pending or self.active:
+                self._start_pending()
+                if not self.active:
+                    break # nothing could be started; the rest go serial
+                for key, mask in self.selector.select(1.0):
+                    self._step(key.data)
+                self._expire()
+        finally:
+            for conn in list(self.active):
+                self._fail(conn, retry=False)
+            self.selector.close()
+    
+    # scheduling
+    def _start_pending(self):
+        handler = self.handler
+        skipped = []
+        while self.pending and len(self.active) < handler.max_connections:
+            exchange = self.pending.popleft()
+            if self.per_host[exchange.key] >= handler.max_per_host:
+                skipped.append(exchange)
+                continue
+            conn = self._get_connection(exchange.key)
+            if conn is None:
+                continue # couldn't resolve; left for the serial retry
+            self._assign(conn, exchange)
+        self.pending.extendleft(reversed(skipped))
+    
+    def _get_connection(self, key):
+        handler = self.handler
+        idle = handler._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if conn.sock.fileno() >= 0:
+                conn.reused = True
+                handler._record(handler._stats_host(key), "reused")
+                return conn
+        scheme, host, port = key
+        try:
+            addresses = list(handler._resolver.resolve(host, port))
+        except socket.error:
+            return None
+        conn = _Connection(key, None, addresses)
+        if not self._connect_next(conn):
+            return None
+        handler._record(handler._stats_host(key), "opened")
+        return conn
+    
+    def _connect_next(self, conn):
+        """Starts a non-blocking connect to the next address we have for
+        ``conn``. Returns ``False`` if we've run out of addresses."""
+        while conn.addresses:
+            af, socktype, proto, canonname, sa = conn.addresses.pop(0)
+            sock = None
+            try:
+                # (an address family we can't make sockets for fails here)
+                sock = socket.socket(af, socktype, proto)
+                sock.setblocking(False)
+                err = sock.connect_ex(sa)
+            except socket.error as e:
+                err = e.errno
+            if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                conn.sock = sock
+                conn.state = _CONNECTING
+                return True
+            if sock is not None:
+                sock.close()
+        return False
+    
+    def _assign(self, conn, exchange):
+        conn.exchange = exchange
+        conn.parser = _ResponseParser("GET" if exchange.req.data is None
+                                            else "POST")
+        conn.outbuf = memoryview(exchange.data)
+        conn.last_activity = time.time()
+        if conn.state != _CONNECTING:
+            conn.state = _SENDING
+        self.active.add(conn)
+        self.per_host[conn.key] += 1
+        self._register(conn, selectors.EVENT_WRITE)
+    
+    def _release(self, conn):
+        self._unregister(conn)
+        self.active.discard(conn)
+        self.per_host[conn.key] -= 1
+    
+    def _register(self, conn, events):
+        self.selector.register(conn.sock, events, conn)
+        conn.registered = True
+    
+    def _unregister(self, conn):
+        # safe to call twice, or after a failed connect has already swapped
+        # the socket out
+        if conn.registered:
+            conn.registered = False
+            self.selector.unregister(conn.sock)
+    
+    def _expire(self):
+        now = time.time()
+        for conn in list(self.active):
+            if now - conn.last_activity > self.handler.timeout:
+                self._fail(conn)
+    
+    # events
+    def _step(self, conn):
+        conn.last_activity = time.time()
+        try:
+            if conn.state == _CONNECTING:
+                self._on_connected(conn)
+            elif conn.state == _HANDSHAKING:
+                self._on_handshake(conn)
+            elif conn.state == _SENDING:
+                self._on_writable(conn)
+            else:
+                self._on_readable(conn)
+        except (socket.error, http.client.HTTPException, ValueError):
+            self._fail(conn)
+    
+    def _on_connected(self, conn):
+        err = conn.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            if not conn.addresses:
+                # _fail unregisters and closes the socket
+                raise socket.error(err, "connect failed")
+            self._unregister(conn)
+            conn.sock.close()
+            if not self._connect_next(conn):
+                raise socket.error(err, "connect failed")
+            self._register(conn, selectors.EVENT_WRITE)
+            return
+        if conn.key[0] == "https":
+            self._unregister(conn)
+            conn.sock = self.handler._ssl_context.wrap_socket(
+                conn.sock, server_hostname=conn.key[1],
+                do_handshake_on_connect=False
+            )
+            self._register(conn, selectors.EVENT_WRITE)
+            conn.state = _HANDSHAKING
+            self._on_handshake(conn)
+        else:
+            conn.state = _SENDING
+            self._on_writable(conn)
+    
+    def _on_handshake(self, conn):
+        try:
+            conn.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            self.selector.modify(conn.sock, selectors.EVENT_READ, conn)
+            return
+        except ssl.SSLWantWriteError:
+            self.selector.modify(conn.sock, selectors.EVENT_WRITE, conn)
+            return
+        conn.state = _SENDING
+        self.selector.modify(conn.sock, selectors.EVENT_WRITE, conn)
+    
+    def _on_writable(self, conn):
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except _would_block:
+            return
+        conn.outbuf = conn.outbuf[sent:]
+        if not len(conn.outbuf):
+            conn.state = _RECEIVING
+            self.selector.modify(conn.sock, selectors.EVENT_READ, conn)
+    
+    def _on_readable(self, conn):
+        parser = conn.parser
+        # read until the socket would block, as an ssl socket can hold on to
+        # decrypted data the selector doesn't know about
+        while True:
+            try:
+                data = conn.sock.recv(65536)
+            except _would_block:
+                return
+            if not data:
+                if conn.reused and not parser.received_any:
+                    # the server dropped our idle connection
+                    self.handler._record(
+                        self.handler._stats_host(conn.key), "failed_reuse"
+                    )
+                    self._fail(conn, retry=True)
+                    return
+                parser.eof()
+                self._finish(conn, keep=False)
+                return
+            if parser.feed(data):
+                self._finish(conn, keep=not parser.will_close)
+                return
+    
+    # completion
+    def _finish(self, conn, keep):
+        handler, exchange, parser = self.handler, conn.exchange, conn.parser
+        stats_host = handler._stats_host(conn.key)
+        handler._record(stats_host, "requests")
+        handler._record(stats_host, "bytes_read", len(parser.body))
+        response = urllib.response.addinfourl(
+            io.BytesIO(bytes(parser.body)), parser.headers,
+            exchange.req.get_full_url(), parser.status
+        )
+        response.msg = parser.reason # HTTPErrorProcessor wants this
+        exchange.response = response
+        self._release(conn)
+        conn.exchange = conn.parser = None
+        if keep:
+            conn.reused = False
+            handler._idle.setdefault(conn.key, []).append(conn)
+        else:
+            handler._record(stats_host, "closed_by_server")
+            conn.sock.close()
+    
+    def _fail(self, conn, retry=False):
+        """Gives up on a connection. With ``retry``, it's exchange goes back in
+        the queue (once) for a fresh connection; otherwise it's left for the
+        serial fallback in :meth:`MultiplexHandler.fetch`."""
+        exchange = conn.exchange
+        if conn in self.active:
+            self._release(conn)
+        conn.sock.close()
+        if retry and exchange is not None and not exchange.retried:
+            exchange.retried = True
+            self.pending.appendleft(exchange)
+
+_would_block = (BlockingIOError, InterruptedError) if ssl is None else \
+               (BlockingIOError, InterruptedError, ssl.SSLWantReadError,
+                ssl.SSLWantWriteError)
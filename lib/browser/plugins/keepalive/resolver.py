@@ -0,0 +1,85 @@
+"""An in-process DNS cache for the :mod:`lib.browser.plugins.keepalive`
+handlers. Resolving a hostname is a blocking call to the system's resolver, and
+when a keepalive connection gets dropped by the server, we'd otherwise pay for
+that lookup again on the reconnect. Entries are kept for a fixed time-to-live,
+as we have no access to the real TTL of the records through
+:func:`socket.getaddrinfo`.
+
+>>> from lib.browser.plugins.keepalive.resolver import DNSCache
+>>> cache = DNSCache(ttl=300)
+>>> sock = cache.create_connection(("www.ufl.edu", 80))
+
+..
+"""
+
+import socket
+import threading
+import time
+import logging
+
+logger = logging.getLogger("browser.plugins.keepalive.resolver")
+
+class DNSCache(object):
+    """Caches the results of :func:`socket.getaddrinfo` for ``ttl`` seconds.
+    Instances are safe to share between threads."""
+    
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {} # (host, port) -> (expiry time, addrinfo list)
+        self._lock = threading.Lock()
+    
+    def resolve(self, host, port):
+        """Returns the list of ``getaddrinfo`` results for a ``host`` and
+        ``port``, from the cache if we have a fresh entry."""
+        key = (host, port)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        logger.debug("Resolving %s:%s" % key)
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, infos)
+        return infos
+    
+    def invalidate(self, host=None, port=None):
+        """Drops the cached entry for a ``host`` and ``port``, or every entry if
+        no host is given."""
+        with self._lock:
+            if host is None:
+                self._entries = {}
+            else:
+                self._entries.pop((host, port), None)
+    
+    def create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                          source_address=None):
+        """A drop-in replacement for :func:`socket.create_connection`, which
+        uses cached addresses. If none of the cached addresses can be connected
+        to, the entry is thrown away, so the next attempt resolves again."""
+        host, port = address
+        err = None
+        for af, socktype, proto, canonname, sa in self.resolve(host, port):
+            sock = None
+            try:
+                sock = socket.socket(af, socktype, proto)
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sa)
+                return sock
+            except socket.error as e:
+                err = e
+                if sock is not None:
+                    sock.close()
+        
+        self.invalidate(host, port)
+        if err is not None:
+            raise err
+        raise socket.error("getaddrinfo returns an empty list")
+
+# shared by default between every handler in the process, so that separate
+# browsers benefit from each other's lookups
+default_cache = DNSCache()
@@ -0,0 +1,132 @@
+"""Timers and call counters for the functions plugins patch into a
+:class:`lib.browser.plugins.Pluggable` object, so you can find out which plugin
+is eating the time on a request. Profiling is off by default; to turn it on,
+make a browser with ``profile=True``, and look at its :attr:`profiler` after
+doing some work::
+    
+    browser = lib.browser.Browser(*plugins, profile=True)
+    browser.load_page("https://www.isis.ufl.edu/")
+    print(browser.profiler.format_table())
+
+..
+"""
+
+import threading
+import time
+
+class PluginStats(object):
+    """The numbers kept for each plugin (and for the :class:`Pluggable` object
+    itself, for the time spent in its own versions of the methods plugins
+    override)."""
+    
+    __slots__ = ("name", "owner", "calls", "self_time", "cumulative_time")
+    
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = owner
+        self.calls = 0
+        self.self_time = 0.
+        self.cumulative_time = 0.
+    
+    def as_dict(self):
+        """Gives the numbers as a dictionary."""
+        return {"name":self.name, "calls":self.calls,
+                "self_time":self.self_time,
+                "cumulative_time":self.cumulative_time}
+    
+    def __repr__(self):
+        return "<PluginStats %s: %d calls, %.6fs self, %.6fs cumulative>" % \
+               (self.name, self.calls, self.self_time, self.cumulative_time)
+
+class PluginProfiler(object):
+    """Wraps functions with timers, and keeps a :class:`PluginStats` for each
+    plugin they belong to.
+    
+    A call's *self time* is how long it took, less the time spent in any other
+    profiled calls it made (such as an override calling the function it
+    overrides), and so it's the time the plugin itself is responsible for. Its
+    *cumulative time* counts everything. When a plugin's functions call back
+    into themselves (say, a redirection plugin loading the page it was
+    redirected to), only the outermost call adds to its cumulative time. The
+    timings are kept separately for each thread, so calls from several threads
+    don't muddle each other's self times."""
+    
+    def __init__(self):
+        self.__stats = {} # id(owner) -> PluginStats
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+    
+    def wrap(self, owner, function):
+        """Gives a version of ``function`` that counts its calls and time
+        against ``owner`` (a plugin, or the :class:`Pluggable` object)."""
+        stats = self.__get_stats(owner)
+        local = self.__local
+        lock = self.__lock
+        clock = time.perf_counter
+        def timed(*args, **kwargs):
+            try:
+                frames, depths = local.frames, local.depths
+            except AttributeError:
+                frames, depths = local.frames, local.depths = [], {}
+            frame = [0.] # time spent in profiled calls made from this one
+            frames.append(frame)
+            depth = depths.get(stats, 0)
+            depths[stats] = depth + 1
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                frames.pop()
+                if frames:
+                    frames[-1][0] += elapsed
+                depths[stats] = depth
+                with lock:
+                    stats.calls += 1
+                    stats.self_time += elapsed - frame[0]
+                    if not depth:
+                        stats.cumulative_time += elapsed
+        timed.__doc__ = function.__doc__
+        return timed
+    
+    def wrap_property(self, owner, prop):
+        """Like :meth:`wrap`, but for the getter and setter of a
+        :class:`property`."""
+        return property(
+            None if prop.fget is None else self.wrap(owner, prop.fget),
+            None if prop.fset is None else self.wrap(owner, prop.fset),
+            None if prop.fdel is None else self.wrap(owner, prop.fdel),
+            prop.__doc__
+        )
+    
+    def __get_stats(self, owner):
+        with self.__lock:
+            try:
+                return self.__stats[id(owner)]
+            except KeyError:
+                stats = self.__stats[id(owner)] = \
+                        PluginStats(type(owner).__name__, owner)
+                return stats
+    
+    def stats(self):
+        """Gives a list of :class:`PluginStats`, one for each plugin (and one
+        for the :class:`Pluggable` object), with the most self time first."""
+        with self.__lock:
+            stats = list(self.__stats.values())
+        return sorted(stats, key=lambda s: s.self_time, reverse=True)
+    
+    def reset(self):
+        """Zeroes every plugin's numbers."""
+        with self.__lock:
+            for stats in self.__stats.values():
+                stats.calls = 0
+                stats.self_time = stats.cumulative_time = 0.
+    
+    def format_table(self):
+        """Gives :meth:`stats` as a printable table."""
+        lines = ["%-32s %10s %14s %14s" % ("plugin", "calls", "self (s)",
+                                           "cumulative (s)")]
+        for s in self.stats():
+            lines.append("%-32s %10d %14.6f %14.6f" %
+                         (s.name, s.calls, s.self_time, s.cumulative_time))
+        return "\n".join(lines)
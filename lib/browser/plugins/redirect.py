@@ -2,12 +2,180 @@ from . import BaseBrowserPlugin
 from .decorators import *
 from .. import parsers
 
+import urllib.request as urlreq
+import collections
+import threading
+import time
 import re
+import os
 import abc
 import logging
 
 logger = logging.getLogger("browser.plugins.redirect")
 
+class SignatureDetector(object):
+    """Finds which of a set of registered signatures appear near the start of
+    a page, with one pass over it. Redirection plugins are layered around every
+    page load, so if each of them ran its own regex over the whole page,
+    every large page (like a registrar table) would be scanned once per
+    plugin, and patterns with a leading ``.*`` can backtrack badly on them.
+    Instead, each plugin registers a short signature, all of them are compiled
+    into a single regex, and only the first ``scan_length`` bytes of the raw
+    page are scanned, without decoding it. Every signature is looked for in
+    its own lookahead, so ones that overlap, or that match at the same place
+    (like a signature and a longer one starting with it), are all found.
+    
+    Signatures are bytes regexes, matched case-insensitively. They should be
+    simple, without unbounded repetition of ``.``, like
+    ``br"<title>[^<]*GatorLink login"``."""
+    
+    def __init__(self, scan_length=16384):
+        self.scan_length = scan_length
+        self.__signatures = [] # in registration order
+        self.__combined = None
+    
+    def register(self, signature):
+        """Adds a signature to be looked for, and returns it. Registering the
+        same signature twice has no effect."""
+        if signature not in self.__signatures:
+            self.__signatures.append(signature)
+            self.__combined = None # recompile on the next scan
+        return signature
+    
+    def scan(self, source):
+        """Gives a :class:`frozenset` of the registered signatures found within
+        the first :attr:`scan_length` bytes of ``source``."""
+        if not self.__signatures:
+            return frozenset()
+        combined = self.__combined
+        if combined is None:
+            combined = self.__combined = self.__compile()
+        found = set()
+        for m in combined.finditer(source, 0, self.scan_length):
+            for i, signature in enumerate(self.__signatures):
+                if m.group("s%d" % i) is not None:
+                    found.add(signature)
+            if len(found) == len(self.__signatures):
+                break # nothing left to look for
+        return frozenset(found)
+    
+    def __compile(self):
+        # Signatures tend to all start with "<". Pulling a shared literal
+        # prefix out in front of the alternation lets the regex engine skip
+        # ahead to it, rather than trying every branch at every position.
+        prefix = os.path.commonprefix(self.__signatures)
+        prefix = _regex_literal_re.match(prefix).group()
+        if any(sig[len(prefix):len(prefix) + 1] in (b"*", b"+", b"?", b"{")
+               for sig in self.__signatures):
+            prefix = prefix[:-1] # the last byte has a quantifier on it
+        # Only the prefix is consumed, and everything after it is matched in
+        # lookaheads: first an alternation, so places where no signature
+        # starts are passed over quickly, then an optional lookahead capturing
+        # each signature, so they're all seen, even ones at the same place.
+        rests = [sig[len(prefix):] for sig in self.__signatures]
+        return re.compile(
+            re.escape(prefix) +
+            b"(?=" + b"|".join(b"(?:%s)" % rest for rest in rests) + b")" +
+            b"".join(b"(?:(?=(?P<s%d>%s))|)" % (i, rest)
+                     for i, rest in enumerate(rests)),
+            re.IGNORECASE
+        )
+
+# the part of a bytes regex at its start that has nothing but literal bytes
+_regex_literal_re = re.compile(br"[^\\.^$*+?{}\[\]|()]*")
+
+default_detector = SignatureDetector()
+
+class PageContext(object):
+    """A loaded page, as it's passed between the layers of redirection plugins.
+    Every :class:`BaseRedirectionPlugin` on a browser wraps
+    :meth:`lib.browser.Browser.load_page`, and each one needs to look at the
+    same response. Rather than each layer decoding the page for itself, the
+    innermost layer loads the page with this class as the parser, and the
+    resulting object is handed back out through the other layers, holding on
+    to the decoded text and any regex matches run against it.
+    
+    Because it takes the same arguments as a parser, the class itself can be
+    used as one. A redirection plugin made with ``parser=PageContext`` is
+    given the context itself as the ``source`` argument of
+    :meth:`BaseRedirectionPlugin.handle_redirect`."""
+    
+    def __init__(self, source, headers, url):
+        self.source = source
+        self.headers = headers
+        self.url = url
+        self.__text = None
+        self.__matches = {} # (pattern, method name) -> match object
+        self.__signatures = {} # detector -> signatures found
+    
+    def get_args(self):
+        """Gets the value of :attr:`args`."""
+        return (self.source, self.headers, self.url)
+    
+    args = property(get_args, doc="""
+        The arguments the page was parsed with, like the result of
+        :func:`lib.browser.parsers.passthrough_args`.""")
+    
+    def get_text(self):
+        """Gets the value of :attr:`text`, decoding the page the first time
+        it's called."""
+        if self.__text is None:
+            self.__text = parsers.passthrough_str(*self.args)
+        return self.__text
+    
+    text = property(get_text, doc="""
+        The page, decoded with :func:`lib.browser.parsers.passthrough_str`.""")
+    
+    def parse(self, parser):
+        """Gives the result of running ``parser`` on the page, reusing what
+        we've already got where we can."""
+        if parser is PageContext:
+            return self
+        if parser is parsers.passthrough_str:
+            return self.text
+        if parser is parsers.passthrough_args:
+            return self.args
+        return parser(*self.args)
+    
+    def has_signature(self, signature, detector=default_detector):
+        """``True`` if ``signature`` (which must have been registered with
+        ``detector``) was found near the start of the page. The first call
+        scans for every registered signature at once, and the rest are just
+        lookups."""
+        try:
+            found = self.__signatures[detector]
+        except KeyError:
+            found = self.__signatures[detector] = detector.scan(self.source)
+        return signature in found
+    
+    def match(self, pattern):
+        """Gives the result of ``pattern.match`` on :attr:`text`. The result is
+        cached, so every plugin matching against the same compiled pattern
+        shares one run of it."""
+        return self.__cached(pattern, "match")
+    
+    def search(self, pattern):
+        """Like :meth:`match`, but with ``pattern.search``."""
+        return self.__cached(pattern, "search")
+    
+    def __cached(self, pattern, method):
+        key = (pattern, method)
+        try:
+            return self.__matches[key]
+        except KeyError:
+            result = self.__matches[key] = getattr(pattern, method)(self.text)
+            return result
+
+def _finish_parsing(browser, context, kwargs):
+    """Gives what :meth:`lib.browser.Browser.load_page` would have, given the
+    keyword arguments it was called with, for a page we loaded as a
+    :class:`PageContext`."""
+    parser = kwargs["parser"] if "parser" in kwargs else None
+    if kwargs.get("executor") is not None:
+        return browser._parse_page_later(kwargs["executor"], parser,
+                                         *context.args)
+    return context.parse(browser.default_parser if parser is None else parser)
+
 class BaseRedirectionPlugin(BaseBrowserPlugin, metaclass=abc.ABCMeta):
     """Provides a simple framework for handling pages that require a redirection
     with a hope to reduce the necessity for so much boilerplate code. You don't
@@ -15,7 +183,7 @@ class BaseRedirectionPlugin(BaseBrowserPlugin, metaclass=abc.ABCMeta):
     easier."""
     
     def __init__(self, url_match=None, page_match=None,
-                 parser=parsers.passthrough_str):
+                 parser=parsers.passthrough_str, signature=None):
         """Keyword arguments:
         
         ``url_match``
@@ -27,17 +195,29 @@ class BaseRedirectionPlugin(BaseBrowserPlugin, metaclass=abc.ABCMeta):
             needs redirection.
         ``parser``
             A parser function that should be applied to the page data before
-            sending it to :meth:`handle_redirect`."""
+            sending it to :meth:`handle_redirect`. Passing :class:`PageContext`
+            gives :meth:`handle_redirect` the shared context itself.
+        ``signature``
+            A bytes regex that every page needing redirection has near its
+            start (see :class:`SignatureDetector`). It's checked before the
+            page is parsed or ``page_match`` is tried, and since every
+            plugin's signature is found in the same pass, most pages can be
+            passed over without being decoded at all."""
         BaseBrowserPlugin.__init__(self)
         self.__url_match = url_match
         self.__page_match = page_match
         self.__parser = parser
+        self.__signature = None if signature is None else \
+                           default_detector.register(signature)
     
     def __match(self, key, value):
         if key is None: return True # True if we have no key to check against
+        if isinstance(value, PageContext) and not callable(key):
+            if hasattr(key, "match"): return value.match(key) # shared regex
+            value = value.text
         if isinstance(key, str): return key == value # direct match
         if hasattr(key, "match"): return key.match(value) # regex
-        return self.__url_match(url) # callable: lambda or function
+        return key(value) # callable: lambda or function
     
     def _is_valid_url(self, url):
         """One can override this function as an alternative to providing a
@@ -54,29 +234,34 @@ class BaseRedirectionPlugin(BaseBrowserPlugin, metaclass=abc.ABCMeta):
     @override
     def load_page(plugin, browser, base_function, url, *args, **kwargs):
         """Calls :meth:`handle_redirect` if there is both a url and page match,
-        otherwise, it simply passes through."""
+        otherwise, it simply passes through. The page is loaded as a
+        :class:`PageContext`, which is shared with any other redirection
+        plugins wrapped around or within this one."""
         url = browser._simplify_url(url)
         if not plugin._is_valid_url(url):
             return base_function(url, *args, **kwargs)
         
         # mix around our arguments
         new_kwargs = dict(kwargs)
-        new_kwargs["parser"] = parsers.passthrough_args
+        new_kwargs["parser"] = PageContext
+        new_kwargs.pop("executor", None) # we need the page now, not later
         
-        # load the page
-        parser_args = base_function(url, *args, **new_kwargs)
-        if url != parser_args[2]:
-            url = browser._simplify_url(parser_args[2]) # update the url
+        # load the page (any redirection plugins below us give back the same
+        # context they looked at)
+        context = base_function(url, *args, **new_kwargs)
+        if url != context.url:
+            url = browser._simplify_url(context.url) # update the url
             if not plugin._is_valid_url(url):
                 return base_function(url, *args, **kwargs)
         
         # check that it's the right page before we waste time trying to
         # parse it
         def fallback():
-            return browser._parse_page(
-                kwargs["parser"] if "parser" in kwargs else None, *parser_args
-            )
-        parsed_page_src = plugin.__parser(*parser_args)
+            return _finish_parsing(browser, context, kwargs)
+        if plugin.__signature is not None and \
+           not context.has_signature(plugin.__signature):
+            return fallback()
+        parsed_page_src = context.parse(plugin.__parser)
         if not plugin._is_valid_page(parsed_page_src):
             return fallback()
         
@@ -115,7 +300,10 @@ class BrowserMetaRefreshHander(BaseRedirectionPlugin):
     
     ..  _meta refresh: http://www.w3.org/TR/WCAG10-HTML-TECHS/#meta-element"""
     def __init__(self, max_seconds=None):
-        BaseRedirectionPlugin.__init__(self, parser=parsers.passthrough_str)
+        BaseRedirectionPlugin.__init__(
+            self, parser=PageContext,
+            signature=br"""<meta[^>]+http-equiv=["']?refresh"""
+        )
         self._max_seconds = max_seconds
         
         # compile all the regex patterns we use in handle_redirect
@@ -129,9 +317,9 @@ class BrowserMetaRefreshHander(BaseRedirectionPlugin):
         self._url_re = re.compile(r"""(?<=url=).+""")
     
     
-    def handle_redirect(plugin, browser, base_url, source, *args, **kwargs):
+    def handle_redirect(plugin, browser, base_url, context, *args, **kwargs):
         # look for a <meta> tag with the refresh property
-        meta_tag = plugin._meta_re.search(source)
+        meta_tag = context.search(plugin._meta_re)
         if not meta_tag: return None # not a match
         meta_tag = meta_tag.group()
         
@@ -158,3 +346,156 @@ class BrowserMetaRefreshHander(BaseRedirectionPlugin):
             new_url = base_url
         
         return browser.load_page(new_url, *args, **kwargs)
+
+
+class _RedirectChain(object):
+    """Where a url was last seen to end up, and under what conditions."""
+    
+    __slots__ = ("final_url", "cookie_names", "recorded", "hits")
+    
+    def __init__(self, final_url, cookie_names):
+        self.final_url = final_url
+        self.cookie_names = cookie_names
+        self.recorded = time.time()
+        self.hits = 0
+
+class RedirectChainCache(BaseBrowserPlugin):
+    """Remembers where pages redirected to, so the next load of the same url
+    can go straight to where it ended up, skipping the round trips in between.
+    Many of UF's pages (on ISIS and the phonebook, for example) always bounce
+    through the same meta refreshes and Shibboleth hops before landing on the
+    real page.
+    
+    This plugin must be loaded after (and so wrapped around) every other
+    redirection plugin, so that it sees whole chains. A chain is only
+    recorded for plain ``GET`` loads. Along with its final url, we remember
+    the names of the cookies that were being sent to that url, and a shortcut
+    is only taken while those cookies are all still there (a logout, or an
+    expired session, sends us back through the whole chain). If a shortcut
+    doesn't land where it was supposed to, it's forgotten, and the original
+    url is loaded as normal, and its chain is never recorded again (some
+    chains end somewhere different every time).
+    
+    *Keyword arguments:*
+    
+    ``max_age``
+        How many seconds a chain is trusted for after it's recorded.
+    ``max_chains``
+        How many chains to remember. The oldest are forgotten first.
+    """
+    
+    def __init__(self, max_age=3600, max_chains=256):
+        BaseBrowserPlugin.__init__(self)
+        self._max_age = max_age
+        self._max_chains = max_chains
+        self._chains = collections.OrderedDict() # url -> _RedirectChain
+        self._unstable = set() # urls whose shortcuts have failed before
+        self._skipped = set() # see skip_redirect_chain
+        # loads happen on many threads at once; guards the three above
+        self._lock = threading.Lock()
+    
+    @override
+    def load_page(plugin, browser, base_function, url, *args, **kwargs):
+        """Goes straight to the end of a known redirect chain, if we have a
+        valid one for ``url``, and otherwise records the chain ``url`` goes
+        through."""
+        if args or kwargs.get("data") is not None or "://" not in url:
+            return base_function(url, *args, **kwargs) # only plain GETs
+        url = browser._simplify_url(url)
+        with plugin._lock:
+            skipped = url in plugin._skipped
+        if skipped:
+            return base_function(url, **kwargs)
+        new_kwargs = dict(kwargs)
+        new_kwargs["parser"] = PageContext
+        new_kwargs.pop("executor", None) # we need the page now, not later
+        
+        chain = plugin.__lookup(browser, url)
+        if chain is not None:
+            context = base_function(chain.final_url, **new_kwargs)
+            if browser._simplify_url(context.url) == chain.final_url:
+                with plugin._lock:
+                    chain.hits += 1
+                logger.debug("Took a shortcut from %s to %s" %
+                             (url, chain.final_url))
+                return _finish_parsing(browser, context, kwargs)
+            logger.info("Shortcut from %s to %s failed, forgetting it" %
+                        (url, chain.final_url))
+            with plugin._lock:
+                plugin._chains.pop(url, None)
+                plugin._unstable.add(url)
+        
+        context = base_function(url, **new_kwargs)
+        final_url = browser._simplify_url(context.url)
+        if final_url != url:
+            plugin.__record(browser, url, final_url)
+        return _finish_parsing(browser, context, kwargs)
+    
+    @extension
+    def forget_redirect_chains(plugin, browser):
+        """A :func:`lib.browser.plugins.decorators.extension` that forgets
+        every recorded redirect chain."""
+        with plugin._lock:
+            plugin._chains.clear()
+            plugin._unstable.clear()
+    
+    @extension
+    def skip_redirect_chain(plugin, browser, url):
+        """A :func:`lib.browser.plugins.decorators.extension` that makes every
+        load of ``url`` go through its whole redirect chain, for urls that are
+        only loaded for the sake of the round trips along the way (like
+        :class:`lib.browser.plugins.uf.login.LoginBrowserPlugin`'s session
+        refreshes). Unlike a chain that's failed, this isn't undone by
+        :meth:`forget_redirect_chains`."""
+        url = browser._simplify_url(url)
+        with plugin._lock:
+            plugin._skipped.add(url)
+            plugin._chains.pop(url, None)
+    
+    @extension
+    def redirect_chains(plugin, browser):
+        """A :func:`lib.browser.plugins.decorators.extension` giving a
+        dictionary mapping each url we have a chain for to a tuple of
+        ``(final_url, shortcuts_taken)``."""
+        with plugin._lock:
+            return dict((url, (chain.final_url, chain.hits))
+                        for url, chain in plugin._chains.items())
+    
+    def __lookup(self, browser, url):
+        with self._lock:
+            chain = self._chains.get(url)
+            if chain is None:
+                return None
+            if time.time() - chain.recorded > self._max_age:
+                del self._chains[url]
+                return None
+        if not chain.cookie_names <= _cookie_names(browser, chain.final_url):
+            return None # logged out, or the session expired; keep it though
+        return chain
+    
+    def __record(self, browser, url, final_url):
+        chain = _RedirectChain(final_url, _cookie_names(browser, final_url))
+        with self._lock:
+            if url in self._unstable or url in self._skipped:
+                return # (it failed, or was skipped, while we were loading it)
+            logger.debug("Recording redirect chain from %s to %s" %
+                         (url, final_url))
+            self._chains.pop(url, None)
+            self._chains[url] = chain
+            while len(self._chains) > self._max_chains:
+                self._chains.popitem(last=False)
+
+def _cookie_names(browser, url):
+    """Gives a frozenset of the names of the cookies the browser would send
+    with a request to ``url``, or an empty one if it doesn't handle
+    cookies."""
+    jar = getattr(browser, "cookie_jar", None)
+    if jar is None:
+        return frozenset()
+    request = urlreq.Request(url)
+    jar.add_cookie_header(request)
+    header = request.get_header("Cookie")
+    if not header:
+        return frozenset()
+    return frozenset(pair.split("=", 1)[0].strip()
+                     for pair in header.split(";"))
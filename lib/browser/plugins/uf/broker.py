@@ -0,0 +1,296 @@
+"""Lets many worker processes share one set of GatorLink logins. A
+:class:`SessionBroker` owns a browser with the login plugins, logs in, keeps
+its session going, and hands out copies of its cookies over a Unix socket.
+Workers use a :class:`BrokeredLoginPlugin` in place of
+:class:`lib.browser.plugins.uf.login.LoginBrowserPlugin`, which asks the
+broker for a session whenever it runs into the GatorLink login page, so the
+password is only ever sent by the broker, once per session, rather than by
+every process::
+    
+    # in the broker process
+    broker = SessionBroker("/tmp/uf-sessions.sock", username, password)
+    broker.serve_forever()
+    
+    # in each worker
+    browser = lib.browser.Browser(
+        cookies.CookieBrowserPlugin(),
+        broker.BrokeredLoginPlugin("/tmp/uf-sessions.sock"),
+        login.LoginContinueRedirect(), ...
+    )
+    browser.uf_fetch_session() # optional; otherwise done on the first login
+
+The broker can also be run by itself, with
+``python -m lib.browser.plugins.uf.broker SOCKET_PATH``.
+
+Requests and responses are single lines of JSON. A worker can ask for a
+``"snapshot"`` of the broker's cookies, or for a ``"refresh"``, when a url
+gave it the login page, in which case the broker loads that url itself
+(logging in if it has to) before answering. Each answer carries a generation
+number, which goes up every time the broker loads something for a worker, so
+when lots of workers find their session gone at once, only the first has the
+broker do anything; the rest are just given its new cookies."""
+
+from .login import LoginBrowserPlugin, LoginError, shibboleth_hosts, \
+                   default_services
+from ..cookies import _cookie_to_row, _row_to_cookie
+from ..redirect import PageContext
+from ..decorators import *
+
+import socketserver
+import threading
+import socket
+import json
+import os
+import logging
+
+logger = logging.getLogger("browser.plugins.uf.broker")
+
+class BrokerError(Exception):
+    """Raised by a :class:`SessionBrokerClient` when the broker couldn't do
+    what it was asked."""
+    pass
+
+class SessionBroker(object):
+    """Owns the GatorLink logins for a fleet of workers, and serves copies of
+    its cookies to them over a Unix socket (see the module documentation).
+    
+    *Keyword arguments:*
+    
+    ``socket_path``
+        Where to make the socket. Any file already there is replaced. Only the
+        broker's user can connect to it, since the cookies it hands out are as
+        good as a password.
+    ``username``, ``password``
+        The GatorLink account to log in with.
+    ``services``
+        Urls of services that need logging in to. They're loaded when the
+        broker starts (see :meth:`warm_up`). The first is also the page loaded
+        to keep the GatorLink session going (see ``uf_set_session_refresh``
+        in :class:`lib.browser.plugins.uf.login.LoginBrowserPlugin`).
+    ``refresh_margin``
+        How many seconds before the GatorLink session runs out it should be
+        refreshed.
+    ``browser``
+        The browser to use, if not one from
+        :func:`lib.browser.get_new_uf_browser`. It needs
+        :class:`lib.browser.plugins.uf.login.LoginBrowserPlugin`.
+    """
+    
+    def __init__(self, socket_path, username, password,
+                 services=default_services, refresh_margin=300, browser=None):
+        if browser is None:
+            from ... import get_new_uf_browser
+            browser = get_new_uf_browser()
+        self.socket_path = socket_path
+        self.services = tuple(services)
+        self.browser = browser
+        self.browser.uf_set_autologin(username, password)
+        self._generation = 0
+        # one page load at a time, whether for a worker or a refresh
+        self._lock = threading.Lock()
+        self._server = None
+        self.browser.uf_set_session_refresh(margin=refresh_margin,
+                                            url=self.services[0],
+                                            refresher=self.__refresh_session)
+    
+    def warm_up(self):
+        """Loads all of :attr:`services` at once, logging in to them as needed
+        (see ``uf_warmup`` in
+        :class:`lib.browser.plugins.uf.login.LoginBrowserPlugin`)."""
+        with self._lock:
+            logger.debug("Warming up %s" % ", ".join(self.services))
+            self.browser.uf_warmup(self.services)
+            self._generation += 1
+    
+    def __refresh_session(self):
+        # run by the browser's background refresh timer
+        with self._lock:
+            self.browser.uf_refresh_session()
+            self._generation += 1
+    
+    def __load(self, url):
+        logger.debug("Loading %s for the workers" % url)
+        self.browser.load_page(url, parser=PageContext, record_history=False)
+        self._generation += 1
+    
+    def snapshot(self):
+        """Gives the generation number, and a list of the broker's cookies, as
+        lists of their fields (see
+        :func:`lib.browser.plugins.cookies._cookie_to_row`)."""
+        return self._generation, [_cookie_to_row(cookie)
+                                  for cookie in self.browser.cookie_jar]
+    
+    def refresh(self, url, generation):
+        """Loads ``url``, unless the broker has loaded something since the
+        snapshot a worker's ``generation`` came from, and gives a new
+        :meth:`snapshot`."""
+        with self._lock:
+            if generation >= self._generation:
+                self.__load(url)
+            return self.snapshot()
+    
+    def start(self):
+        """Loads the services, and starts answering requests in a background
+        thread."""
+        self.warm_up()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        # made with the right permissions, rather than fixed afterwards, so
+        # nobody else can connect in between
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _BrokerServer(self.socket_path, _BrokerHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.broker = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info("Serving sessions on %s" % self.socket_path)
+    
+    def serve_forever(self):
+        """Like :meth:`start`, but answers requests until :meth:`close` is
+        called (from another thread)."""
+        self.start()
+        self._server.shutdown_event.wait()
+    
+    def close(self):
+        """Stops answering requests (and refreshing the session), and removes
+        the socket."""
+        self.browser.uf_set_session_refresh(enabled=False)
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server.shutdown_event.set()
+        self._server = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+class _BrokerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    
+    def __init__(self, *args, **kwargs):
+        socketserver.ThreadingUnixStreamServer.__init__(self, *args, **kwargs)
+        self.shutdown_event = threading.Event()
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode())
+                command = request.get("command")
+                if command == "snapshot":
+                    generation, cookies = broker.snapshot()
+                elif command == "refresh":
+                    generation, cookies = broker.refresh(
+                        request["url"], request.get("generation", -1)
+                    )
+                else:
+                    raise ValueError("Unknown command %r" % command)
+                response = {"generation":generation, "cookies":cookies}
+            except Exception as e:
+                logger.exception("Couldn't answer %r" % line)
+                response = {"error":type(e).__name__, "message":str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+class SessionBrokerClient(object):
+    """Talks to a :class:`SessionBroker` over its socket. Each request is made
+    on a new connection, so a client can be used from any thread, or after a
+    fork."""
+    
+    def __init__(self, socket_path, timeout=120):
+        self.socket_path = socket_path
+        self.timeout = timeout
+    
+    def snapshot(self):
+        """Gives the broker's generation number, and a list of copies of its
+        :class:`http.cookiejar.Cookie` objects."""
+        return self.__request({"command":"snapshot"})
+    
+    def refresh(self, url, generation=-1):
+        """Tells the broker ``url`` gave us the login page, with the cookies
+        from the snapshot numbered ``generation``, and gives a new snapshot
+        (like :meth:`snapshot`)."""
+        return self.__request({"command":"refresh", "url":url,
+                               "generation":generation})
+    
+    def __request(self, request):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        if not line:
+            raise BrokerError("The broker hung up without answering")
+        response = json.loads(line.decode())
+        if "error" in response:
+            if response["error"] == "LoginError":
+                raise LoginError()
+            raise BrokerError("%s: %s" % (response["error"],
+                                          response["message"]))
+        return response["generation"], [_row_to_cookie(row)
+                                        for row in response["cookies"]]
+
+class BrokeredLoginPlugin(LoginBrowserPlugin):
+    """Used in place of
+    :class:`lib.browser.plugins.uf.login.LoginBrowserPlugin` in a worker. When
+    a page loaded from ``hosts`` turns out to be the GatorLink login page,
+    rather than logging in, it asks the :class:`SessionBroker` at
+    ``socket_path`` for a session, copies its cookies into the browser's jar,
+    and loads the page again. Like
+    :class:`lib.browser.plugins.uf.login.LoginBrowserPlugin`, when several
+    threads run into the login page at once, only one of them asks."""
+    
+    def __init__(self, socket_path, hosts=shibboleth_hosts):
+        LoginBrowserPlugin.__init__(self, hosts)
+        self._client = SessionBrokerClient(socket_path)
+        self._generation = -1 # we haven't had a snapshot yet
+        self._auto_login = True
+    
+    @extension
+    def uf_fetch_session(plugin, browser):
+        """A :func:`lib.browser.plugins.decorators.extension` that copies the
+        broker's cookies into the browser's jar, so the first page loads don't
+        have to run into the login page to get them."""
+        plugin.__install(browser, plugin._client.snapshot())
+    
+    def _log_in(self, browser, url, *args, **kwargs):
+        # the first time, we might just be given cookies we didn't have yet,
+        # but if the broker's own session is what's run out, those don't
+        # help, and the next time we ask, it loads the url for us
+        if sum(u == url for u, started in self._local.requests) > 2:
+            raise BrokerError("The broker's session didn't work for %s" % url)
+        logger.debug("Asking the broker for a session for %s" % url)
+        self.__install(browser, self._client.refresh(url, self._generation))
+        return None # load url again, with the new cookies
+    
+    def __install(self, browser, snapshot):
+        self._generation, cookies = snapshot
+        jar = browser.cookie_jar
+        for cookie in cookies:
+            jar.set_cookie(cookie)
+
+def main(argv):
+    import getpass
+    logging.basicConfig(level=logging.INFO)
+    if len(argv) != 2:
+        print("Usage: %s SOCKET_PATH" % argv[0])
+        return 2
+    username = input("Username? ")
+    password = getpass.getpass("Password: ")
+    broker = SessionBroker(argv[1], username, password)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        broker.close()
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv))
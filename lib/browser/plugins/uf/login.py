@@ -2,40 +2,106 @@
 `Shibboleth <https://www.youtube.com/watch?v=HlsnToZLD3k>`_ related GatorLink
 logins."""
 
-from ..redirect import BaseRedirectionPlugin
+from ..redirect import BaseRedirectionPlugin, PageContext, _finish_parsing
 from ..decorators import *
-from ... import parsers
+from ..cookies import find_cookie
 
+import concurrent.futures
+import urllib.parse as urlpar
 import html.parser
+import threading
+import weakref
+import time
 import re
 import logging
 
 logger = logging.getLogger("browser.plugins.uf.login")
+
+# The hosts we know to send people through a GatorLink login. Pages elsewhere
+# (like the registrar's) never need it, so the login plugins stay out of the
+# way of loads from anywhere else (see lib.browser.plugins.BaseBrowserPlugin.
+# hosts).
+shibboleth_hosts = ("login.ufl.edu", "www.isis.ufl.edu", "phonebook.ufl.edu")
+# where the identity provider keeps our login state, as (host, path, name)
+_session_cookie = ("login.ufl.edu", "/idp", "JSESSIONID")
+# the Shibboleth service providers we use (see uf_warmup)
+default_services = ("https://www.isis.ufl.edu/cgi-bin/nirvana",
+                    "https://phonebook.ufl.edu/private/people/search")
+_login_cookies = (_session_cookie, ("login.ufl.edu", "/", "UF_GSM"))
 _html_unescape = lambda data: html.parser.HTMLParser.unescape(None, data)
 
+def _force_login_url(url):
+    """Gives the url of the Shibboleth login for ``url``'s service provider,
+    which has the identity provider authenticate us again (even though it
+    already has a session for us), and then takes us to ``url``."""
+    scheme, host = urlpar.urlsplit(url)[:2]
+    return "%s://%s/Shibboleth.sso/Login?%s" % (
+        scheme, host, urlpar.urlencode([("forceAuthn", "true"),
+                                        ("target", url)])
+    )
+
 class LoginBrowserPlugin(BaseRedirectionPlugin):
     """Can handle pages asking for your GatorLink login information using the
     standard Shibboleth-based form. It works in 99% of login cases, and can even
     be set up to enter one's password completely automatically, acting like a
     simple redirect."""
     
-    def __init__(self):
+    def __init__(self, hosts=shibboleth_hosts):
         """Instantiates a plugin instance, without any login information. To
-        enable automatic logins, call :meth:`uf_set_autologin`."""
-        page_match = re.compile(r'.*\<title\>.*?GatorLink login.*?\</title\>.*?'
-                                r'\<body\>.*?Enter your GatorLink username and '
-                                r'password.*?\</body\>',
-                                re.IGNORECASE | re.DOTALL)
-        BaseRedirectionPlugin.__init__(self, page_match=page_match,
-                                       parser=parsers.passthrough_str)
-        self._uf_session_cookie = None
+        enable automatic logins, call :meth:`uf_set_autologin`. Only pages
+        loaded from ``hosts`` are checked for a login form (see
+        :attr:`lib.browser.plugins.BaseBrowserPlugin.hosts`); pass ``None`` to
+        check every page."""
+        # the title is checked for with the other plugins' signatures, so
+        # only pages that have it are searched for the login prompt
+        prompt_re = re.compile(r'Enter your GatorLink username and password',
+                               re.IGNORECASE)
+        BaseRedirectionPlugin.__init__(
+            self, page_match=lambda context: context.search(prompt_re),
+            parser=PageContext, signature=br"<title>[^<]*GatorLink login"
+        )
+        self.hosts = hosts
+        self._prompt_re = prompt_re
         self._login_url = "https://login.ufl.edu/idp/Authn/UserPassword"
         self._auto_login = False
         self.__username = None
         self.__password = None
+        # background session refreshing (see uf_set_session_refresh)
+        self._refresh_margin = None # seconds before expiry, None if disabled
+        self._refresh_url = "https://www.isis.ufl.edu/cgi-bin/nirvana"
+        self._session_lifetime = 30 * 60
+        self._session_started = None
+        self._refresh_timer = None
+        self._refresh_lock = threading.Lock()
+        self._refresher = None # called in place of uf_refresh_session
+        # single-flight logins (see handle_redirect)
+        self._login_lock = threading.Lock()
+        self._login_flight = None # a Future, while a login is happening
+        self._last_login = 0. # when the last automatic login finished
+        self._local = threading.local() # .requests and .logging_in
     
     def _is_valid_url(self, url):
-        return self._auto_login# and url == self._login_url
+        # a login's own pages are checked by uf_login instead
+        return self._auto_login and not getattr(self._local, "logging_in",
+                                                False)
+    
+    @override
+    def load_page(plugin, browser, base_function, url, *args, **kwargs):
+        """Works like :meth:`BaseRedirectionPlugin.load_page`, but remembers
+        which url was asked for, and when, so that :meth:`handle_redirect` can
+        retry the request if it ran into a login someone else is taking care
+        of."""
+        try:
+            requests = plugin._local.requests
+        except AttributeError:
+            requests = plugin._local.requests = []
+        requests.append((url, time.time()))
+        try:
+            return BaseRedirectionPlugin.load_page(plugin, browser,
+                                                   base_function, url, *args,
+                                                   **kwargs)
+        finally:
+            requests.pop()
     
     @property_extension
     def uf_username(plugin, browser):
@@ -79,14 +145,153 @@ class LoginBrowserPlugin(BaseRedirectionPlugin):
         """A :func:`lib.browser.plugins.decorators.property_extension` that can
         get (but not set) a :class:`http.cookiejar.Cookie` object containing the
         login state. If we have not not logged in, or our session is expired,
-        gives ``None``."""
+        gives ``None``. The cookie is looked up in the browser's jar by its
+        domain, path and name, so this is cheap however full the jar is (with
+        a :class:`lib.browser.plugins.cookies.IndexedCookieJar`), and it sees
+        sessions started by other browsers sharing the jar."""
+        def getter():
+            return find_cookie(browser.cookie_jar, *_session_cookie)
+        return property(getter)
+    
+    @property_extension
+    def uf_session_expires(plugin, browser):
+        """A :func:`lib.browser.plugins.decorators.property_extension` giving
+        when (as a :func:`time.time` timestamp) the GatorLink session in
+        :meth:`uf_session_cookie` should run out, or ``None`` if we aren't
+        logged in. That's the cookie's own expiry, if it has one, and
+        otherwise the session lifetime (see :meth:`uf_set_session_refresh`)
+        after our last login."""
         def getter():
-            c = plugin._uf_session_cookie
-            if c is not None and not c.is_expired():
-                return c
-            return None
+            cookie = browser.uf_session_cookie
+            if cookie is None:
+                return None
+            if cookie.expires is not None:
+                return cookie.expires
+            if plugin._session_started is None:
+                return None # someone else logged in; we can't know
+            return plugin._session_started + plugin._session_lifetime
         return property(getter)
     
+    @property_extension
+    def uf_session_started(plugin, browser):
+        """A :func:`lib.browser.plugins.decorators.property_extension` giving
+        when (as a :func:`time.time` timestamp) our last login, or session
+        refresh, started, or ``None`` if we haven't logged in. It can be set,
+        to carry a session on in another browser given the same cookies (like
+        :class:`lib.browser.sessions.SessionManager` does), and setting it
+        restarts the background refresh timer, if refreshing is enabled (see
+        :meth:`uf_set_session_refresh`)."""
+        def getter():
+            return plugin._session_started
+        def setter(val):
+            plugin._session_started = val
+            plugin._schedule_refresh(browser)
+        return property(getter, setter)
+    
+    @extension
+    def uf_set_session_refresh(plugin, browser, margin=300, lifetime=None,
+                               url=None, enabled=True, refresher=None):
+        """A :func:`lib.browser.plugins.decorators.extension` that can be used
+        to enable or disable refreshing the GatorLink session in the
+        background, ``margin`` seconds before :meth:`uf_session_expires`, so
+        running tasks don't have to stop and log in again when it runs out.
+        Each refresh is a :meth:`uf_refresh_session` through ``url`` (an ISIS
+        page, by default), so this needs automatic logins (see
+        :meth:`uf_set_autologin`). If the session cookie doesn't say when it
+        expires, it's taken to last ``lifetime`` seconds (30 minutes, if never
+        set). If something else needs to know about refreshes (like a
+        :class:`lib.browser.plugins.uf.broker.SessionBroker`), it can pass a
+        ``refresher``, a function with no arguments that's called to do each
+        one instead, and which should call :meth:`uf_refresh_session` itself."""
+        with plugin._refresh_lock:
+            plugin._refresh_margin = margin if enabled else None
+            if lifetime is not None:
+                plugin._session_lifetime = lifetime
+            if url is not None:
+                plugin._refresh_url = url
+            if refresher is not None:
+                plugin._refresher = refresher
+        plugin._schedule_refresh(browser)
+    
+    def _schedule_refresh(self, browser, delay=None):
+        """(Re)starts the timer for the next background refresh, or stops it if
+        refreshing is disabled, or there's no session to refresh."""
+        with self._refresh_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            if self._refresh_margin is None:
+                return
+            if delay is None:
+                expires = browser.uf_session_expires
+                if expires is None:
+                    return
+                delay = max(0, expires - self._refresh_margin - time.time())
+            logger.debug("Refreshing the session in %d seconds" % delay)
+            # only a weak reference, so the timer doesn't keep a browser
+            # nobody else is using alive
+            self._refresh_timer = threading.Timer(delay, self._refresh,
+                                                  (weakref.ref(browser),))
+            self._refresh_timer.daemon = True
+            self._refresh_timer.start()
+    
+    def _refresh(self, browser_ref):
+        browser = browser_ref()
+        margin = self._refresh_margin
+        if browser is None or margin is None:
+            return # the browser is gone, or refreshing was turned off
+        expires = browser.uf_session_expires
+        if expires is None:
+            return # logged out
+        if expires - margin > time.time():
+            # it's been refreshed since the timer was set (maybe by another
+            # browser sharing the cookie jar)
+            return self._schedule_refresh(browser)
+        if not self._auto_login:
+            logger.warning("Can't refresh the session without automatic "
+                           "logins; see uf_set_autologin")
+            return
+        logger.debug("Refreshing the session")
+        try:
+            if self._refresher is not None:
+                self._refresher()
+            else:
+                browser.uf_refresh_session()
+        except Exception:
+            logger.exception("Refreshing the session failed")
+        else:
+            expires = browser.uf_session_expires
+            if expires is None or expires - margin > time.time():
+                return self._schedule_refresh(browser)
+            logger.warning("Refreshing didn't extend the session")
+        # try again soon, while there's still time
+        self._schedule_refresh(browser, delay=min(60, margin / 4))
+    
+    @extension
+    def uf_refresh_session(plugin, browser):
+        """A :func:`lib.browser.plugins.decorators.extension` that renews the
+        GatorLink session straight away. The service provider of the refresh
+        url (see :meth:`uf_set_session_refresh`) sends us back through the
+        identity provider, asking it to authenticate us again, and if it wants
+        a password, we log in like we normally would. The old session is left
+        alone until then, so other threads can keep using it. Raises
+        :class:`LoginError` if we're left at the login page."""
+        started = time.time()
+        url = _force_login_url(plugin._refresh_url)
+        skip_redirect_chain = getattr(browser, "skip_redirect_chain", None)
+        if skip_redirect_chain is not None:
+            # a shortcut would never reach the identity provider
+            skip_redirect_chain(url)
+        context = browser.load_page(url, parser=PageContext,
+                                    record_history=False)
+        if context.search(plugin._prompt_re):
+            raise LoginError() # (where we end up without automatic logins)
+        # whether we logged in again, or the identity provider just renewed
+        # the session it had, it's good from when we started
+        if plugin._session_started is None or \
+           plugin._session_started < started:
+            plugin._session_started = started
+    
     @extension
     def uf_login(plugin, browser, username, password, *args, **kwargs):
         """A :func:`lib.browser.plugins.decorators.extension` that will submit a
@@ -97,18 +302,23 @@ class LoginBrowserPlugin(BaseRedirectionPlugin):
         password, however the chance of that is quite rare. This function does
         not load the login page, nor does it need to, it simply submits the
         login form as though it had already loaded the login page."""
-        # suspend automatic login, so we can catch a possible failed login
-        al = plugin._auto_login
-        plugin._auto_login = False
+        # suspend automatic login (in this thread only, since others might be
+        # waiting on us), so we can catch a possible failed login
+        plugin._local.logging_in = True
         
         new_kwargs = dict(kwargs)
-        new_kwargs["parser"] = parsers.passthrough_args
-        result = browser.submit("POST", plugin._login_url,
-                                [("j_username", username),
-                                 ("j_password", password),
-                                 ("login", "Login")],
-                                *args, **new_kwargs)
-        source = parsers.passthrough_str(*result)
+        new_kwargs["parser"] = PageContext
+        new_kwargs.pop("executor", None) # we need the page now, not later
+        try:
+            result = browser.submit("POST", plugin._login_url,
+                                    [("j_username", username),
+                                     ("j_password", password),
+                                     ("login", "Login")],
+                                    *args, **new_kwargs)
+        finally:
+            # restore automatic login
+            plugin._local.logging_in = False
+        source = result.text
         
         # check to see if we had a bad username/password combo
         if "Your username or password is incorrect. Please try again." in \
@@ -118,49 +328,102 @@ class LoginBrowserPlugin(BaseRedirectionPlugin):
         if "An error occurred while processing your request." in source:
             raise LoginError()
         
-        plugin._uf_session_cookie = plugin.__get_login_cookie(
-            browser.cookie_jar
-        )
+        plugin._session_started = time.time()
+        plugin._schedule_refresh(browser)
         
-        # restore automatic login
-        plugin._auto_login = al
+        return _finish_parsing(browser, result, kwargs)
+    
+    @extension
+    def uf_warmup(plugin, browser, services=default_services, executor=None):
+        """A :func:`lib.browser.plugins.decorators.extension` that loads each
+        of ``services`` (urls of Shibboleth service providers, ISIS and the
+        private phonebook by default) all at once, without recording them in
+        the history. Called right after :meth:`uf_login`, this gets the SAML
+        handshake each of them needs (see :class:`LoginContinueRedirect`) out
+        of the way, so the first real request to each goes straight to its
+        content. Without a login, it logs in first, if automatic logins are
+        enabled.
         
-        return browser._parse_page(
-            kwargs["parser"] if "parser" in kwargs else None, *result
-        )
+        Gives a list of the urls each service ended up at. If ``executor``
+        (a :class:`concurrent.futures.Executor`) is given, the pages are loaded
+        with it, and a list of :class:`concurrent.futures.Future` objects is
+        given back straight away instead."""
+        def warm(url):
+            return browser.load_page(url, parser=PageContext,
+                                     record_history=False).url
+        if executor is not None:
+            return [executor.submit(warm, url) for url in services]
+        services = list(services)
+        if not services:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(len(services)) as pool:
+            futures = [pool.submit(warm, url) for url in services]
+        return [future.result() for future in futures]
     
     def handle_redirect(plugin, browser, base_url, source, *args, **kwargs):
         """If ``plugin``'s :attr:`_auto_login` is ``True``, handles a login page
-        automatically."""
-        return browser.uf_login(browser.uf_username, browser.uf_password, *args,
-               **kwargs)
-    
-    def __get_login_cookie(self, jar):
-        last_expiration = 0
-        last_cookie = None
-        for cookie in jar:
-            if not cookie.is_expired() and cookie.path == "/idp" and \
-               cookie.name == "JSESSIONID":
-                if not cookie.is_expired(last_expiration):
-                    last_expiration = cookie.expires
-                    last_cookie = cookie
-            return cookie
+        automatically.
+        
+        Only one automatic login happens at a time. If several threads run into
+        the login page together (say, when a shared session runs out), the
+        first logs in, and the rest wait for it, then retry the requests that
+        landed them on the login page, using the new session. If the login
+        fails, they get its :class:`LoginError` too. A request that started
+        before the last login finished is retried the same way, rather than
+        logging in again."""
+        url, started = plugin._local.requests[-1]
+        leader = False
+        with plugin._login_lock:
+            flight = plugin._login_flight
+            # if the last login finished after we started, there's no need
+            if flight is None and started >= plugin._last_login:
+                flight = plugin._login_flight = concurrent.futures.Future()
+                leader = True
+        if leader:
+            try:
+                result = plugin._log_in(browser, url, *args, **kwargs)
+            except BaseException as e:
+                with plugin._login_lock:
+                    plugin._login_flight = None
+                flight.set_exception(e)
+                raise
+            with plugin._login_lock:
+                plugin._login_flight = None
+                plugin._last_login = time.time()
+            flight.set_result(None)
+            if result is not None:
+                return result
+        elif flight is not None:
+            logger.debug("Waiting on another thread's login")
+            flight.result() # raises the login's exception, if it failed
+        logger.debug("Retrying %s with the new session" % url)
+        return browser.load_page(url, *args, **kwargs)
+    
+    def _log_in(self, browser, url, *args, **kwargs):
+        """Gets a new session for :meth:`handle_redirect`, which has found that
+        loading ``url`` (with ``args`` and ``kwargs``) needs one. Gives what
+        loading it would have, or ``None`` to have it loaded again with the new
+        session. This logs in with :meth:`uf_login`, but subclasses can get a
+        session some other way."""
+        return browser.uf_login(browser.uf_username, browser.uf_password,
+                                *args, **kwargs)
     
     @extension
     def uf_logout(plugin, browser, refresh=False):
         """Disables the auto-login system, and logs you out (by simply deleting
         the session cookie). The ``refresh`` argument can be used to call
         :meth:`lib.browser.Browser.refresh`, returning the new result."""
-        # disable auto-login
+        # disable auto-login, and with it, refreshing
         browser.uf_set_autologin(enabled=False)
+        browser.uf_set_session_refresh(enabled=False)
+        plugin._session_started = None
         
-        # clear login cookies
-        try:
-            browser.cookie_jar.clear(path="/idp", name="JSESSIONID")
-            browser.cookie_jar.clear(path="/", name="UF_GSM")
-            plugin._uf_session_cookie = None
-        except KeyError:
-            pass
+        # clear login cookies (the jar needs to know their domains)
+        jar = browser.cookie_jar
+        for host, path, name in _login_cookies:
+            cookie = find_cookie(jar, host, path, name)
+            if cookie is not None:
+                jar.clear(cookie.domain, cookie.path, cookie.name)
         
         if refresh:
             if browser.current_url.index("https://login.ufl.edu") == 0:
@@ -177,23 +440,29 @@ class LoginContinueRedirect(BaseRedirectionPlugin):
     """Handles Shibboleth redirection pages that need a specially-formed POST
     message to continue through. This is normally handed via JavaScript, but
     we'll just handle this ourselves. This should be used with
-    :class:`LoginBrowserPlugin`."""
+    :class:`LoginBrowserPlugin`. Like it, it only looks at pages loaded from
+    ``hosts``."""
     
-    def __init__(self):
+    def __init__(self, hosts=shibboleth_hosts):
         url_match = re.compile(
             r"https://login.ufl.edu(:\d+)?/idp/"
             r"(profile/SAML2/Redirect/SSO|Authn/UserPassword)"
         )
+        # only run on pages that have the self-submitting <body> tag (see
+        # signature), so the leading .*? doesn't have far to go
         page_match_re = re.compile(
             r'.*?\<body onload="document\.forms\[0].submit\(\)"\>.*?'
             r'\<noscript\>.*?\<form action="(?P<post_url>.*?Shibboleth\.sso.*?'
             r'SAML2.*?POST)" method="post"\>',
             re.IGNORECASE | re.DOTALL
         )
-        BaseRedirectionPlugin.__init__(self, url_match=url_match,
-                                       page_match=page_match_re,
-                                       parser=parsers.passthrough_str)
+        BaseRedirectionPlugin.__init__(
+            self, url_match=url_match, page_match=page_match_re,
+            parser=PageContext,
+            signature=br'<body onload="document\.forms\[0\]\.submit\(\)">'
+        )
         
+        self.hosts = hosts
         self._page_match_re = page_match_re
         # compile the regex objects we'll need to parse the page
         self._form_element_re = re.compile(
@@ -202,18 +471,19 @@ class LoginContinueRedirect(BaseRedirectionPlugin):
             re.IGNORECASE | re.DOTALL
         )
     
-    def handle_redirect(plugin, browser, base_url, source, *args, **kwargs):
+    def handle_redirect(plugin, browser, base_url, context, *args, **kwargs):
         """The function that does the magic of pulling the form data from the
         Shibboleth redirection page, and resubmits it."""
         logger.debug("Page matched")
-        post_url = plugin._page_match_re.match(source).group("post_url")
+        # already run by BaseRedirectionPlugin, so this is just a lookup
+        post_url = context.match(plugin._page_match_re).group("post_url")
         post_url = _html_unescape(post_url)
         form_re = re.compile(
             r'(\<form action=".*?Shibboleth\.sso.*?" method="post"\>)(.*?)'
             r'(\</form\>)',
             re.IGNORECASE | re.DOTALL
         )
-        form = form_re.search(source).group(2)
+        form = form_re.search(context.text).group(2)
         
         # build our POST values list
         post_data = [(i.group("name"), _html_unescape(i.group("value")))
@@ -0,0 +1,269 @@
+"""Keeps browsers for many GatorLink accounts at once, without keeping them all
+in memory. A :class:`SessionManager` holds a limited number of live browsers,
+one per account; when it has too many, the one used longest ago has its cookies
+written to disk, and is dropped. The next time that account is asked for, a new
+browser is made, and given its cookies back, so it carries on with the same
+session (or logs in again, automatically, if that session has run out)::
+    
+    manager = SessionManager("/var/lib/uf-sessions", max_live=200)
+    for username, password in accounts:
+        manager.add_account(username, password)
+    ...
+    with manager.session(username) as browser:
+        reader = ScheduleReader(courses.Semesters.SPRING, browser=browser)
+        print(reader.course_list)
+
+..
+"""
+
+from .plugins.cookies import _cookie_to_row, _row_to_cookie
+
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger("browser.sessions")
+
+class SessionManager(object):
+    """A pool of browsers, one for each account it's been given, with at most
+    ``max_live`` of them in memory at a time (see the module documentation).
+    It can be used from several threads at once.
+    
+    *Keyword arguments:*
+    
+    ``directory``
+        Where the cookies of sessions that aren't in memory are kept, one file
+        for each account. It's made if it doesn't exist, and only its owner
+        can read it, since the cookies are as good as a password. Passwords
+        themselves are only ever kept in memory.
+    ``max_live``
+        How many browsers to keep in memory. Browsers in use (see
+        :meth:`session`) are never dropped, so there can be more for a while,
+        if more than this many are in use at once.
+    ``browser_factory``
+        A function giving a new browser, with the login plugins (see
+        :class:`lib.browser.plugins.uf.login.LoginBrowserPlugin`).
+        :func:`lib.browser.get_new_uf_browser` by default.
+    """
+    
+    def __init__(self, directory, max_live=64, browser_factory=None):
+        if browser_factory is None:
+            from . import get_new_uf_browser as browser_factory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.directory = directory
+        self.max_live = max_live
+        self._browser_factory = browser_factory
+        self._passwords = {} # username -> password
+        # username -> browser, the one used longest ago first
+        self._live = collections.OrderedDict()
+        self._in_use = collections.Counter() # username -> number of users
+        self._lock = threading.RLock()
+        # usernames whose cookies are being written out, after being evicted;
+        # they can't be revived until the file is complete
+        self._saving = set()
+        self._saves = collections.Counter() # username -> times written out
+        self._saved = threading.Condition(self._lock)
+        self.hits = self.revivals = self.evictions = 0
+    
+    def add_account(self, username, password):
+        """Makes an account available. If it already was, its password is
+        changed, and any live browser for it will use the new one."""
+        with self._lock:
+            self._passwords[username] = password
+            browser = self._live.get(username)
+            if browser is not None:
+                browser.uf_set_autologin(username, password)
+    
+    def remove_account(self, username):
+        """Forgets an account, along with its browser and saved cookies."""
+        with self._lock:
+            del self._passwords[username]
+            browser = self._live.pop(username, None)
+            while username in self._saving:
+                self._saved.wait()
+            self._saves.pop(username, None)
+        if browser is not None:
+            self.__retire(browser)
+        try:
+            os.unlink(self._path(username))
+        except FileNotFoundError:
+            pass
+    
+    def accounts(self):
+        """Gives a list of the usernames of every account."""
+        with self._lock:
+            return list(self._passwords)
+    
+    def live_accounts(self):
+        """Gives a list of the usernames of the accounts with a browser in
+        memory, the one used longest ago first."""
+        with self._lock:
+            return list(self._live)
+    
+    def get(self, username):
+        """Gives the browser for ``username``, bringing it back from disk if it
+        isn't in memory. It might be dropped from the pool as soon as other
+        accounts are asked for, so for anything more than a quick page load,
+        use :meth:`session` instead."""
+        browser = self.__get(username)
+        self.__evict()
+        return browser
+    
+    @contextlib.contextmanager
+    def session(self, username):
+        """A context manager giving the browser for ``username`` (like
+        :meth:`get`), which is kept in the pool until the ``with`` block is
+        done with it."""
+        browser = self.__get(username, use=True)
+        self.__evict()
+        try:
+            yield browser
+        finally:
+            with self._lock:
+                self._in_use[username] -= 1
+                if not self._in_use[username]:
+                    del self._in_use[username]
+            self.__evict()
+    
+    def save_all(self):
+        """Writes the cookies of every browser in memory to disk, so they
+        survive the process stopping."""
+        with self._lock:
+            live = list(self._live.items())
+        for username, browser in live:
+            self.__save(username, browser)
+    
+    def _path(self, username):
+        # hashed, so usernames don't need escaping
+        name = hashlib.sha1(username.encode()).hexdigest()
+        return os.path.join(self.directory, name + ".json")
+    
+    def __get(self, username, use=False):
+        # the lock is only held to look at the pool; making the browser and
+        # reading its cookies happens outside it, so one slow revival doesn't
+        # hold up every other account
+        while True:
+            with self._lock:
+                while username in self._saving:
+                    self._saved.wait()
+                browser = self._live.get(username)
+                if browser is not None:
+                    self._live.move_to_end(username)
+                    self.hits += 1
+                    if use:
+                        self._in_use[username] += 1
+                    return browser
+                password = self._passwords[username] # KeyError if unknown
+                saves = self._saves[username]
+            browser = self.__revive(username, password)
+            with self._lock:
+                while username in self._saving:
+                    self._saved.wait()
+                if self._saves[username] == saves:
+                    break
+            # it was put back to sleep while we were reading its cookies, so
+            # what we read is out of date
+            self.__retire(browser)
+        with self._lock:
+            live = self._live.get(username)
+            if live is None:
+                # the password might have been changed (or the account
+                # removed) while we weren't holding the lock
+                password = self._passwords.get(username)
+                if password is None:
+                    spare = browser
+                else:
+                    browser.uf_set_autologin(username, password)
+                    self._live[username] = browser
+                    spare = None
+            else:
+                # another thread revived it first, so use theirs
+                spare, browser = browser, live
+                self._live.move_to_end(username)
+            if password is not None and use:
+                self._in_use[username] += 1
+        if spare is not None:
+            self.__retire(spare)
+        if password is None:
+            raise KeyError(username)
+        return browser
+    
+    def __revive(self, username, password):
+        browser = self._browser_factory()
+        browser.uf_set_autologin(username, password)
+        try:
+            with open(self._path(username)) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            pass
+        else:
+            if isinstance(saved, list): # written before session_started was
+                saved = {"cookies": saved, "session_started": None}
+            jar = browser.cookie_jar
+            for row in saved["cookies"]:
+                cookie = _row_to_cookie(row)
+                if not cookie.is_expired():
+                    jar.set_cookie(cookie)
+            # without it, the session's expiry can't be worked out, so its
+            # background refresh (if the factory turned that on) would never
+            # be set up again; setting it restarts the refresh timer too
+            browser.uf_session_started = saved["session_started"]
+            with self._lock:
+                self.revivals += 1
+            logger.debug("Revived the session for %s" % username)
+        return browser
+    
+    def __evict(self):
+        with self._lock:
+            excess = len(self._live) - self.max_live
+            if excess <= 0:
+                return
+            evicted = []
+            for username in list(self._live):
+                if username in self._in_use:
+                    continue
+                evicted.append((username, self._live.pop(username)))
+                self._saving.add(username)
+                self.evictions += 1
+                excess -= 1
+                if not excess:
+                    break
+        # written out without the lock held, like in __get
+        for username, browser in evicted:
+            try:
+                self.__save(username, browser)
+            finally:
+                self.__retire(browser)
+                with self._lock:
+                    self._saving.discard(username)
+                    self._saves[username] += 1
+                    self._saved.notify_all()
+            logger.debug("Put the session for %s to sleep" % username)
+    
+    def __save(self, username, browser):
+        saved = {
+            "cookies": [_cookie_to_row(cookie) for cookie in browser.cookie_jar
+                        if not cookie.is_expired()],
+            "session_started": browser.uf_session_started,
+        }
+        path = self._path(username)
+        # unique to the thread too, since several can be saving at once
+        temp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(saved, f)
+        os.replace(temp_path, path) # so a crash never leaves half a file
+    
+    def __retire(self, browser):
+        # a background refresh timer would keep the browser alive
+        refresh = getattr(browser, "uf_set_session_refresh", None)
+        if refresh is not None:
+            refresh(enabled=False)
+        # and its keep-alive sockets would stay open until it's collected
+        close = getattr(browser, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,262 @@
+"""A lean alternative to :mod:`urllib`'s ``OpenerDirector`` for
+:class:`lib.browser.Browser`. Every page load through an opener builds a
+:class:`urllib.request.Request`, runs it through each handler and processor in
+the chain, and builds up the headers, before :mod:`http.client` is ever
+reached. When the only handlers a browser has are ones we can imitate (cookies,
+added headers, and keepalive connections), :class:`FastTransport` does the same
+job by talking to pooled :mod:`http.client` connections directly.
+
+You don't typically use this module directly. Instead, pass ``fast_path=True``
+when making a :class:`lib.browser.Browser`."""
+
+import http.client
+import urllib.parse as urlpar
+import urllib.error
+import socket
+import threading
+import logging
+
+logger = logging.getLogger("browser.transport")
+
+# urllib's HTTPRedirectHandler, in a nutshell
+_redirect_codes = (301, 302, 303, 307, 308)
+_max_redirections = 10
+
+class _CookieRequest(object):
+    """Just enough of :class:`urllib.request.Request` for
+    :class:`http.cookiejar.CookieJar` to work with. Both the attribute (python
+    3.3+) and the getter method (python 3.2) forms are provided."""
+    
+    def __init__(self, url, scheme, host, headers):
+        self.full_url = url
+        self.type = scheme
+        self.host = host
+        self.origin_req_host = host.split(":", 1)[0]
+        self.unverifiable = False
+        self.headers = headers # shared with the transport
+    
+    def get_full_url(self): return self.full_url
+    def get_type(self): return self.type
+    def get_host(self): return self.host
+    def get_origin_req_host(self): return self.origin_req_host
+    def is_unverifiable(self): return self.unverifiable
+    
+    def has_header(self, name):
+        return name in self.headers
+    
+    def get_header(self, name, default=None):
+        return self.headers.get(name, default)
+    
+    def add_unredirected_header(self, name, value):
+        self.headers[name] = value
+    
+    def header_items(self):
+        return list(self.headers.items())
+
+class FastResponse(object):
+    """The result of :meth:`FastTransport.open`. It has the ``read``,
+    ``info``, ``geturl`` and ``getcode`` methods of a :mod:`urllib` response.
+    The body has already been read off the connection, so the connection can
+    go straight back into the pool."""
+    
+    __slots__ = ("_body", "_headers", "_url", "status", "reason")
+    
+    def __init__(self, body, headers, url, status, reason):
+        self._body = body
+        self._headers = headers
+        self._url = url
+        self.status = status
+        self.reason = reason
+    
+    def read(self, amt=None):
+        if amt is None:
+            body, self._body = self._body, b""
+        else:
+            body, self._body = self._body[:amt], self._body[amt:]
+        return body
+    
+    def info(self):
+        return self._headers
+    
+    headers = property(info)
+    
+    def geturl(self):
+        return self._url
+    
+    def getcode(self):
+        return self.status
+    
+    code = property(getcode)
+    
+    def close(self):
+        pass
+
+class FastTransport(object):
+    """Opens urls with pooled :mod:`http.client` connections.
+    
+    *Keyword arguments:*
+    
+    ``addheaders``
+        A list of ``(name, value)`` tuples to send with every request, with the
+        same semantics as :attr:`urllib.request.OpenerDirector.addheaders`
+        (the first header with a given name wins). The list is read on every
+        request, so it can be shared and changed later.
+    ``cookie_jars``
+        A list of :class:`http.cookiejar.CookieJar` objects, to add cookies
+        from and save cookies to, like
+        :class:`urllib.request.HTTPCookieProcessor` would. It's shared in the
+        same fashion as ``addheaders``.
+    ``timeout``
+        The socket timeout for new connections.
+    """
+    
+    def __init__(self, addheaders, cookie_jars, timeout=None):
+        self._addheaders = addheaders
+        self._cookie_jars = cookie_jars
+        self._timeout = timeout
+        # (scheme, host) -> http.client connection. Connections are checked
+        # out of the pool for each request (like the keepalive plugin's
+        # handlers do), so threads sharing a browser never use one at once.
+        self._connections = {}
+        self._busy = set() # connections a request is using
+        self._busy_lock = threading.Lock()
+    
+    def can_open(self, url):
+        """``True`` if the url is one we know how to handle."""
+        return url.startswith("http://") or url.startswith("https://")
+    
+    def close_all(self):
+        """Closes every pooled connection that isn't being used."""
+        with self._busy_lock:
+            idle = [conn for conn in self._connections.values()
+                    if conn not in self._busy]
+            self._connections = {}
+        for conn in idle:
+            conn.close()
+    
+    def open(self, url, data=None):
+        """Loads a url, following redirects, and gives back a
+        :class:`FastResponse`. Like an opener, network failures raise
+        :class:`urllib.error.URLError`. Unlike an opener, error statuses (such
+        as a ``404``) are given back as a normal response, rather than raised,
+        which is the way :meth:`lib.browser.Browser.load_page` treats them
+        anyway."""
+        for redirection in range(_max_redirections + 1):
+            response = self._open_once(url, data)
+            if response.status not in _redirect_codes:
+                return response
+            location = response.info().get("location") or \
+                       response.info().get("uri")
+            if not location:
+                return response
+            if data is not None and response.status in (307, 308):
+                return response # urllib refuses to re-POST these, too
+            url = urlpar.urljoin(url, location)
+            data = None # the rest are turned into GETs
+            logger.debug("Redirected to %s" % url)
+        return response
+    
+    def _open_once(self, url, data):
+        scheme, host, path, query, fragment = urlpar.urlsplit(url)
+        selector = path or "/"
+        if query:
+            selector += "?" + query
+        
+        headers = {}
+        for name, value in self._addheaders:
+            headers.setdefault(name.capitalize(), value)
+        if data is not None:
+            headers.setdefault("Content-type",
+                               "application/x-www-form-urlencoded")
+            headers["Content-length"] = str(len(data))
+        cookie_request = None
+        if self._cookie_jars:
+            cookie_request = _CookieRequest(url, scheme, host, headers)
+            for jar in self._cookie_jars:
+                jar.add_cookie_header(cookie_request)
+        
+        method = "GET" if data is None else "POST"
+        key = (scheme, host)
+        conn, r = self._request(key, method, selector, data, headers)
+        try:
+            body = r.read()
+        except:
+            self._release(key, conn, reuse=False)
+            raise
+        self._release(key, conn, reuse=not r.will_close)
+        response = FastResponse(body, r.msg, url, r.status, r.reason)
+        
+        if cookie_request is not None:
+            for jar in self._cookie_jars:
+                jar.extract_cookies(response, cookie_request)
+        return response
+    
+    def _request(self, key, method, selector, data, headers):
+        """Sends a request down a pooled connection, reconnecting once if the
+        pooled connection turns out to have been closed by the server. Only
+        GETs are retried; the server might have acted on a POST before the
+        connection went, so it isn't sent twice. Gives the connection, which
+        must be handed to :meth:`_release` once the response has been read,
+        and the response."""
+        conn = self._checkout(key)
+        if conn is not None:
+            try:
+                conn.request(method, selector, data, headers)
+                return conn, conn.getresponse()
+            except (socket.error, http.client.HTTPException) as err:
+                self._release(key, conn, reuse=False) # stale
+                if data is not None:
+                    raise urllib.error.URLError(err)
+        conn = self._checkout_new(key)
+        try:
+            conn.request(method, selector, data, headers)
+            return conn, conn.getresponse()
+        except (socket.error, http.client.HTTPException) as err:
+            self._release(key, conn, reuse=False)
+            raise urllib.error.URLError(err)
+    
+    def _checkout(self, key):
+        """Takes the pooled connection for ``key`` for a request, or gives
+        ``None`` if there isn't one, or another thread is using it."""
+        with self._busy_lock:
+            conn = self._connections.get(key)
+            if conn is None or conn in self._busy:
+                return None
+            self._busy.add(conn)
+            return conn
+    
+    def _checkout_new(self, key):
+        """Makes a connection for a request. It's pooled if the pool doesn't
+        have a connection for ``key`` that's in use, and otherwise it's a
+        spare, for a thread that found the pooled one busy."""
+        conn = self._new_connection(*key)
+        with self._busy_lock:
+            pooled = self._connections.get(key)
+            if pooled is None or pooled not in self._busy:
+                self._connections[key] = conn
+            self._busy.add(conn)
+        return conn
+    
+    def _release(self, key, conn, reuse=True):
+        """Lets the next request use ``conn``, once its response has been read.
+        A spare is pooled if the pool has since lost its connection for
+        ``key``, and closed otherwise. If ``reuse`` is false (the server is
+        closing the connection, or it's broken), it's closed either way."""
+        with self._busy_lock:
+            self._busy.discard(conn)
+            if reuse:
+                if self._connections.get(key) is conn:
+                    return
+                if key not in self._connections:
+                    self._connections[key] = conn
+                    return
+            elif self._connections.get(key) is conn:
+                del self._connections[key]
+        conn.close()
+    
+    def _new_connection(self, scheme, host):
+        connection_class = http.client.HTTPSConnection if scheme == "https" \
+                           else http.client.HTTPConnection
+        if self._timeout is None:
+            return connection_class(host)
+        return connection_class(host, timeout=self._timeout)
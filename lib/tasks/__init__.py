@@ -2,6 +2,7 @@ from .. import browser
 
 import abc
 import threading
+import concurrent.futures
 
 class BaseTaskManager(metaclass=abc.ABCMeta):
     """Forms a simple system that can be used to create task handlers. This is
@@ -88,3 +89,17 @@ class BaseUFTaskManager(metaclass=abc.ABCMeta):
         """Uses :func:`lib.browser.get_new_uf_browser()` to make the default
         :attr:`BaseTaskManger.browser` instance."""
         return browser.get_new_uf_browser()
+
+def _then(future, function):
+    """Gives a new :class:`concurrent.futures.Future` that's resolved with
+    ``function(future.result())`` once ``future`` is done (or with the same
+    exception, if either of them raises one). ``function`` is run in whatever
+    thread finishes ``future``."""
+    chained = concurrent.futures.Future()
+    def callback(future):
+        try:
+            chained.set_result(function(future.result()))
+        except BaseException as err:
+            chained.set_exception(err)
+    future.add_done_callback(callback)
+    return chained
@@ -1,7 +1,19 @@
 import lxml.html
+import html
 import re
 
 _table_tr_re = re.compile(r"\</?tr/?\>", re.IGNORECASE)
+# everything iter_table_rows needs from a table, in one pass: a row boundary
+# (however ISIS tags it), a cell's tag and its contents (up to the next table
+# tag), any other tag (skipped), or text outside of any cell
+_table_token_re = re.compile(
+    r"<(?:(/?tr)\b[^>]*>|(t[dh]\b[^>]*)>"
+    r"([^<]*(?:<(?!/?t[dhr]\b)[^<]*)*)(?:</t[dh]\s*>)?)|"
+    r"<!--.*?-->|<[^>]*>|([^<\s][^<]*)",
+    re.IGNORECASE | re.DOTALL
+)
+_colspan_re = re.compile(r"\bcolspan\s*=\s*[\"']?\s*(\d+)", re.IGNORECASE)
+_markup_re = re.compile(r"<!--.*?-->|<[^>]*>", re.DOTALL)
 _process_header = lambda tag: \
     tag.text_content().strip().lower() if tag.text_content().strip() else None
 _process_cell = lambda tag: \
@@ -52,7 +64,78 @@ def table_to_iter(table_string, process_header=_process_header,
         :class:`HtmlElement`, and outputs a result to be used as the cell value.
         *By default:* pulls the text content as a string, and strips leading
         and ending whitespace.
+    
+    With the default ``process_header`` and ``process_cell``, the table is read
+    by :func:`iter_table_rows`, without building any lxml elements at all. Only
+    custom ones, which need the elements, have the table parsed by lxml.
     """
+    if process_header is _process_header and process_cell is _process_cell:
+        return _table_rows_to_dicts(iter_table_rows(table_string))
+    return _table_to_iter_lxml(table_string, process_header, process_cell)
+
+def _table_rows_to_dicts(rows):
+    try:
+        headers = [text.lower() if text else None
+                   for text, span in next(rows)]
+    except StopIteration:
+        return # not even a header
+    width = len(headers)
+    for row in rows:
+        d = {}; k = 0
+        for text, span in row:
+            for m in range(min(span, width - k)): # (broken isis html again)
+                d[headers[k + m]] = text
+            k += span
+        yield d
+
+def iter_table_rows(table_string):
+    """Reads a table from ISIS in a single pass, giving a list of
+    ``(text, colspan)`` tuples for each row, header included, as soon as the
+    row has been read. ``text`` is the cell's text content (with any markup
+    inside the cell dropped, and entities decoded), stripped of leading and
+    ending whitespace, or ``None`` if that leaves nothing.
+    
+    ISIS doesn't close its rows (or cells) properly, so every ``<tr>``,
+    ``</tr>`` or ``<tr/>`` (with any attributes) is taken to separate two
+    rows, and a cell ends at its closing tag, the next cell, or the next row,
+    whichever comes first, just as :func:`table_to_iter` always has. Rows with
+    nothing in them are skipped. Tables nested in cells aren't supported.
+    
+    *Keyword arguments:*
+    
+    ``table_string``
+        The inner contents of ``<table>`` tags.
+    """
+    row = []
+    row_has_content = False
+    for token in _table_token_re.finditer(table_string):
+        row_tag, cell_tag, contents, text = token.groups()
+        if row_tag:
+            if row_has_content:
+                yield row
+            row = []
+            row_has_content = False
+        elif cell_tag:
+            colspan = 1
+            if "=" in cell_tag:
+                match = _colspan_re.search(cell_tag)
+                if match:
+                    colspan = int(match.group(1))
+            row.append((_cell_text(contents), colspan))
+            row_has_content = True
+        elif text:
+            row_has_content = True # something outside of any cell
+    if row_has_content:
+        yield row
+
+def _cell_text(text):
+    if "<" in text:
+        text = _markup_re.sub("", text)
+    if "&" in text:
+        text = html.unescape(text)
+    return text.strip() or None
+
+def _table_to_iter_lxml(table_string, process_header, process_cell):
     rows = lxml.html.fragment_fromstring(
         "<table>%s</table>" % _fix_table_html(
             table_string
@@ -1,7 +1,9 @@
 from ...browser import parsers
 from .. import *
+from .. import _then
 from ..isis import table_to_list
 from .. import courses
+from ..selector_registry import SelectorRegistry
 
 import lxml.html
 import lxml.etree
@@ -17,11 +19,77 @@ _semester_codes = {courses.Semesters.SPRING:"RSI-SSCHED",
                    courses.Semesters.SUMMER:"RSI-USCHED",
                    courses.Semesters.FALL:"RSI-FSCHED"}
 
+_selectors = SelectorRegistry()
+_selectors.xpath("user_info_cells", "./tr/td")
+
 _table_inner_re = re.compile(
     r'\<div id="reg_sched"\>.*?\<table\>(.+?)\</table\>',
     re.IGNORECASE | re.DOTALL
 )
 
+def _parse_schedule_page(source, headers, url):
+    """A parser for the ISIS schedule page, giving back a tuple of the user
+    info (see :meth:`ScheduleReader.get_user_info`) and a
+    :class:`lib.tasks.courses.CourseList`. It's a module-level function, so
+    :meth:`ScheduleReader.load_later` can run it in another process. Only
+    what it parsed out is sent back, not the page itself, which the reader
+    already has."""
+    str_source = parsers.passthrough_str(source, headers, url)
+    lxml_source = parsers.lxml_html(source, headers, url)
+    
+    # pull user info
+    working_block = lxml_source.get_element_by_id("phead")
+    label_data_pairs = _selectors.user_info_cells(working_block)
+    label_data_pairs = [i.text.lower().strip() for i in label_data_pairs]
+    # make a list of tuples containing all the user info
+    user_info = [
+        (label_data_pairs[i * 2][:-1], label_data_pairs[i * 2 + 1]) \
+        for i in range(len(label_data_pairs) // 2)
+    ]
+    
+    
+    
+    # pull from the schedule block
+    working_block = lxml_source.get_element_by_id("reg_sched")
+    
+    # Put it into a list of dicts
+    # We need to grab it before lxml has a chance to try to parse it
+    rows = table_to_list(_table_inner_re.search(str_source).group(1))
+    total_credits = int(rows[-1]["credits"]) # we'll use this for validation
+    rows = rows[:-1] # get rid of footer
+    
+    # parse columns
+    for r in rows:
+        r["credits"] = int(r["credits"]) if r["credits"] is not None \
+                       else None
+    
+    # validate that the table was processed correctly
+    if not total_credits == sum(i["credits"] for i in rows if i["credits"]):
+        logger.error("Table reading likely failed: ISIS' reported credit"
+                     "total fails to match the sum of all credits.")
+    
+    course_list = courses.CourseList()
+    for r in rows:
+        # get the meeting defined in the row
+        if "to be" not in r["days"] and "tba" not in r["days"]:
+            meet = courses.CourseMeeting(r["days"], r["periods"], r["bldg"],
+                                         r["room"])
+        else:
+            meet = None
+        if r["section"] is not None: # no orphans here!
+            course_list.append(
+                courses.Course(r["course"], r["section"],
+                               credits=r["credits"],
+                               meetings=[meet] if meet else [])
+            )
+        else: # we have an orphaned row
+            # an orphaned row is one where only a meeting is defined, the
+            # class declaration is implicitly defined by last non-orphaned
+            # row
+            course_list[-1].meetings.append(meet)
+    
+    return user_info, course_list
+
 class ScheduleReader(BaseUFTaskManager, BaseTaskManager):
     """Attempts to provide information from the ISIS schedule page in as
     transparent of a format as possible.
@@ -122,61 +190,26 @@ class ScheduleReader(BaseUFTaskManager, BaseTaskManager):
         byte_source = self.browser.load_isis_page(
             self.semester_code, parser=parsers.passthrough_args
         )
-        str_source = parsers.passthrough_str(*byte_source)
+        self.__finish_load(byte_source, _parse_schedule_page(*byte_source))
+    
+    def load_later(self, executor):
+        """Like :meth:`force_load`, but the page is parsed on a
+        :class:`concurrent.futures.Executor` (see
+        :meth:`lib.browser.Browser.load_page`). The page itself is loaded
+        before this returns, and a :class:`concurrent.futures.Future` is given
+        back, which resolves to this reader once it's done loading."""
+        # the page stays here; only the parsing is handed off
+        byte_source = self.browser.load_isis_page(
+            self.semester_code, parser=parsers.passthrough_args
+        )
+        return _then(self.browser._parse_page_later(executor,
+                                                    _parse_schedule_page,
+                                                    *byte_source),
+                     lambda result: self.__finish_load(byte_source, result))
+    
+    def __finish_load(self, byte_source, result):
         self.__page_byte_source = byte_source
-        lxml_source = parsers.lxml_html(*byte_source)
-        
-        
-        # pull user info
-        working_block = lxml_source.get_element_by_id("phead")
-        label_data_pairs = working_block.xpath("./tr/td")
-        label_data_pairs = [i.text.lower().strip() for i in label_data_pairs]
-        # make a list of tuples and a dictionary containing all the user info
-        self.__user_info = [
-            (label_data_pairs[i * 2][:-1], label_data_pairs[i * 2 + 1]) \
-            for i in range(len(label_data_pairs) // 2)
-        ]
+        self.__user_info, self.__course_list = result
         self.__user_info_dict = dict(self.__user_info)
-        
-        
-        
-        # pull from the schedule block
-        working_block = lxml_source.get_element_by_id("reg_sched")
-        
-        # Put it into a list of dicts
-        # We need to grab it before lxml has a chance to try to parse it
-        rows = table_to_list(_table_inner_re.search(str_source).group(1))
-        total_credits = int(rows[-1]["credits"]) # we'll use this for validation
-        rows = rows[:-1] # get rid of footer
-        
-        # parse columns
-        for r in rows:
-            r["credits"] = int(r["credits"]) if r["credits"] is not None \
-                                             else None
-        
-        # validate that the table was processed correctly
-        if not total_credits == sum(i["credits"] for i in rows if i["credits"]):
-            logger.error("Table reading likely failed: ISIS' reported credit"
-                         "total fails to match the sum of all credits.")
-        
-        course_list = courses.CourseList()
-        for r in rows:
-            # get the meeting defined in the row
-            if "to be" not in r["days"] and "tba" not in r["days"]:
-                meet = courses.CourseMeeting(r["days"], r["periods"], r["bldg"],
-                                             r["room"])
-            else:
-                meet = None
-            if r["section"] is not None: # no orphans here!
-                course_list.append(
-                    courses.Course(r["course"], r["section"],
-                                  credits=r["credits"],
-                                  meetings=[meet] if meet else [])
-                )
-            else: # we have an orphaned row
-                # an orphaned row is one where only a meeting is defined, the
-                # class declaration is implicitly defined by last non-orphaned
-                # row
-                course_list[-1].meetings.append(meet)
-        
-        self.__course_list = course_list
+        self.__loaded = True
+        return self
@@ -3,6 +3,7 @@ from .person import *
 from ...browser import parsers
 from .ldap import utils as ldap_utils
 from . import fields
+from ..selector_registry import SelectorRegistry
 
 import lxml
 import re
@@ -14,6 +15,19 @@ except: # py2
 
 logger = logging.getLogger("tasks.phonebook.http")
 
+# LDAP info pages only have what we need in div#ldap
+_ldap_div_parser = parsers.lxml_html_subtree("ldap", tag="div")
+
+_selectors = SelectorRegistry()
+_selectors.xpath("results_info", "//div[@id='results_info']/p")
+_selectors.xpath("results_table", "//div[@id='content']//table")
+_selectors.xpath("table_headers", "./thead//th")
+_selectors.xpath("table_rows", "./tbody//tr")
+_selectors.xpath("cells", "./td")
+_selectors.xpath("ldap_list", "./dl")
+_selectors.xpath("ldap_keys", "./dt")
+_selectors.xpath("ldap_values", "./dd")
+
 _person_url_re = re.compile(
     r"https?://.*?\.ufl\.edu(\:\d+)?(?P<priv>/private)?/people/"
     r"(?P<ident>[A-Za-z0-9]*)/?"
@@ -64,7 +78,7 @@ class HttpBackend(PhonebookBackend):
         lxml_source = self.browser.submit("GET", search_url, {"query":query},
                                           parser=parsers.lxml_html)
         
-        info = lxml_source.xpath("//div[@id='results_info']/p")[0] \
+        info = _selectors.results_info(lxml_source)[0] \
                                 .text_content().lower().strip()
         
         if "returned only one" in info:
@@ -95,13 +109,14 @@ class HttpBackend(PhonebookBackend):
     
     
     def __get_search_results_from_list(self, lxml_source):
-        table = lxml_source.xpath("//div[@id='content']//table")[0]
-        headers = [i.text.lower().strip() for i in table.xpath("./thead//th")]
-        body = table.xpath("./tbody//tr")
+        table = _selectors.results_table(lxml_source)[0]
+        headers = [i.text.lower().strip()
+                   for i in _selectors.table_headers(table)]
+        body = _selectors.table_rows(table)
         # build Person objects
         results = []
         for row in body:
-            d = dict(zip(headers, row.xpath("./td")))
+            d = dict(zip(headers, _selectors.cells(row)))
             
             # process the url
             url = d["name"][0].get("href")
@@ -142,11 +157,11 @@ class HttpBackend(PhonebookBackend):
     def process_datahint(self, hint):
         """Pulls up the person's LDAP information page, pulls the person's
         additional information from it, and returns it."""
-        lxml_source = self.browser.load_page(hint.url, parser=parsers.lxml_html)
+        ldap_div = self.browser.load_page(hint.url, parser=_ldap_div_parser)
         
-        element_list = lxml_source.xpath("//div[@id='ldap']/dl")[0]
-        keys = [i.text.strip() for i in element_list.xpath("./dt")]
-        values = [i.text.strip() for i in element_list.xpath("./dd")]
+        element_list = _selectors.ldap_list(ldap_div)[0]
+        keys = [i.text.strip() for i in _selectors.ldap_keys(element_list)]
+        values = [i.text.strip() for i in _selectors.ldap_values(element_list)]
         
         return ldap_utils.process_data(zip(keys, values))
 
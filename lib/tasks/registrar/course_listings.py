@@ -12,15 +12,102 @@ Calculus 3 (MAC 2313) during the Fall 2011 semester::
 """
 
 from .. import *
+from .. import _then
 from ...browser import parsers
 from .. import courses
 from ..courses import fuzzy_match
 from . import department_matching
+from ..selector_registry import SelectorRegistry
 import time
 import logging
 
 logger = logging.getLogger("lib.tasks.registrar.course_listings")
 
+# department pages only have what we need in #soc_content, so we don't need to
+# build the rest of the page
+_soc_content_parser = parsers.lxml_html_subtree("soc_content")
+
+_selectors = SelectorRegistry()
+_selectors.css("department_menu", ".soc_menu select")
+_selectors.css("prefix_table", "#soc_content table.filterable")
+_selectors.css("menu_options", "option")
+_selectors.css("tables", "table")
+_selectors.css("rows", "tr")
+_selectors.css("cells", "td")
+_selectors.css("comment_headers", "th.soc_comment")
+_selectors.css("column_headers", ".colhelp a")
+
+def _parse_department_page(source, headers, url):
+    """A parser for a department's page, giving back a tuple of a
+    :class:`lib.tasks.courses.CourseList` of the department's courses, and a
+    tuple of the course prefixes found in it. It's a module-level function, and
+    gives back plain objects, so :meth:`Department.load_later` can run it in
+    another process."""
+    # We're only concerned about the table of courses, so only #soc_content
+    # is built
+    soc_content = _soc_content_parser(source, headers, url)
+    department_table = _selectors.tables(soc_content)[1]
+    department_table_rows = _selectors.rows(department_table)
+    # The first few rows are are information about the department (0-2).
+    #     We're not doing anything with them, so we'll just ignore them
+    # Then we have the headers for the course table, we'll use these values
+    #     as keys in a bunch of little dictionaries.
+    header_row = department_table_rows[2]
+    # The rest of the table contains the data about the courses
+    course_rows = department_table_rows[3:]
+    # Some data rows may contain junk comment data, discard it
+    course_rows = [r for r in course_rows
+                   if not _selectors.comment_headers(r)]
+    # process each header cell, converting lxml tags to strings
+    column_headers = [i.text.strip().lower() for i in
+                      _selectors.column_headers(header_row)]
+    def stripped_or_none(tag): # utility function: gives stripped version of
+                               # a tag, or None if it's empty
+        stripped = tag.text_content().strip()
+        return stripped if stripped else None
+    # turn each row in the table into little dicts, where we can look up
+    #     data by the column (specified by the header)
+    course_dicts = [
+        dict(zip(column_headers, [stripped_or_none(i) for i in row]))
+        for row in course_rows
+    ]
+    
+    # We're done with our first stage of processing. Now we'll convert each
+    # little dict into a Course object, and shove them all into a CourseList
+    
+    base_course_list = [] # the list we'll later build our CourseList from
+    def build_meeting(d): # utility funciton: builds a meeting given a dict
+        if not d["day(s)"] or "tba" in d["day(s)"].lower():
+            return None
+        return courses.CourseMeeting(days=d["day(s)"], periods=d["period"],
+                                     building=d["bldg"], room=d["room"])
+    for d in course_dicts:
+        if d["course"]:
+            credits = int(d["cred"]) if "var" not in d["cred"].lower() \
+                      else -1
+            meeting = build_meeting(d)
+            c = courses.Course(d["course"], d["sect"],
+                               title=d["course title & textbook(s)"],
+                               credits=credits,
+                               meetings=[meeting] if meeting else [],
+                               gen_ed_credit=d["ge"], gordon_rule=d["wm"],
+                               instructors=[i.strip() for i in
+                                            d["instructor(s)"].split("\n")])
+            base_course_list.append(c)
+        else:
+            meeting = build_meeting(d)
+            if meeting:
+                base_course_list[-1].meetings.append(meeting)
+    
+    course_list = courses.CourseList(base_course_list)
+    
+    # Using the course list, find the prefixes for this department
+    prefixes = []
+    for c in course_list:
+        if c.course_code.prefix not in prefixes:
+            prefixes.append(c.course_code.prefix)
+    return course_list, tuple(prefixes)
+
 class CourseReader(BaseUFTaskManager, BaseTaskManager):
     """Generates the url for, and uses the Registrar list of courses. If a
     matching url cannot be found or generated, a ``KeyError`` will be raised.
@@ -111,6 +198,24 @@ class CourseReader(BaseUFTaskManager, BaseTaskManager):
             if found:
                 break
     
+    def load_departments(self, executor=None):
+        """Loads every department in :attr:`departments` that hasn't been
+        loaded yet, and gives back :attr:`departments`. If a
+        :class:`concurrent.futures.Executor` is given, each department page is
+        handed off to it to be parsed (see :meth:`Department.load_later`), so
+        the next page can be fetched while the last ones are still being
+        parsed. A :class:`concurrent.futures.ProcessPoolExecutor` lets the
+        parsing use more than one core."""
+        if executor is None:
+            for dep in self.departments:
+                dep.auto_load()
+            return self.departments
+        futures = [dep.load_later(executor) for dep in self.departments
+                   if not dep.loaded]
+        for future in futures:
+            future.result() # raises whatever the parser raised
+        return self.departments
+    
     def auto_load(self):
         """Checks to see if the department page has been loaded before. If not,
         it loads it (calling :func:`force_load`)."""
@@ -135,15 +240,15 @@ class CourseReader(BaseUFTaskManager, BaseTaskManager):
         lxml_source = self.browser.load_page(self.base_url,
                                              parser=parsers.lxml_html)
         # get department names and thir html page names from the dropdown menu
-        department_menu = self.__parse_department_menu(lxml_source.cssselect(
-            ".soc_menu select"
-        )[0])
+        department_menu = self.__parse_department_menu(
+            _selectors.department_menu(lxml_source)[0]
+        )
         # get prefixes and matching department names from the central table
         # Note: There can be multiple prefixes for each department, and multiple
         #       departments for each prefix
-        prefix_table = self.__parse_course_prefix_table(lxml_source.cssselect(
-            "#soc_content table.filterable"
-        )[0])
+        prefix_table = self.__parse_course_prefix_table(
+            _selectors.prefix_table(lxml_source)[0]
+        )
         
         start_time = time.time() # used for benchmarking how fast our pairing is
         
@@ -202,16 +307,17 @@ class CourseReader(BaseUFTaskManager, BaseTaskManager):
         list of tuples in the format
         ``("3-Letter Prefix Code", "Department Name")``"""
         result_list = []
-        for row in table.cssselect("tr")[1:]:
+        for row in _selectors.rows(table)[1:]:
             result_list.append(tuple(
-                cell.text_content().strip() for cell in row.cssselect("td")
+                cell.text_content().strip() for cell in _selectors.cells(row)
             ))
         return result_list
     
     def __parse_department_menu(self, menu):
         """Given the lxml drop-down list element of courses, returns a list of
         tuples in the format ``("DEPARTMENT NAME", "course_page.html")``"""
-        options = menu.cssselect("option")[1:] # drop the first, garbage value
+        # drop the first, garbage value
+        options = _selectors.menu_options(menu)[1:]
         result_list = []
         for o in options:
             name = o.text_content().strip()
@@ -381,73 +487,25 @@ class Department:
     def force_load(self):
         """Regardless of whether or not :attr:`loaded` is ``True``, loads the
         department page."""
-        # Load the department page's html and feed it to lxml:
-        lxml_source = self.browser.load_page(self._url,
-                                             parser=parsers.lxml_html)
-        # We're only concerned about the table of courses: pull that out
-        department_table = lxml_source.cssselect("#soc_content table")[1]
-        department_table_rows = department_table.cssselect("tr")
-        # The first few rows are are information about the department (0-2).
-        #     We're not doing anything with them, so we'll just ignore them
-        # Then we have the headers for the course table, we'll use these values
-        #     as keys in a bunch of little dictionaries.
-        header_row = department_table_rows[2]
-        # The rest of the table contains the data about the courses
-        course_rows = department_table_rows[3:]
-        # Some data rows may contain junk comment data, discard it
-        course_rows = [r for r in course_rows \
-                       if not r.cssselect("th.soc_comment")]
-        # process each header cell, converting lxml tags to strings
-        headers = [i.text.strip().lower() for i in
-                   header_row.cssselect(".colhelp a")]
-        def stripped_or_none(tag): # utility function: gives stripped version of
-                                   # a tag, or None if it's empty
-            stripped = tag.text_content().strip()
-            return stripped if stripped else None
-        # turn each row in the table into little dicts, where we can look up
-        #     data by the column (specified by the header)
-        course_dicts = [
-            dict(zip(headers, [stripped_or_none(i) for i in row]))
-            for row in course_rows
-        ]
-        
-        # We're done with our first stage of processing. Now we'll convert each
-        # little dict into a Course object, and shove them all into a CourseList
-        
-        base_course_list = [] # the list we'll later build our CourseList from
-        def build_meeting(d): # utility funciton: builds a meeting given a dict
-            if not d["day(s)"] or "tba" in d["day(s)"].lower():
-                return None
-            return courses.CourseMeeting(days=d["day(s)"], periods=d["period"],
-                                         building=d["bldg"], room=d["room"])
-        for d in course_dicts:
-            if d["course"]:
-                credits = int(d["cred"]) if "var" not in d["cred"].lower() \
-                                         else -1
-                meeting = build_meeting(d)
-                c = courses.Course(d["course"], d["sect"],
-                                   title=d["course title & textbook(s)"],
-                                   credits=credits,
-                                   meetings=[meeting] if meeting else [],
-                                   gen_ed_credit=d["ge"], gordon_rule=d["wm"],
-                                   instructors=[i.strip() for i in
-                                                d["instructor(s)"].split("\n")])
-                base_course_list.append(c)
-            else:
-                meeting = build_meeting(d)
-                if meeting:
-                    base_course_list[-1].meetings.append(meeting)
-        
-        self.__course_list = courses.CourseList(base_course_list)
-        
-        # Using the course list, find the prefixes for this department
-        self.__prefixes = []
-        for c in self.__course_list:
-            if c.course_code.prefix not in self.__prefixes:
-                self.__prefixes.append(c.course_code.prefix)
-        self.__prefixes = tuple(self.__prefixes)
-        
+        self.__finish_load(self.browser.load_page(
+            self._url, parser=_parse_department_page
+        ))
+    
+    def load_later(self, executor):
+        """Like :meth:`force_load`, but the page is parsed on a
+        :class:`concurrent.futures.Executor` (see
+        :meth:`lib.browser.Browser.load_page`). The page itself is loaded
+        before this returns, and a :class:`concurrent.futures.Future` is given
+        back, which resolves to this department once it's done loading."""
+        return _then(self.browser.load_page(self._url,
+                                            parser=_parse_department_page,
+                                            executor=executor),
+                     self.__finish_load)
+    
+    def __finish_load(self, result):
+        self.__course_list, self.__prefixes = result
         self.__loaded = True
+        return self
     
     def rate_similarity(self, department_name, fast=False):
         """Returns a score from 0 to 1, rating how similar a department name is
@@ -0,0 +1,70 @@
+"""A place for task modules to declare the CSS selectors and XPath expressions
+they use, once, by name. Calling ``element.cssselect("...")`` or
+``element.xpath("...")`` with a string translates and compiles that string
+every time, which adds up when it happens for every row of a large table. The
+selectors in a :class:`SelectorRegistry` are compiled the first time they're
+used, and then reused from then on::
+
+    _selectors = SelectorRegistry()
+    _selectors.css("rows", "tr")
+    _selectors.xpath("cells", "./td")
+
+    for row in _selectors.rows(table):
+        cells = _selectors.cells(row)
+
+..
+"""
+
+class SelectorRegistry(object):
+    """A named collection of lazily compiled :class:`lxml.cssselect.CSSSelector`
+    and :class:`lxml.etree.XPath` objects. Each one can be gotten as an
+    attribute (or with ``[]``), and called with an element to get the list of
+    matches, just like a ``cssselect`` or ``xpath`` call on that element."""
+
+    def __init__(self):
+        self._expressions = {} # name -> (kind, expression)
+        self._compiled = {}
+
+    def css(self, name, expression):
+        """Declares a CSS selector. Like :meth:`lxml.html.HtmlElement.
+        cssselect`, it's translated with html semantics."""
+        self._declare(name, "css", expression)
+
+    def xpath(self, name, expression):
+        """Declares an XPath expression."""
+        self._declare(name, "xpath", expression)
+
+    def _declare(self, name, kind, expression):
+        if name in self._expressions:
+            raise ValueError("A selector named %s is already declared." % name)
+        self._expressions[name] = (kind, expression)
+
+    def __getitem__(self, name):
+        try:
+            return self._compiled[name]
+        except KeyError:
+            pass
+        kind, expression = self._expressions[name]
+        if kind == "css":
+            from lxml.cssselect import CSSSelector
+            compiled = CSSSelector(expression, translator="html")
+        else:
+            from lxml.etree import XPath
+            compiled = XPath(expression)
+        self._compiled[name] = compiled
+        return compiled
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, name):
+        return name in self._expressions
+
+    def names(self):
+        """Returns a sorted list of the names of every declared selector."""
+        return sorted(self._expressions)
@@ -0,0 +1,116 @@
+"""Helpers shared by the unit tests. Unlike the ``test_*.py`` scripts at the
+top of the repository, which talk to UF's real servers, the unit tests only
+ever talk to a :class:`Server` of their own, on localhost."""
+
+import socket
+import threading
+
+def _default_respond(method, path, headers, body):
+    return 200, [("Content-Type", "text/html")], \
+           ("body of %s" % path).encode()
+
+class Server(object):
+    """A tiny keep-alive HTTP/1.1 server, running in background threads. It
+    answers requests in the order they arrive on each connection, so it copes
+    with pipelining.
+    
+    *Keyword arguments:*
+    
+    ``respond``
+        Called with ``(method, path, headers, body)`` for each request (where
+        ``headers`` is a dict with lowercase names), and gives back
+        ``(status, headers, body)``, with ``headers`` a list of ``(name,
+        value)`` tuples. *By default:* a page saying which path was asked for.
+    ``close_after``
+        If given, each connection is closed (without warning) after it's
+        answered this many requests.
+    """
+    
+    def __init__(self, respond=_default_respond, close_after=None):
+        self.respond = respond
+        self.close_after = close_after
+        self.requests = [] # (method, path), in the order they were answered
+        self._connections = []
+        self._lock = threading.Lock()
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(64)
+        self.port = self._sock.getsockname()[1]
+        self.host = "127.0.0.1:%d" % self.port
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+    
+    def url(self, path="/"):
+        return "http://%s%s" % (self.host, path)
+    
+    def paths(self, method="GET"):
+        """Gives a list of the paths asked for with ``method``."""
+        with self._lock:
+            return [path for m, path in self.requests if m == method]
+    
+    def drop_connections(self):
+        """Closes every connection that's open, like a server dropping idle
+        keep-alive connections would."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+    
+    def close(self):
+        self._sock.close()
+        self.drop_connections()
+    
+    def _accept(self):
+        while True:
+            try:
+                conn = self._sock.accept()[0]
+            except OSError:
+                return # closed
+            with self._lock:
+                self._connections.append(conn)
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+    
+    def _serve(self, conn):
+        try:
+            f = conn.makefile("rb")
+            answered = 0
+            while self.close_after is None or answered < self.close_after:
+                line = f.readline()
+                if not line.strip():
+                    break
+                method, path = line.decode("latin-1").split()[:2]
+                headers = {}
+                while True:
+                    line = f.readline().decode("latin-1")
+                    if not line.strip():
+                        break
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = f.read(int(headers.get("content-length", 0)))
+                status, response_headers, response_body = \
+                    self.respond(method, path, headers, body)
+                with self._lock:
+                    self.requests.append((method, path))
+                head = ["HTTP/1.1 %d Whatever" % status,
+                        "Content-Length: %d" % len(response_body)]
+                head.extend("%s: %s" % header for header in response_headers)
+                conn.sendall(("\r\n".join(head) + "\r\n\r\n").encode("latin-1")
+                             + response_body)
+                answered += 1
+            # stop answering, but let the client finish sending, so closing
+            # doesn't reset the connection under responses it hasn't read yet
+            conn.shutdown(socket.SHUT_WR)
+            conn.settimeout(1)
+            while conn.recv(65536):
+                pass
+        except OSError:
+            pass
+        finally:
+            conn.close()
@@ -0,0 +1,124 @@
+import email.message
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import urllib.request
+from http.cookiejar import CookieJar, Cookie
+
+from lib.browser.plugins.cookies import IndexedCookieJar, SQLiteCookieJar, \
+                                        find_cookie
+
+def _cookie(domain, path, name, expires=None, value="v"):
+    return Cookie(0, name, value, None, False, domain, True,
+                  domain.startswith("."), path, True, False, expires,
+                  expires is None, None, None, {})
+
+class _Response(object):
+    def __init__(self, *set_cookies):
+        self.headers = email.message.Message()
+        for set_cookie in set_cookies:
+            self.headers["Set-Cookie"] = set_cookie
+    
+    def info(self):
+        return self.headers
+
+_domains = ["www.isis.ufl.edu", ".isis.ufl.edu", "isis.ufl.edu", ".ufl.edu",
+            "ufl.edu", "login.ufl.edu", "localhost", ".local", "sufl.edu",
+            "example.com"]
+_urls = ["http://www.isis.ufl.edu/cgi-bin/nirvana", "http://isis.ufl.edu/",
+         "http://login.ufl.edu/idp/x", "http://ufl.edu/", "http://localhost/",
+         "http://sufl.edu/", "http://a.example.com/", "http://example.com/x"]
+
+class IndexedCookieJarTest(unittest.TestCase):
+    def _fill(self, *jars):
+        i = 0
+        for domain in _domains:
+            for path in ("/", "/idp", "/cgi-bin"):
+                for expires in (None, time.time() + 600):
+                    cookie = _cookie(domain, path, "c%d" % i, expires)
+                    for jar in jars:
+                        jar.set_cookie(cookie)
+                    i += 1
+    
+    def _header(self, jar, url):
+        request = urllib.request.Request(url)
+        jar.add_cookie_header(request)
+        return sorted((request.get_header("Cookie") or "").split("; "))
+    
+    def test_same_cookies_as_cookiejar(self):
+        plain, indexed = CookieJar(), IndexedCookieJar()
+        self._fill(plain, indexed)
+        for url in _urls:
+            self.assertEqual(self._header(indexed, url),
+                             self._header(plain, url), url)
+        self.assertEqual(len(indexed), len(plain))
+    
+    def test_expired_cookies_swept(self):
+        soon = int(time.time()) + 1 # cookies only keep whole seconds
+        jar = IndexedCookieJar()
+        jar.set_cookie(_cookie("ufl.edu", "/", "short", soon))
+        jar.set_cookie(_cookie("ufl.edu", "/", "long", soon + 600))
+        jar.clear_expired_cookies()
+        self.assertEqual(len(jar), 2)
+        time.sleep(soon - time.time() + .05)
+        jar.clear_expired_cookies()
+        self.assertEqual([cookie.name for cookie in jar], ["long"])
+    
+    def test_find_cookie(self):
+        for jar in (CookieJar(), IndexedCookieJar()):
+            jar.set_cookie(_cookie(".ufl.edu", "/", "n", value="parent"))
+            self.assertEqual(find_cookie(jar, "login.ufl.edu", "/", "n").value,
+                             "parent")
+            jar.set_cookie(_cookie("login.ufl.edu", "/", "n", value="host"))
+            self.assertEqual(find_cookie(jar, "login.ufl.edu", "/", "n").value,
+                             "host")
+            self.assertIsNone(find_cookie(jar, "login.ufl.edu", "/x", "n"))
+            self.assertIsNone(find_cookie(jar, "isis.ufl.edu", "/", "m"))
+            jar.set_cookie(_cookie("isis.ufl.edu", "/", "m", time.time() - 1))
+            self.assertIsNone(find_cookie(jar, "isis.ufl.edu", "/", "m"))
+
+class SQLiteCookieJarTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "cookies.sqlite")
+    
+    def _jar(self):
+        jar = SQLiteCookieJar(self.path)
+        self.addCleanup(jar.close)
+        return jar
+    
+    def test_shared(self):
+        first, second = self._jar(), self._jar()
+        first.set_cookie(_cookie(".ufl.edu", "/", "a", time.time() + 600))
+        self.assertEqual([cookie.name for cookie in second], ["a"])
+        second.clear(".ufl.edu", "/", "a")
+        self.assertEqual(len(first), 0)
+    
+    def test_extract_cookies(self):
+        first, second = self._jar(), self._jar()
+        request = urllib.request.Request("http://www.isis.ufl.edu/")
+        first.extract_cookies(_Response("a=1; Path=/", "b=2; Path=/"),
+                              request)
+        self.assertEqual(sorted(cookie.name for cookie in second), ["a", "b"])
+    
+    def test_extract_no_cookies(self):
+        jar = self._jar()
+        request = urllib.request.Request("http://www.isis.ufl.edu/")
+        jar.extract_cookies(_Response(), request)
+        self.assertIsNone(jar._db) # never even opened the database
+    
+    def test_next_expiry_loaded(self):
+        soon = int(time.time()) + 60
+        first = self._jar()
+        first.set_cookie(_cookie(".ufl.edu", "/", "a", soon + 60))
+        first.set_cookie(_cookie(".ufl.edu", "/", "b", soon))
+        first.set_cookie(_cookie(".ufl.edu", "/", "c"))
+        second = self._jar()
+        self.assertEqual(len(second), 3)
+        self.assertEqual(second._next_expiry, soon)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+from lib.tasks import isis
+
+# the kind of markup ISIS gives: unclosed rows and cells, links, entities,
+# comments and colspans
+_tables = [
+    "<tr><th>Section</th><th>Type</th><th>Course</th><th>Credits</th></tr>"
+    "<tr><td>0234<td>X<td><a href='x'>NOM2222</a><td>4</tr>"
+    "<tr><td colspan=3>&nbsp;</td><td>3</td>",
+    "\n<tr/>\n<td>A</td><td>B &amp; C</td>\n<tr>\n<td colspan='2'> both </td>"
+    "\n<tr>\n<td>x<br>y</td><td><!-- c -->z</td></tr>\n\n",
+    "<TR><TH>A<TH>B<TR><TD COLSPAN=\"5\">wide</TD><TR><td>1</td><td></td>",
+    "<tr><th>A</th><th>B</th></tr>"
+    "<tr><td><b>x</b> <i>y</i></td><td><!-- <x> -->q</td></tr>",
+    "<tr><th>A</th><th>B</th><tr><td></td><td>&lt;b&gt;</td>",
+    "<tr><th>a</th></tr>",
+    "",
+]
+
+class TableToIterTest(unittest.TestCase):
+    def test_same_as_lxml(self):
+        for table in _tables:
+            self.assertEqual(
+                list(isis.table_to_iter(table)),
+                list(isis._table_to_iter_lxml(table, isis._process_header,
+                                              isis._process_cell)),
+                table
+            )
+    
+    def test_schedule(self):
+        self.assertEqual(list(isis.table_to_iter(_tables[0])), [
+            {"section": "0234", "type": "X", "course": "NOM2222",
+             "credits": "4"},
+            {"section": None, "type": None, "course": None, "credits": "3"},
+        ])
+    
+    def test_extra_cells_ignored(self):
+        table = "<tr><th>a</th><th>b</th><tr><td>1</td><td>2</td><td>3</td>"
+        self.assertEqual(list(isis.table_to_iter(table)),
+                         [{"a": "1", "b": "2"}])
+    
+    def test_custom_processors(self):
+        process_cell = lambda tag: tag.text_content().upper()
+        self.assertEqual(
+            list(isis.table_to_iter("<tr><th>a<tr><td>x", process_cell=
+                                    process_cell)),
+            [{"a": "X"}]
+        )
+
+class IterTableRowsTest(unittest.TestCase):
+    def test_rows(self):
+        self.assertEqual(list(isis.iter_table_rows(_tables[1])), [
+            [("A", 1), ("B & C", 1)],
+            [("both", 2)],
+            [("xy", 1), ("z", 1)],
+        ])
+    
+    def test_row_attributes(self):
+        table = "<tr><th>A</th></tr><tr class='odd'><td>1<tr class=e><td>2"
+        self.assertEqual(list(isis.iter_table_rows(table)),
+                         [[("A", 1)], [("1", 1)], [("2", 1)]])
+    
+    def test_extra_cells_kept(self):
+        table = "<tr><th>a</th><tr><td>1</td><td>2</td>"
+        self.assertEqual(list(isis.iter_table_rows(table)),
+                         [[("a", 1)], [("1", 1), ("2", 1)]])
+
+if __name__ == "__main__":
+    unittest.main()
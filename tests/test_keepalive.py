@@ -0,0 +1,202 @@
+import socket
+import threading
+import time
+import unittest
+import urllib.request
+
+from lib.browser.plugins.keepalive import handler, multiplex
+from tests.support import Server
+
+_lines = b"".join(b"line %d %s\n" % (i, b"x" * (i * 7 % 50))
+                  for i in range(200))
+
+class _SlowConnection(object):
+    """Stands in for an http.client connection that takes a while to
+    connect."""
+    
+    def __init__(self, delay):
+        self.delay = delay
+        self.closed = threading.Event()
+    
+    def connect(self):
+        time.sleep(self.delay)
+    
+    def close(self):
+        self.closed.set()
+
+class KeepAliveHandlerTest(unittest.TestCase):
+    def setUp(self):
+        def respond(method, path, headers, body):
+            if path == "/lines":
+                return 200, [], _lines
+            return 200, [], ("body of %s" % path).encode()
+        self.server = Server(respond)
+        self.handler = handler.HTTPHandler()
+        self.opener = urllib.request.build_opener(self.handler)
+    
+    def tearDown(self):
+        self.handler.close_all()
+        self.server.close()
+    
+    def _pipeline(self, paths):
+        responses = self.handler.pipeline(
+            urllib.request.Request(self.server.url(path)) for path in paths
+        )
+        return [response.read() for response in responses]
+    
+    def test_connection_reused(self):
+        with self.assertLogs("browser.plugins.keepalive.handler",
+                             "DEBUG") as logs:
+            for i in range(3):
+                self.assertEqual(self.opener.open(self.server.url("/%d" % i))
+                                 .read(), b"body of /%d" % i)
+        stats = self.handler.stats()[self.server.host]
+        self.assertEqual((stats.opened, stats.reused, stats.requests),
+                         (1, 2, 3))
+        self.assertEqual(sum("re-using connection" in line
+                             for line in logs.output), 2)
+    
+    def test_read1_gives_bytes(self):
+        response = self.opener.open(self.server.url("/read1"))
+        chunk = response.read1(4)
+        self.assertIs(type(chunk), bytes)
+        self.assertEqual(chunk + response.read(), b"body of /read1")
+    
+    def test_mixed_reads(self):
+        for size in (1, 7, 64, 8096):
+            response = self.opener.open(self.server.url("/lines"))
+            response._rbufsize = size # so the buffer fills and wraps a lot
+            parts = [response.readline(), response.read1(5),
+                     response.readline(30), response.read(100)]
+            parts.extend(iter(response.readline, b""))
+            self.assertEqual(b"".join(parts), _lines, size)
+            # and the connection is still good for the next request
+            self.assertEqual(self.opener.open(self.server.url("/next")).read(),
+                             b"body of /next")
+    
+    def test_prewarm(self):
+        self.assertEqual(self.handler.prewarm([self.server.host]),
+                         [self.server.host])
+        self.opener.open(self.server.url("/")).read()
+        stats = self.handler.stats()[self.server.host]
+        self.assertEqual((stats.opened, stats.reused), (1, 1))
+    
+    def test_prewarm_timeout(self):
+        connection = _SlowConnection(.3)
+        self.handler._new_connection = lambda host: connection
+        self.assertEqual(self.handler.prewarm(["slow"], timeout=.05), [])
+        # once it does connect, it's closed rather than pooled
+        self.assertTrue(connection.closed.wait(5))
+        self.assertEqual(self.handler.open_connections(), [])
+    
+    def test_pipeline(self):
+        paths = ["/p%d" % i for i in range(20)]
+        self.assertEqual(self._pipeline(paths),
+                         [b"body of " + path.encode() for path in paths])
+        self.assertEqual(self.handler.stats()[self.server.host].opened, 1)
+    
+    def test_pipeline_retries_stale_connection(self):
+        self.opener.open(self.server.url("/warm")).read()
+        self.server.drop_connections() # while it sits in the pool
+        time.sleep(.1)
+        paths = ["/p%d" % i for i in range(5)]
+        self.assertEqual(self._pipeline(paths),
+                         [b"body of " + path.encode() for path in paths])
+        # a closed idle connection doesn't mean the server can't pipeline
+        self.assertNotIn(self.server.host, self.handler._no_pipelining)
+        self.assertEqual(self.handler.stats()[self.server.host].failed_reuse,
+                         1)
+    
+    def test_pipeline_keeps_partial_responses(self):
+        self.server.close_after = 2
+        paths = ["/p%d" % i for i in range(5)]
+        self.assertEqual(self._pipeline(paths),
+                         [b"body of " + path.encode() for path in paths])
+        # the two that made it the first time weren't asked for again
+        self.assertEqual(sorted(self.server.paths()), paths)
+    
+    def test_pipeline_alongside_do_open(self):
+        errors = []
+        def run(i):
+            try:
+                for j in range(10):
+                    if (i + j) % 2:
+                        paths = ["/t%d/%d/%d" % (i, j, k) for k in range(3)]
+                        assert self._pipeline(paths) == \
+                            [b"body of " + path.encode() for path in paths]
+                    else:
+                        path = "/t%d/%d" % (i, j)
+                        assert self.opener.open(self.server.url(path)) \
+                                   .read() == b"body of " + path.encode()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(errors, [])
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertFalse(self.handler._busy) # nothing left checked out
+
+class _Resolver(object):
+    """Resolves every host to a list of made up ``(family, address)``
+    pairs."""
+    
+    def __init__(self, addresses):
+        self.addresses = addresses
+    
+    def resolve(self, host, port):
+        return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", address)
+                for family, address in self.addresses]
+    
+    def create_connection(self, address, *args, **kwargs):
+        return socket.create_connection(address, *args, **kwargs)
+
+class MultiplexHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.live = (socket.AF_INET, ("127.0.0.1", self.server.port))
+        # a port with nothing listening on it
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.dead = (socket.AF_INET, sock.getsockname())
+        sock.close()
+    
+    def tearDown(self):
+        self.server.close()
+    
+    def _fetch(self, addresses, paths):
+        handler_ = multiplex.MultiplexHandler(resolver=_Resolver(addresses))
+        urllib.request.build_opener(handler_, handler.HTTPHandler())
+        try:
+            return [response.read() for response in handler_.fetch(
+                urllib.request.Request(self.server.url(path))
+                for path in paths
+            )]
+        finally:
+            handler_.close_all()
+    
+    def test_fetch(self):
+        paths = ["/m%d" % i for i in range(10)]
+        self.assertEqual(self._fetch([self.live], paths),
+                         [b"body of " + path.encode() for path in paths])
+    
+    def test_refused_address_skipped(self):
+        self.assertEqual(self._fetch([self.dead, self.live], ["/a", "/b"]),
+                         [b"body of /a", b"body of /b"])
+        self.assertEqual(len(self.server.paths()), 2)
+    
+    def test_unusable_address_skipped(self):
+        # a TCP socket can't be made for a Unix domain address
+        unusable = (socket.AF_UNIX, ("127.0.0.1", self.server.port))
+        self.assertEqual(self._fetch([unusable, self.live], ["/a"]),
+                         [b"body of /a"])
+    
+    def test_every_address_refused(self):
+        # falls back to the opener, which connects for itself
+        self.assertEqual(self._fetch([self.dead] * 2, ["/a", "/b"]),
+                         [b"body of /a", b"body of /b"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+
+from lib.browser import Browser
+from lib.browser.plugins.uf import login
+from tests.support import Server
+
+_login_page = b"""<html><head><title>UF GatorLink login</title></head><body>
+Enter your GatorLink username and password</body></html>"""
+
+class _StubLoginPlugin(login.LoginBrowserPlugin):
+    """Logs in by flipping a flag on the server, rather than posting a form to
+    login.ufl.edu."""
+    
+    def __init__(self, server, fail=False):
+        login.LoginBrowserPlugin.__init__(self, hosts=None)
+        self.server = server
+        self.fail = fail
+        self.logins = 0
+    
+    def _log_in(self, browser, url, *args, **kwargs):
+        self.logins += 1
+        time.sleep(.2) # long enough for everyone else to pile up behind us
+        if self.fail:
+            raise login.LoginError()
+        self.server.logged_in = True
+        return None
+
+class SingleFlightLoginTest(unittest.TestCase):
+    threads = 8
+    
+    def setUp(self):
+        # the first round of requests all get the login page together
+        barrier = threading.Barrier(self.threads)
+        def respond(method, path, headers, body):
+            if self.server.logged_in:
+                return 200, [("Content-Type", "text/html")], \
+                       ("content of %s" % path).encode()
+            barrier.wait(5)
+            return 200, [("Content-Type", "text/html")], _login_page
+        self.server = Server(respond)
+        self.server.logged_in = False
+    
+    def tearDown(self):
+        self.server.close()
+    
+    def _load_all(self, plugin):
+        browser = Browser(plugin)
+        browser.uf_set_autologin("someone", "secret")
+        results = [None] * self.threads
+        def load(i):
+            try:
+                results[i] = browser.load_page(self.server.url("/page%d" % i),
+                                               record_history=False)
+            except Exception as e:
+                results[i] = e
+        threads = [threading.Thread(target=load, args=(i,))
+                   for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_one_login_for_many_threads(self):
+        plugin = _StubLoginPlugin(self.server)
+        results = self._load_all(plugin)
+        self.assertEqual(plugin.logins, 1)
+        self.assertEqual(results, ["content of /page%d" % i
+                                   for i in range(self.threads)])
+        # every thread retried its own request once, after the login
+        for i in range(self.threads):
+            self.assertEqual(self.server.paths().count("/page%d" % i), 2)
+    
+    def test_failed_login_raised_in_every_thread(self):
+        plugin = _StubLoginPlugin(self.server, fail=True)
+        results = self._load_all(plugin)
+        self.assertEqual(plugin.logins, 1)
+        for result in results:
+            self.assertIsInstance(result, login.LoginError)
+        self.assertTrue(plugin._auto_login)
+
+class ForceLoginUrlTest(unittest.TestCase):
+    def test_force_login_url(self):
+        self.assertEqual(
+            login._force_login_url("https://www.isis.ufl.edu/cgi-bin/nirvana"),
+            "https://www.isis.ufl.edu/Shibboleth.sso/Login?forceAuthn=true&"
+            "target=https%3A%2F%2Fwww.isis.ufl.edu%2Fcgi-bin%2Fnirvana"
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import codecs
+import email.message
+import unittest
+
+from lib.browser import parsers
+
+class PassthroughStrTest(unittest.TestCase):
+    def setUp(self):
+        parsers._host_charsets.clear()
+        self.addCleanup(parsers._host_charsets.clear)
+        self.headers = email.message.Message() # no charset
+    
+    def _parse(self, source, url="http://example.com/"):
+        return parsers.passthrough_str(source, self.headers, url)
+    
+    def test_header_charset(self):
+        self.headers["Content-Type"] = "text/html; charset=iso-8859-1"
+        self.assertEqual(self._parse("caf\xe9".encode("latin-1")), "caf\xe9")
+    
+    def test_meta_charset_remembered(self):
+        page = '<meta charset="iso-8859-1">caf\xe9'.encode("latin-1")
+        self.assertTrue(self._parse(page).endswith("caf\xe9"))
+        self.assertEqual(self._parse("caf\xe9".encode("latin-1"),
+                                     "http://example.com/other"), "caf\xe9")
+    
+    def test_bom_charset_not_remembered(self):
+        page = codecs.BOM_UTF16_LE + "caf\xe9".encode("utf-16-le")
+        self.assertEqual(self._parse(page), "caf\xe9")
+        self.assertEqual(parsers._host_charsets, {})
+        # so the next page from the host isn't read as UTF-16
+        self.assertEqual(self._parse("caf\xe9".encode("utf-8"),
+                                     "http://example.com/other"), "caf\xe9")
+
+class LxmlHtmlSubtreeTest(unittest.TestCase):
+    page = b"""<html><body><div id="menu"><p>menu</p></div>
+    <div id="ldap" class="box wide"><dl><dt>Name</dt><dd>Someone</dd></dl>
+    </div><p>the rest</p></body></html>"""
+    
+    def test_subtree(self):
+        for parser in (parsers.lxml_html_subtree("ldap"),
+                       parsers.lxml_html_subtree(tag="div", class_name="wide"),
+                       parsers.lxml_html_subtree("ldap", tag="div",
+                                                 chunk_size=8)):
+            div = parser(self.page, None, "http://example.com/")
+            self.assertEqual(div.get("id"), "ldap")
+            self.assertEqual(div.xpath("./dl/dd/text()"), ["Someone"])
+            self.assertIsNone(div.getparent())
+    
+    def test_missing_element(self):
+        parser = parsers.lxml_html_subtree("ldap", tag="span")
+        with self.assertRaises(ValueError) as raised:
+            parser(self.page, None, "http://example.com/")
+        message = str(raised.exception)
+        self.assertIn("'ldap'", message)
+        self.assertIn("'span'", message)
+        self.assertIn("http://example.com/", message)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import unittest.mock
+
+from lib.browser import Browser, plugins
+from lib.browser.plugins.decorators import override
+
+class _MarkingPlugin(plugins.BaseBrowserPlugin):
+    """Marks the urls :meth:`lib.browser.Browser.expand_relative_url` gives
+    back, for the hosts it applies to."""
+    
+    def __init__(self, hosts):
+        plugins.BaseBrowserPlugin.__init__(self)
+        self.hosts = hosts
+    
+    @override
+    def expand_relative_url(plugin, browser, base_function, url, *args,
+                            **kwargs):
+        return "marked " + base_function(url, *args, **kwargs)
+
+def _expand(browser, url):
+    return browser.expand_relative_url(url, "http://example.com/")
+
+class HostDispatchTest(unittest.TestCase):
+    def test_prefix_case(self):
+        browser = Browser(_MarkingPlugin(["HTTPS://Login.UFL.edu/idp/"]))
+        for url in ["https://login.ufl.edu/idp/x",
+                    "HTTPS://LOGIN.ufl.edu/idp/x",
+                    "https://someone@Login.ufl.edu/idp/x"]:
+            self.assertEqual(_expand(browser, url), "marked " + url)
+        # but the path is still case-sensitive
+        for url in ["https://login.ufl.edu/IDP/x", "https://login.ufl.edu/x"]:
+            self.assertEqual(_expand(browser, url), url)
+    
+    def test_hosts(self):
+        browser = Browser(_MarkingPlugin([".ufl.edu"]))
+        self.assertEqual(_expand(browser, "http://WWW.UFL.EDU/"),
+                         "marked http://WWW.UFL.EDU/")
+        self.assertEqual(_expand(browser, "http://example.com/"),
+                         "http://example.com/")
+    
+    def test_chains_bounded(self):
+        browser = Browser(_MarkingPlugin([".ufl.edu"]))
+        build_chain = browser._Pluggable__build_chain
+        built = []
+        def counting_build_chain(base_function, overriding_functions, host):
+            built.append(host)
+            return build_chain(base_function, overriding_functions, host)
+        browser._Pluggable__build_chain = counting_build_chain
+        with unittest.mock.patch.object(plugins, "_max_dispatch_hosts", 2):
+            for host in ["a.ufl.edu", "b.com", "a.ufl.edu", "c.com",
+                         "b.com", "c.com"]:
+                url = "http://%s/" % host
+                self.assertEqual(_expand(browser, url).startswith(
+                    "marked"
+                ), host.endswith(".ufl.edu"))
+        # b.com was the least recently used when c.com came along
+        self.assertEqual(built, ["a.ufl.edu", "b.com", "c.com", "b.com"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import threading
+import unittest
+
+from lib.browser import Browser
+from lib.browser.plugins.redirect import RedirectChainCache, SignatureDetector
+from tests.support import Server
+
+class SignatureDetectorTest(unittest.TestCase):
+    def _scan(self, signatures, source, **kwargs):
+        detector = SignatureDetector(**kwargs)
+        for signature in signatures:
+            detector.register(signature)
+        return detector.scan(source)
+    
+    def test_scan(self):
+        signatures = [br"<title>[^<]*GatorLink login", br"<form[^>]*shib"]
+        self.assertEqual(
+            self._scan(signatures, b"<html><TITLE>UF GatorLink Login</title>"),
+            {signatures[0]}
+        )
+        self.assertEqual(self._scan(signatures, b"<html></html>"), set())
+    
+    def test_same_start(self):
+        # one signature is the start of the other, so both match at once
+        signatures = [br"<title>log", br"<title>login page"]
+        self.assertEqual(self._scan(signatures, b"<title>Login Page</title>"),
+                         set(signatures))
+        self.assertEqual(self._scan(signatures, b"<title>Login</title>"),
+                         {signatures[0]})
+    
+    def test_overlapping(self):
+        signatures = [br"<a href=[^>]*>x", br"href=\S*>", br"<a"]
+        self.assertEqual(self._scan(signatures, b"<p><a href=y>x</a>"),
+                         set(signatures))
+    
+    def test_scan_length(self):
+        signatures = [b"<early", b"<late"]
+        source = b"<early>" + b" " * 100 + b"<late>"
+        self.assertEqual(self._scan(signatures, source, scan_length=50),
+                         {b"<early"})
+
+class RedirectChainCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.redirects = {"/start": "/middle", "/middle": "/end"}
+        def respond(method, path, headers, body):
+            if path in self.redirects:
+                return 302, [("Location", self.redirects[path])], b""
+            return 200, [("Content-Type", "text/html")], \
+                   ("body of %s" % path).encode()
+        self.server = Server(respond)
+        self.browser = Browser(RedirectChainCache())
+    
+    def tearDown(self):
+        self.server.close()
+    
+    def _load(self, path):
+        return self.browser.load_page(self.server.url(path),
+                                      record_history=False)
+    
+    def test_shortcut(self):
+        self.assertEqual(self._load("/start"), "body of /end")
+        self.assertEqual(self._load("/start"), "body of /end")
+        self.assertEqual(self.server.paths(),
+                         ["/start", "/middle", "/end", "/end"])
+        self.assertEqual(self.browser.redirect_chains(),
+                         {self.server.url("/start"):
+                          (self.server.url("/end"), 1)})
+    
+    def test_failed_shortcut_forgotten(self):
+        self._load("/start")
+        self.redirects["/end"] = "/elsewhere"
+        self.assertEqual(self._load("/start"), "body of /elsewhere")
+        self.assertEqual(self.browser.redirect_chains(), {})
+    
+    def test_skip_redirect_chain(self):
+        self._load("/start")
+        self.browser.skip_redirect_chain(self.server.url("/start"))
+        self.assertEqual(self.browser.redirect_chains(), {})
+        self._load("/start")
+        self._load("/start")
+        self.assertEqual(self.server.paths().count("/start"), 3)
+        self.browser.forget_redirect_chains()
+        self._load("/start")
+        self.assertEqual(self.server.paths().count("/start"), 4)
+    
+    def test_threads(self):
+        # enough urls that the oldest chains keep being pushed out, while
+        # another thread keeps reading and forgetting them
+        self.browser = Browser(RedirectChainCache(max_chains=8))
+        for i in range(32):
+            self.redirects["/r%d" % i] = "/end"
+        done = threading.Event()
+        errors = []
+        def load(paths):
+            try:
+                for path in paths:
+                    self.assertEqual(self._load(path), "body of /end")
+            except Exception as e:
+                errors.append(e)
+        def watch():
+            try:
+                while not done.is_set():
+                    self.assertLessEqual(len(self.browser.redirect_chains()),
+                                         8)
+                    self.browser.forget_redirect_chains()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=load, args=(
+                       ["/r%d" % ((i + j) % 32) for j in range(32)] * 2,
+                   )) for i in range(8)]
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        watcher.join()
+        self.assertEqual(errors, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import concurrent.futures
+import email.message
+import unittest
+
+from lib.tasks import courses
+from lib.tasks.isis import schedule_reader
+
+_page = b"""<html><body>
+<table id="phead"><tr><td>Name:</td><td>Someone</td></tr>
+<tr><td>College:</td><td>Engineering</td></tr></table>
+<div id="reg_sched"><table>
+<tr><th>Section</th><th>Type</th><th>Course</th><th>Credits</th><th>Days</th>
+<th>Periods</th><th>Bldg</th><th>Room</th></tr>
+<tr><td>0234<td>X<td>NOM2222<td>4<td>M W F<td>2<td>KITE<td>C101</tr>
+<tr><td><td><td><td><td>W<td>3<td>BUG<td>007</tr>
+<tr><td>9999<td>X<td>ABC9876<td>3<td>TBA<td>TBA<td>JACK<td>TBA</tr>
+<tr><td colspan=3>Total<td>7<td colspan=4></tr>
+</table></div>
+</body></html>"""
+
+class _StubBrowser(object):
+    """Gives back :data:`_page` for any ISIS page, and counts how many times
+    it was asked for one."""
+    
+    url = "https://www.isis.ufl.edu/cgi-bin/nirvana"
+    
+    def __init__(self):
+        self.loads = 0
+        self.headers = email.message.Message()
+        self.headers["Content-Type"] = "text/html; charset=utf-8"
+    
+    def load_isis_page(self, page_code, parser):
+        self.loads += 1
+        return parser(_page, self.headers, self.url)
+    
+    def _parse_page_later(self, executor, parser, source, headers, url):
+        return executor.submit(parser, source, headers, url)
+
+class ScheduleReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.browser = _StubBrowser()
+        self.reader = schedule_reader.ScheduleReader(courses.Semesters.SPRING,
+                                                     browser=self.browser)
+    
+    def _check(self, reader):
+        self.assertIs(reader, self.reader)
+        self.assertEqual(reader.user_info, [("name", "someone"),
+                                            ("college", "engineering")])
+        self.assertEqual([(course.section_number, course.credits,
+                           len(course.meetings))
+                          for course in reader.course_list],
+                         [("0234", 4, 2), ("9999", 3, 1)])
+        self.assertEqual(reader._page_byte_source,
+                         (_page, self.browser.headers, self.browser.url))
+        self.assertEqual(self.browser.loads, 1)
+    
+    def test_parse_gives_only_what_was_parsed(self):
+        user_info, course_list = schedule_reader._parse_schedule_page(
+            _page, self.browser.headers, self.browser.url
+        )
+        self.assertEqual(dict(user_info)["college"], "engineering")
+        self.assertEqual(len(course_list), 2)
+    
+    def test_force_load(self):
+        self.reader.force_load()
+        self._check(self.reader)
+    
+    def test_load_later_in_threads(self):
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            self._check(self.reader.load_later(executor).result(5))
+    
+    def test_load_later_in_processes(self):
+        with concurrent.futures.ProcessPoolExecutor(1) as executor:
+            self._check(self.reader.load_later(executor).result(30))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.cookiejar import Cookie
+
+from lib.browser import get_new_uf_browser
+from lib.browser.plugins.cookies import _cookie_to_row
+from lib.browser.sessions import SessionManager
+
+def _session_cookie():
+    # a GatorLink session cookie, without an expiry of its own
+    return Cookie(0, "JSESSIONID", "x", None, False, "login.ufl.edu", True,
+                  False, "/idp", True, True, None, True, None, None, {})
+
+class SessionManagerTest(unittest.TestCase):
+    # the session is taken to run out this long after it starts, and is
+    # refreshed shortly before
+    lifetime = 3600
+    margin = lifetime - .3
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.refreshed = [] # browsers, in the order they refreshed
+        self.refresh_done = threading.Event()
+        self.manager = SessionManager(self.directory, max_live=1,
+                                      browser_factory=self._new_browser)
+        self.manager.add_account("a", "secret")
+        self.manager.add_account("b", "secret")
+    
+    def tearDown(self):
+        for username in self.manager.accounts():
+            self.manager.remove_account(username)
+    
+    def _new_browser(self):
+        browser = get_new_uf_browser()
+        def refresher():
+            browser.uf_set_session_refresh(enabled=False) # just the once
+            self.refreshed.append(browser)
+            self.refresh_done.set()
+        browser.uf_set_session_refresh(margin=self.margin,
+                                       lifetime=self.lifetime,
+                                       refresher=refresher)
+        return browser
+    
+    def test_session_started_revived(self):
+        started = time.time()
+        first = self.manager.get("a")
+        first.cookie_jar.set_cookie(_session_cookie())
+        first.uf_session_started = started
+        self.manager.get("b") # puts a to sleep
+        self.assertEqual(self.manager.live_accounts(), ["b"])
+        revived = self.manager.get("a")
+        self.assertIsNot(revived, first)
+        self.assertEqual(revived.uf_session_started, started)
+        self.assertEqual(revived.uf_session_expires, started + self.lifetime)
+        # and its background refresh is set up again
+        self.assertTrue(self.refresh_done.wait(5))
+        self.assertEqual(self.refreshed, [revived])
+    
+    def test_old_save_format(self):
+        with open(self.manager._path("a"), "w") as f:
+            json.dump([_cookie_to_row(_session_cookie())], f)
+        browser = self.manager.get("a")
+        self.assertEqual(browser.uf_session_cookie.value, "x")
+        self.assertIsNone(browser.uf_session_started)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+import urllib.error
+
+from lib.browser.transport import FastTransport
+from tests.support import Server
+
+class FastTransportTest(unittest.TestCase):
+    def setUp(self):
+        def respond(method, path, headers, body):
+            if path.startswith("/slow"):
+                time.sleep(.01)
+            return 200, [], ("body of %s" % path).encode()
+        self.server = Server(respond)
+        self.transport = FastTransport([], [])
+    
+    def tearDown(self):
+        self.transport.close_all()
+        self.server.close()
+    
+    def _go_stale(self):
+        self.transport.open(self.server.url("/warm")).read()
+        self.server.drop_connections() # while it sits in the pool
+        time.sleep(.1)
+    
+    def test_connection_reused(self):
+        for i in range(3):
+            self.transport.open(self.server.url("/%d" % i)).read()
+        self.assertEqual(len(self.transport._connections), 1)
+    
+    def test_get_retried_on_stale_connection(self):
+        self._go_stale()
+        self.assertEqual(self.transport.open(self.server.url("/get")).read(),
+                         b"body of /get")
+    
+    def test_post_not_resent_on_stale_connection(self):
+        self._go_stale()
+        with self.assertRaises(urllib.error.URLError):
+            self.transport.open(self.server.url("/post"), b"a=1")
+        self.assertEqual(self.server.paths("POST"), [])
+        # the next request gets a new connection
+        self.assertEqual(self.transport.open(self.server.url("/post"), b"a=1")
+                         .read(), b"body of /post")
+    
+    def test_threads(self):
+        errors = []
+        def run(i):
+            try:
+                for j in range(20):
+                    path = "/slow/%d/%d" % (i, j)
+                    body = self.transport.open(self.server.url(path)).read()
+                    assert body == b"body of " + path.encode(), body
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(errors, [])
+        self.assertFalse(self.transport._busy) # nothing left checked out
+        self.assertEqual(len(self.transport._connections), 1)
+
+if __name__ == "__main__":
+    unittest.main()